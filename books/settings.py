@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,7 @@ INTERNAL_IPS = [
 ]
 
 MIDDLEWARE = [
+    'store.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,14 +83,97 @@ WSGI_APPLICATION = 'books.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql_psycopg2',
-        'NAME': 'books_db',
-        'USER': 'books_user',
-        'PASSWORD': '123456',
-        'HOST': 'localhost',
-        'PORT': '',
+        'NAME': os.environ.get('DB_NAME', 'books_db'),
+        'USER': os.environ.get('DB_USER', 'books_user'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', '123456'),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', ''),
+        # Seconds a connection is kept open and reused by later requests of the same thread, 0 closes it
+        # after every request.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        # Server-side cursors (used by the book export) don't survive PgBouncer's transaction pooling.
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_POOL_MODE') == 'transaction',
     }
 }
 
+# Read replicas as comma-separated host[:port] pairs, e.g. DB_REPLICA_HOSTS=replica1,replica2:6432.
+# store.db.ReplicaRouter sends BookViewSet GETs to them; replication lag can leave a cached list or
+# detail response stale until STORE_CACHE_TIMEOUT.
+STORE_DB_REPLICAS = []
+for number, replica in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    host, _, port = replica.partition(':')
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'HOST': host, 'PORT': port,
+                                     'TEST': {'MIRROR': 'default'}}
+    STORE_DB_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['store.db.ReplicaRouter']
+
+# Ping reused connections that sat idle for STORE_DB_PING_IDLE_AFTER seconds or raised an error before
+# using them, and drop dead ones. A replica that can't be reached is skipped for STORE_DB_RETRY_AFTER seconds.
+STORE_DB_HEALTH_CHECKS = os.environ.get('DB_HEALTH_CHECKS', '1') == '1'
+STORE_DB_PING_IDLE_AFTER = 30
+STORE_DB_RETRY_AFTER = 30
+
+# Share of requests whose queries, DB, serialization and render time are measured and sent in a Server-Timing
+# header.
+# Metrics are served in the Prometheus text format at /metrics/ to STORE_METRICS_ALLOWED_IPS.
+STORE_METRICS_SAMPLE_RATE = float(os.environ.get('STORE_METRICS_SAMPLE_RATE', 0.01))
+STORE_METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Book list/detail responses are cached under STORE_CACHE_ALIAS. Local memory is only coherent
+# within one process; point the alias at a shared Redis-compatible backend
+# (e.g. 'django_redis.cache.RedisCache') when running several workers. List ETags follow the cached
+# list version on a shared backend and are aggregated from the filtered books otherwise.
+STORE_CACHE_ALIAS = 'default'
+STORE_CACHE_TIMEOUT = 60 * 5
+
+# 'sync' updates a book's rating in the request that changes a rate. 'deferred' queues the book
+# in store.PendingRating instead and leaves the recomputation to `manage.py process_ratings`.
+STORE_RATING_MODE = 'sync'
+
+# 'sync' applies a relation PATCH/PUT in the request. 'coalesced' queues it in store.PendingRelationWrite,
+# merged with earlier writes to the same relation, and answers 202; `manage.py process_relation_writes`
+# applies the queue with one counter update per book, which takes the row lock contention off hot books.
+STORE_RELATION_WRITE_MODE = 'sync'
+
+# Per-user limit on relation writes as a DRF rate ('10/s', '300/m'), None to turn it off. Bursts of up to
+# STORE_RELATION_THROTTLE_BURST writes are allowed, each item of a bulk write counting as one. The 'local'
+# backend counts per process, 'cache' shares the buckets through STORE_CACHE_ALIAS.
+STORE_RELATION_THROTTLE_RATE = None
+STORE_RELATION_THROTTLE_BURST = 20
+STORE_RELATION_THROTTLE_BACKEND = 'local'
+
+# Serialize book lists straight from .values() rows instead of BooksSerializer. Pairs well with
+# 'store.renderers.FastJSONRenderer' in DEFAULT_RENDERER_CLASSES, which needs `orjson` installed.
+STORE_FAST_BOOK_LIST = False
+
+# Serve book lists from the store.BookSummary read model. Run `manage.py rebuild_book_summaries`
+# after turning it on, the table is only maintained while this is enabled.
+STORE_BOOK_SUMMARY = False
+
+# Keep the top STORE_LEADERBOARD_SIZE most liked and best rated books, overall and per author, in
+# store.LeaderboardEntry for /leaderboards/. Run `manage.py rebuild_leaderboards` after turning it on,
+# the boards are only maintained while this is enabled. Books need STORE_LEADERBOARD_MIN_VOTES rates
+# to be ranked by rating.
+STORE_LEADERBOARDS = False
+STORE_LEADERBOARD_SIZE = 100
+STORE_LEADERBOARD_BUFFER = 20
+STORE_LEADERBOARD_MIN_VOTES = 1
+
+# Keep the book count, average price, total likes and vote-weighted average rating of every author in
+# store.AuthorStats for /authors/, instead of grouping the books on each request. Run
+# `manage.py rebuild_author_stats` after turning it on, the table is only maintained while this is enabled.
+STORE_AUTHOR_STATS = False
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
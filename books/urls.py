@@ -19,7 +19,9 @@ from django.conf.urls import url
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
-from store.views import BookViewSet, auth, UserBooksRelationView
+from store import async_views
+from store.metrics import metrics_view
+from store.views import AuthorListView, BookViewSet, LeaderboardView, LibraryView, auth, UserBooksRelationView
 
 router = SimpleRouter()
 
@@ -30,6 +32,13 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     url('', include('social_django.urls', namespace='social')),
     path('auth/', auth),
+    path('metrics/', metrics_view, name='metrics'),
+    path('me/library/', LibraryView.as_view(), name='me-library'),
+    path('leaderboards/<str:kind>/', LeaderboardView.as_view(), name='leaderboard'),
+    path('authors/', AuthorListView.as_view(), name='author-list'),
+    path('async/book/', async_views.book_list, name='async-book-list'),
+    path('async/book/<int:pk>/', async_views.book_detail, name='async-book-detail'),
+    path('async/book_relation/<int:book>/', async_views.book_relation, name='async-userbookrelation-detail'),
 ]
 
 urlpatterns += router.urls
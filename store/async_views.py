@@ -0,0 +1,51 @@
+"""
+Async entry points for the book read and relation endpoints, served under /async/ when running on ASGI.
+
+Django 3.1 has no async ORM and runs every sync view on the single thread shared by all requests of
+an ASGI worker, so concurrent requests queue behind each other while waiting on the database.
+These views run the regular DRF views in the executor instead (sized with the ASGI_THREADS
+environment variable), letting one worker keep many requests in flight with the same responses.
+Sync-only middleware such as the debug toolbar puts requests back on the shared thread, so leave it
+out of MIDDLEWARE in ASGI deployments.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from store.views import BookViewSet, UserBooksRelationView
+
+
+def database_sync_to_async(func):
+    """`sync_to_async` off the shared thread, with the connection upkeep Django does around a request."""
+
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def async_view(view):
+    def respond(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        # Render in the same worker thread, the handler would otherwise do it on the shared one.
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        return response
+
+    run = database_sync_to_async(respond)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run(request, *args, **kwargs)
+
+    return wrapper
+
+
+book_list = async_view(BookViewSet.as_view({'get': 'list'}))
+book_detail = async_view(BookViewSet.as_view({'get': 'retrieve'}))
+book_relation = async_view(UserBooksRelationView.as_view({'put': 'update', 'patch': 'partial_update'}))
@@ -0,0 +1,105 @@
+"""
+Statistics of the books of each author: how many there are, their average price, total likes and average rating.
+
+`Book.author_name` is free text, so these take a GROUP BY over the books. While STORE_AUTHOR_STATS is on,
+store.AuthorStats holds them for /authors/ to filter and sort on indexes. Creating, editing and deleting a book
+regroups its author's books, relation writes shift the author's counters in one UPDATE.
+Concurrent writes can leave an author a little off until `manage.py rebuild_author_stats` runs.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, IntegerField, Subquery, Sum
+from django.db.models.functions import Cast, NullIf
+
+from store.models import AuthorStats, Book
+
+FIELDS = ('author_name', 'books_count', 'average_price', 'total_likes', 'average_rating')
+
+
+# Both averages are cast to their column types, so that grouped rows round exactly like stored ones. The sums
+# are multiplied by 1.0 first, SQLite keeps whole decimals as integers and would divide them as such.
+def average_price(price_sum, books_count):
+    return Cast(ExpressionWrapper(price_sum * Decimal('1.0'), output_field=DecimalField()) / books_count,
+                DecimalField(max_digits=7, decimal_places=2))
+
+
+def average_rating(votes_sum, votes_count):
+    return Cast(ExpressionWrapper(votes_sum * Decimal('1.0'), output_field=DecimalField()) / NullIf(votes_count, 0),
+                DecimalField(max_digits=3, decimal_places=2))
+
+
+def aggregated(books=None):
+    """The statistics of the authors of `books` as `.values()` rows grouped from Book, what AuthorStats is kept at."""
+    rows = (Book.objects.all() if books is None else books).order_by().values('author_name').annotate(
+        books_count=Count('id'),
+        price_sum=Sum('price'),
+        total_likes=Sum('likes_count'),
+        votes_sum=Sum('rating_sum'),
+        votes_count=Sum('rating_count'),
+    )
+    return rows.annotate(average_price=average_price(F('price_sum'), F('books_count')),
+                         average_rating=average_rating(F('votes_sum'), F('votes_count')))
+
+
+def stats():
+    """`.values()` rows of FIELDS for every author, grouped from Book when the table is off."""
+    if settings.STORE_AUTHOR_STATS:
+        return AuthorStats.objects.values(*FIELDS)
+    return aggregated().values(*FIELDS)
+
+
+def refresh(author_names=None):
+    """
+    Regroup the statistics of `author_names` (a collection or a `values_list` queryset) from Book,
+    or rebuild every row when `author_names` is None. Does nothing unless STORE_AUTHOR_STATS is enabled.
+    """
+    if not settings.STORE_AUTHOR_STATS:
+        return
+    if author_names is None:
+        rebuild()
+        return
+    _write(aggregated(Book.objects.filter(author_name__in=author_names)), upsert=True)
+    AuthorStats.objects.filter(author_name__in=author_names).exclude(
+        author_name__in=Book.objects.filter(author_name__in=author_names).values('author_name')).delete()
+
+
+def refresh_books(book_ids):
+    refresh(Book.objects.filter(pk__in=book_ids).values_list('author_name', flat=True))
+
+
+def rebuild():
+    """Rebuild every row from Book. Returns the number of authors."""
+    with transaction.atomic():
+        AuthorStats.objects.all().delete()
+        _write(aggregated())
+    return AuthorStats.objects.count()
+
+
+def shift(book_id, delta_likes=0, delta_sum=0, delta_count=0):
+    """Add the counter changes of one book to its author's row in one UPDATE."""
+    if not settings.STORE_AUTHOR_STATS or not (delta_likes or delta_sum or delta_count):
+        return
+    votes_sum = ExpressionWrapper(F('votes_sum') + delta_sum, output_field=IntegerField())
+    votes_count = ExpressionWrapper(F('votes_count') + delta_count, output_field=IntegerField())
+    author = Subquery(Book.objects.filter(pk=book_id).values('author_name'))
+    AuthorStats.objects.filter(author_name=author).update(
+        total_likes=F('total_likes') + delta_likes, votes_sum=votes_sum, votes_count=votes_count,
+        average_rating=average_rating(votes_sum, votes_count))
+
+
+def _write(rows, upsert=False):
+    query = rows.values(*(field.attname for field in AuthorStats._meta.concrete_fields)).query
+    columns = [*query.values_select, *query.annotation_select]
+    select, params = query.sql_with_params()
+
+    quote = connection.ops.quote_name
+    sql = (f'INSERT INTO {quote(AuthorStats._meta.db_table)} ({", ".join(quote(column) for column in columns)}) '
+           f'{select}')
+    if upsert:
+        updates = ', '.join(f'{quote(column)} = EXCLUDED.{quote(column)}' for column in columns
+                            if column != 'author_name')
+        sql += f' ON CONFLICT ({quote("author_name")}) DO UPDATE SET {updates}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
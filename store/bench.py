@@ -0,0 +1,345 @@
+"""
+Seed data and scripted request scenarios for `manage.py seed_store` and `manage.py bench_store`.
+
+Requests go through Django's test client in-process against the configured database, so results
+from SQLite and PostgreSQL runs, or from different commits, can be compared on the same machine.
+"""
+import asyncio
+import math
+import random
+import subprocess
+import time
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from store import authors, cache
+from store.logic import (process_relation_writes, rebuild_book_summaries, rebuild_likes_count, rebuild_ratings,
+                         refresh_book_summaries)
+from store.models import Book, UserBookRelation
+from store.renderers import FastJSONRenderer
+from store.views import BookViewSet
+
+USER_PREFIX = 'bench_user_'
+FIRST_NAMES = ('Ivan', 'Anna', 'Leo', 'Maria', 'Jim', 'Olga', 'Mark', 'Sofia', 'Petr', 'Elena')
+LAST_NAMES = ('Tolstoy', 'Petrov', 'Butcher', 'Ivanova', 'Smith', 'Orlova', 'Twain', 'Gogol', 'Chekhov', 'Woolf')
+TITLE_WORDS = ('War', 'Peace', 'Night', 'River', 'Garden', 'Storm', 'Silent', 'Golden', 'Last', 'Winter', 'City')
+# Share of relations with each rate, None being relations that only like or bookmark.
+RATE_WEIGHTS = {None: 50, 1: 3, 2: 5, 3: 12, 4: 15, 5: 15}
+# Requests come from outside INTERNAL_IPS so the debug toolbar stays out of the timings.
+CLIENT_ADDR = '192.0.2.1'
+
+
+def seed(books=1000, users=200, relations_per_user=20, random_seed=0, batch_size=1000):
+    """
+    Create `users` users and `books` books with relations whose popularity follows a Zipf-like
+    distribution: a few hot books collect most likes and rates, like in a real catalogue.
+    """
+    rng = random.Random(random_seed)
+    first = User.objects.filter(username__startswith=USER_PREFIX).count()
+    with transaction.atomic():
+        User.objects.bulk_create([
+            User(username=f'{USER_PREFIX}{first + i}', first_name=rng.choice(FIRST_NAMES),
+                 last_name=rng.choice(LAST_NAMES))
+            for i in range(users)], batch_size=batch_size)
+        user_ids = list(User.objects.filter(username__startswith=USER_PREFIX).order_by('id').values_list(
+            'id', flat=True))
+
+        authors = [f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}' for _ in range(max(1, books // 10))]
+        new_books = []
+        for i in range(books):
+            price = Decimal(rng.randrange(100, 10000)) / 100
+            discount = Decimal(rng.randrange(0, int(price * 50))) / 100 if rng.random() < 0.3 else None
+            book = Book(name=f'{rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)} {i}',
+                        author_name=rng.choice(authors), price=price, discount=discount, owner_id=rng.choice(user_ids))
+            book.set_price_with_discount()
+            new_books.append(book)
+        Book.objects.bulk_create(new_books, batch_size=batch_size)
+
+        book_ids = list(Book.objects.values_list('id', flat=True))
+        rng.shuffle(book_ids)
+        cum_weights = []
+        for rank in range(len(book_ids)):
+            cum_weights.append((cum_weights[-1] if cum_weights else 0) + 1 / (rank + 1) ** 1.1)
+
+        existing = set(UserBookRelation.objects.values_list('user_id', 'book_id'))
+        relations = []
+        rates, rate_weights = list(RATE_WEIGHTS), list(RATE_WEIGHTS.values())
+        for user_id in user_ids[first:]:
+            count = min(len(book_ids), max(1, round(rng.expovariate(1 / relations_per_user))))
+            for book_id in set(rng.choices(book_ids, cum_weights=cum_weights, k=count)):
+                if (user_id, book_id) in existing:
+                    continue
+                relations.append(UserBookRelation(
+                    user_id=user_id, book_id=book_id, like=rng.random() < 0.4, in_bookmarks=rng.random() < 0.15,
+                    rate=rng.choices(rates, weights=rate_weights)[0]))
+        UserBookRelation.objects.bulk_create(relations, batch_size=batch_size)
+
+    # bulk_create skipped the counters, so derive them once for the whole catalogue.
+    rebuild_ratings()
+    rebuild_likes_count(Book.objects.values_list('pk', flat=True))
+    refresh_book_summaries()
+    cache.invalidate_all()
+    return {'users': len(user_ids) - first, 'books': books, 'relations': len(relations)}
+
+
+def clear():
+    with transaction.atomic():
+        Book.objects.filter(owner__username__startswith=USER_PREFIX).delete()
+        return User.objects.filter(username__startswith=USER_PREFIX).delete()[0]
+
+
+class Context:
+    """What scenarios draw their requests from, taken from the database once before a run."""
+
+    def __init__(self, random_seed=0):
+        self.rng = random.Random(random_seed)
+        self.book_ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+        if not self.book_ids:
+            raise ValueError('There are no books, run `manage.py seed_store` first.')
+        self.users = list(User.objects.filter(username__startswith=USER_PREFIX).order_by('id'))
+        if not self.users:
+            raise ValueError('There are no seeded users, run `manage.py seed_store` first.')
+        self.prices = list(Book.objects.order_by().values_list('price', flat=True).distinct()[:1000])
+        self.authors = list(Book.objects.order_by().values_list('author_name', flat=True).distinct()[:1000])
+        self.hot_book_id = Book.objects.order_by('-likes_count', 'id').values_list('id', flat=True)[0]
+
+    def book_id(self):
+        return self.rng.choice(self.book_ids)
+
+    def user(self):
+        return self.rng.choice(self.users)
+
+
+class Scenario:
+    def __init__(self, name, description, request, kind='sync', settings=None, patches=(), setup=None,
+                 teardown=None):
+        self.name = name
+        self.description = description
+        self.request = request
+        self.kind = kind
+        self.settings = settings or {}
+        self.patches = patches
+        self.setup = setup
+        self.teardown = teardown
+
+    def enter(self, stack):
+        stack.enter_context(override_settings(**self.settings))
+        for target, attribute, value in self.patches:
+            stack.enter_context(mock.patch.object(target, attribute, value))
+        if self.setup is not None:
+            self.setup()
+
+
+def _deep_cursor(context):
+    # A cursor seeking past 90% of the catalogue, the same as the one BookKeysetPagination builds.
+    position = context.book_ids[int(len(context.book_ids) * 0.9)]
+    return b64encode(urlencode({'p': [str(position)]}, doseq=True).encode()).decode()
+
+
+def _patch_relation(client, context, book_id, data):
+    client.force_authenticate(context.user())
+    return client.patch(f'/book_relation/{book_id}/', data=data, format='json')
+
+
+def _relation_items(context, count=20):
+    return [{'book': context.book_id(), 'like': context.rng.random() < 0.5, 'rate': context.rng.randint(1, 5)}
+            for _ in range(count)]
+
+
+def _drain_relation_writes():
+    # Not timed: it stands for the process_relation_writes worker.
+    while process_relation_writes():
+        pass
+
+
+def _relations_per_item(client, context):
+    client.force_authenticate(context.user())
+    for item in _relation_items(context):
+        response = client.patch(f'/book_relation/{item.pop("book")}/', data=item, format='json')
+    return response
+
+
+def _relations_bulk(client, context):
+    client.force_authenticate(context.user())
+    return client.post('/book_relation/bulk/', data=_relation_items(context), format='json')
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    Scenario('list_page', 'First page of 20 books with readers.',
+             lambda client, context: client.get('/book/', {'page_size': 20})),
+    Scenario('list_deep_page', 'A page of 20 books 90% deep into the catalogue.',
+             lambda client, context: client.get('/book/', {'page_size': 20, 'cursor': _deep_cursor(context)})),
+    Scenario('list_all', 'The whole catalogue without readers.',
+             lambda client, context: client.get('/book/', {'readers': 'none'})),
+    Scenario('list_all_fast', 'list_all through the values() path and the orjson renderer.',
+             lambda client, context: client.get('/book/', {'readers': 'none'}),
+             settings={'STORE_FAST_BOOK_LIST': True},
+             patches=[(BookViewSet, 'renderer_classes', [FastJSONRenderer])]),
+    Scenario('list_summary', 'list_page read from the BookSummary table.',
+             lambda client, context: client.get('/book/', {'page_size': 20}),
+             settings={'STORE_BOOK_SUMMARY': True}, setup=rebuild_book_summaries),
+    Scenario('filter_price', 'Books with a given price, 20 per page.',
+             lambda client, context: client.get('/book/', {'price': context.rng.choice(context.prices),
+                                                            'page_size': 20})),
+    Scenario('search', 'Search by author name, 20 per page.',
+             lambda client, context: client.get('/book/', {'search': context.rng.choice(context.authors),
+                                                            'page_size': 20})),
+    Scenario('ordering', 'The 20 most expensive books.',
+             lambda client, context: client.get('/book/', {'ordering': '-price', 'page_size': 20})),
+    Scenario('authors', 'The 20 authors with the most likes, grouped from the books.',
+             lambda client, context: client.get('/authors/', {'ordering': '-total_likes', 'page_size': 20})),
+    Scenario('authors_stats', 'authors read from the AuthorStats table.',
+             lambda client, context: client.get('/authors/', {'ordering': '-total_likes', 'page_size': 20}),
+             settings={'STORE_AUTHOR_STATS': True}, setup=authors.rebuild),
+    Scenario('detail', 'A random book.',
+             lambda client, context: client.get(f'/book/{context.book_id()}/')),
+    Scenario('like_toggle', 'Random users liking or unliking random books.',
+             lambda client, context: _patch_relation(client, context, context.book_id(),
+                                                     {'like': context.rng.random() < 0.5})),
+    Scenario('rate_hot_book', 'Random users rating the most liked book, all writes hit one row.',
+             lambda client, context: _patch_relation(client, context, context.hot_book_id,
+                                                     {'rate': context.rng.randint(1, 5)})),
+    Scenario('rate_hot_book_coalesced', 'rate_hot_book with the writes queued and applied once per batch.',
+             lambda client, context: _patch_relation(client, context, context.hot_book_id,
+                                                     {'rate': context.rng.randint(1, 5)}),
+             settings={'STORE_RELATION_WRITE_MODE': 'coalesced'}, teardown=_drain_relation_writes),
+    Scenario('relations_per_item', '20 relation changes sent as 20 PATCH requests.', _relations_per_item),
+    Scenario('relations_bulk', '20 relation changes sent as one bulk request.', _relations_bulk),
+    Scenario('list_async', 'list_page through the async endpoint; compare with list_page at the same concurrency.',
+             lambda client, context: client.get('/async/book/', {'page_size': 20}), kind='async'),
+)}
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted `values`."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+class Bench:
+    def __init__(self, requests=200, warmup=10, concurrency=1, warm_cache=False, random_seed=0):
+        self.requests = requests
+        self.warmup = warmup
+        self.concurrency = concurrency
+        self.warm_cache = warm_cache
+        self.context = Context(random_seed)
+
+    def run(self, names):
+        # The test client's host, allowed by the test runner but not with DEBUG off. Bursts from one
+        # user would otherwise hit the write throttle.
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                               STORE_RELATION_THROTTLE_RATE=None):
+            scenarios = {name: self.run_scenario(SCENARIOS[name]) for name in names}
+        return {
+            'meta': {
+                'commit': _git_commit(),
+                'created_at': timezone.now().isoformat(),
+                'vendor': connection.vendor,
+                'debug': settings.DEBUG,
+                'books': len(self.context.book_ids),
+                'users': len(self.context.users),
+                'relations': UserBookRelation.objects.count(),
+                'requests': self.requests,
+                'concurrency': self.concurrency,
+                'warm_cache': self.warm_cache,
+            },
+            'scenarios': scenarios,
+        }
+
+    def run_scenario(self, scenario):
+        with ExitStack() as stack:
+            scenario.enter(stack)
+            run = self.run_async if scenario.kind == 'async' else self.run_sync
+            run(scenario, self.warmup)
+            start = time.perf_counter()
+            samples = run(scenario, self.requests)
+            seconds = time.perf_counter() - start
+            if scenario.teardown is not None:
+                scenario.teardown()
+
+        latencies = sorted(latency for latency, _, _ in samples)
+        queries = [count for _, count, _ in samples if count is not None]
+        return {
+            'description': scenario.description,
+            'requests': len(samples),
+            'errors': sum(1 for _, _, ok in samples if not ok),
+            'seconds': round(seconds, 4),
+            'throughput': round(len(samples) / seconds, 2) if seconds else None,
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+            **{f'p{p}_ms': round(percentile(latencies, p) * 1000, 3) if latencies else None for p in (50, 95, 99)},
+            'queries': round(sum(queries) / len(queries), 2) if queries else None,
+        }
+
+    def run_sync(self, scenario, count):
+        def worker(share):
+            client = APIClient(REMOTE_ADDR=CLIENT_ADDR)
+            samples = []
+            for _ in range(share):
+                if not self.warm_cache:
+                    cache.get_cache().clear()
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    response = scenario.request(client, self.context)
+                    latency = time.perf_counter() - start
+                samples.append((latency, len(queries), response.status_code < 400))
+            connection.close()
+            return samples
+
+        if self.concurrency == 1:
+            return worker(count)
+        shares = [count // self.concurrency + (i < count % self.concurrency) for i in range(self.concurrency)]
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            return [sample for samples in executor.map(worker, shares) for sample in samples]
+
+    def run_async(self, scenario, count):
+        async def run():
+            client = AsyncClient(REMOTE_ADDR=CLIENT_ADDR)
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def one():
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await scenario.request(client, self.context)
+                    # Queries run on executor threads, so they aren't counted here.
+                    return time.perf_counter() - start, None, response.status_code < 400
+
+            return await asyncio.gather(*(one() for _ in range(count)))
+
+        if not self.warm_cache:
+            cache.get_cache().clear()
+        return asyncio.run(run())
+
+
+def compare(baseline, results):
+    """Rows of (scenario, metric, baseline, current, change in %) for the scenarios both runs have."""
+    rows = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        for metric in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms', 'queries'):
+            old, new = previous.get(metric), current.get(metric)
+            change = round((new - old) / old * 100, 1) if old and new is not None else None
+            rows.append((name, metric, old, new, change))
+    return rows
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
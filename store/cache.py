@@ -0,0 +1,116 @@
+import hashlib
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+
+EPOCH_KEY = 'store:books:epoch'
+LIST_VERSION_KEY = 'store:books:version'
+BOOK_VERSION_KEY = 'store:book:{}:version'
+LIBRARIES_VERSION_KEY = 'store:libraries:version'
+LIBRARY_VERSION_KEY = 'store:library:{}:version'
+
+stats = Counter()
+
+
+def get_cache():
+    return caches[settings.STORE_CACHE_ALIAS]
+
+
+def is_shared():
+    """Whether every worker sees the same versions, which local memory only gives within one process."""
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def get_versions(*keys):
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock so a version key that got evicted never reuses an old number.
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return ':'.join(str(versions[key]) for key in keys)
+
+
+def bump_version(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def request_digest(request):
+    params = sorted(request.query_params.lists())
+    return hashlib.md5(f'{request.get_host()}?{params}'.encode()).hexdigest()
+
+
+def library_version(user_id):
+    return get_versions(EPOCH_KEY, LIBRARIES_VERSION_KEY, LIBRARY_VERSION_KEY.format(user_id))
+
+
+def user_part(user_id):
+    # Responses with the caller's relations in them are cached per user and library version.
+    return '' if user_id is None else f':user:{user_id}:{library_version(user_id)}'
+
+
+def list_key(request, user_id=None):
+    versions = get_versions(EPOCH_KEY, LIST_VERSION_KEY)
+    return f'store:books:list:{versions}{user_part(user_id)}:{request_digest(request)}'
+
+
+def detail_key(request, pk, user_id=None):
+    versions = get_versions(EPOCH_KEY, BOOK_VERSION_KEY.format(pk))
+    return f'store:books:detail:{pk}:{versions}{user_part(user_id)}:{request_digest(request)}'
+
+
+def library_key(user_id):
+    return f'store:library:{user_id}:{library_version(user_id)}'
+
+
+def get(key):
+    data = get_cache().get(key)
+    stats['hits' if data is not None else 'misses'] += 1
+    return data
+
+
+def set(key, data):
+    get_cache().set(key, data, settings.STORE_CACHE_TIMEOUT)
+
+
+def invalidate_book(pk):
+    def bump():
+        bump_version(BOOK_VERSION_KEY.format(pk))
+        bump_version(LIST_VERSION_KEY)
+
+    bump()
+    # Bump again once the write is visible, so a read racing the transaction can't keep a stale entry.
+    if connection.in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def invalidate_library(user_id):
+    def bump():
+        bump_version(LIBRARY_VERSION_KEY.format(user_id))
+
+    bump()
+    if connection.in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def invalidate_libraries():
+    """For deletes that cascade to the relations of many users, like deleting a book."""
+    bump_version(LIBRARIES_VERSION_KEY)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: bump_version(LIBRARIES_VERSION_KEY))
+
+
+def invalidate_all():
+    bump_version(EPOCH_KEY)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: bump_version(EPOCH_KEY))
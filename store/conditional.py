@@ -0,0 +1,34 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, Sum
+
+from store.cache import EPOCH_KEY, LIST_VERSION_KEY, get_versions, is_shared, request_digest
+from store.models import Book
+
+
+def make_etag(request, *parts):
+    digest = hashlib.md5(repr((request_digest(request),) + parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def list_validators(request, queryset):
+    if is_shared():
+        # Every write that changes a list bumps the version its cached responses are keyed on, so the ETag
+        # follows that version instead of aggregating the whole catalogue. An evicted version only costs a 200.
+        return make_etag(request, get_versions(EPOCH_KEY, LIST_VERSION_KEY)), None
+    # A version in local memory never sees the writes of other workers, which would answer 304 for good.
+    aggregate = queryset.order_by().aggregate(count=Count('id'), version=Sum('version'), updated_at=Max('updated_at'))
+    # Deleting a row never moves Max(updated_at) forward, so the list only gets an ETag.
+    return make_etag(request, aggregate['count'], aggregate['version'], aggregate['updated_at']), None
+
+
+def detail_validators(request, pk):
+    try:
+        row = Book.objects.filter(pk=pk).values_list('version', 'updated_at').first()
+    except (TypeError, ValueError, ValidationError):
+        row = None
+    if row is None:
+        return None, None
+    version, updated_at = row
+    return make_etag(request, pk, version, updated_at), int(updated_at.timestamp())
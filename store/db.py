@@ -0,0 +1,105 @@
+"""
+Read replica routing and health checks for persistent database connections.
+
+Reads only go to a replica inside `read_from_replica()`, which BookViewSet enters for safe methods,
+so writes and the reads they depend on (like `set_rating`) always see the primary.
+"""
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.dispatch import receiver
+
+_replica = ContextVar('store_replica', default=None)
+_down_until = {}
+_counter = itertools.count()
+
+
+@contextmanager
+def read_from_replica(enabled=True):
+    token = _replica.set(pick_replica() if enabled else None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def primary():
+    return read_from_replica(False)
+
+
+def pick_replica():
+    """Round-robin over the healthy STORE_DB_REPLICAS, None when there are none."""
+    replicas = settings.STORE_DB_REPLICAS
+    start = next(_counter)
+    for i in range(len(replicas)):
+        alias = replicas[(start + i) % len(replicas)]
+        if is_healthy(alias):
+            return alias
+    return None
+
+
+def is_healthy(alias):
+    if _down_until.get(alias, 0) > time.monotonic():
+        return False
+    connection = connections[alias]
+    try:
+        drop_if_unusable(connection)
+        connection.ensure_connection()
+    except DatabaseError:
+        connection.close()
+        _down_until[alias] = time.monotonic() + settings.STORE_DB_RETRY_AFTER
+        return False
+    return True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return _replica.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Without this, saving an instance read from a replica would write to the replica.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.STORE_DB_REPLICAS
+
+
+def drop_if_unusable(connection):
+    """
+    Close a reused connection the server dropped meanwhile. Only connections idle for STORE_DB_PING_IDLE_AFTER
+    seconds or that raised an error are pinged, so a busy worker doesn't pay a query per request for it.
+    """
+    if connection.connection is None or not settings.STORE_DB_HEALTH_CHECKS:
+        return
+    now = time.monotonic()
+    idle = now - getattr(connection, 'store_used_at', now)
+    if (connection.errors_occurred or idle > settings.STORE_DB_PING_IDLE_AFTER) and not connection.is_usable():
+        connection.close()
+        return
+    connection.store_used_at = now
+
+
+@receiver(request_started)
+def check_persistent_connections(**kwargs):
+    """Drop persistent connections the server closed meanwhile, so the request doesn't fail on its first query."""
+    for connection in connections.all():
+        if connection.settings_dict['CONN_MAX_AGE'] != 0:
+            drop_if_unusable(connection)
+
+
+@receiver(request_finished)
+def mark_connections_used(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.store_used_at = now
@@ -0,0 +1,109 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, OuterRef, Subquery
+from django.db.models.expressions import RawSQL
+from django_filters.rest_framework import BaseInFilter, BooleanFilter, CharFilter, FilterSet, NumberFilter
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+from store.models import Book
+
+SEARCH_RANK = 'search_rank'
+
+
+# Split by the parser `search_vector` is built with, so words like '200.00' stay one lexeme,
+# each of them matched as a prefix.
+SEARCH_TSQUERY = ("to_tsquery('simple', (SELECT string_agg(quote_literal(word) || ':*', ' & ') "
+                  "FROM unnest(tsvector_to_array(to_tsvector('simple', %s))) AS word))")
+
+
+def search_text(terms):
+    """The search terms as one text for SEARCH_TSQUERY, '' when there is no word to search for."""
+    text = ' '.join(terms)
+    return text if re.search(r'\w', text) else ''
+
+
+class BookSearchFilter(SearchFilter):
+    """
+    Uses the trigger-maintained `search_vector` column and its GIN index on PostgreSQL
+    and falls back to the stock ILIKE search on other databases.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if connection.vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        text = search_text(self.get_search_terms(request))
+        if not text:
+            return queryset
+
+        if queryset.model is not Book:
+            # Read models such as BookSummary have no vector of their own, so match through the books they mirror.
+            books = self.filter_queryset(request, Book.objects.order_by(), view)
+            rank = Subquery(books.filter(pk=OuterRef('pk')).values(SEARCH_RANK))
+            return queryset.filter(pk__in=books.values('pk')).annotate(**{SEARCH_RANK: rank})
+
+        table = connection.ops.quote_name(queryset.model._meta.db_table)
+        matches = RawSQL(f'{table}.search_vector @@ {SEARCH_TSQUERY}', (text,), output_field=BooleanField())
+        rank = RawSQL(f'ts_rank({table}.search_vector, {SEARCH_TSQUERY})', (text,), output_field=FloatField())
+        return queryset.filter(matches).annotate(**{SEARCH_RANK: rank})
+
+
+class BookOrderingFilter(OrderingFilter):
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if request.query_params.get(self.ordering_param) or SEARCH_RANK not in queryset.query.annotations:
+            return ordering
+        return ['-' + SEARCH_RANK, '-id']
+
+
+class NumberInFilter(BaseInFilter, NumberFilter):
+    pass
+
+
+class CharInFilter(BaseInFilter, CharFilter):
+    pass
+
+
+class BookFilter(FilterSet):
+    """
+    Every filter compares a column as it is stored, so ranges and `in` lists seek the (column, id) indexes.
+    Declared without a model, so it also filters BookSummary.
+    """
+    id__in = NumberInFilter('id')
+    price = NumberFilter()
+    price__gte = NumberFilter('price', 'gte')
+    price__lte = NumberFilter('price', 'lte')
+    price__in = NumberInFilter('price')
+    price_with_discount__gte = NumberFilter('price_with_discount', 'gte')
+    price_with_discount__lte = NumberFilter('price_with_discount', 'lte')
+    rating__gte = NumberFilter('rating', 'gte')
+    rating__lte = NumberFilter('rating', 'lte')
+    rating__in = NumberInFilter('rating')
+    author_name__in = CharInFilter('author_name')
+    # price_with_discount is NULL exactly when discount is, and unlike discount it is indexed.
+    has_discount = BooleanFilter('price_with_discount', 'isnull', exclude=True)
+
+
+class AuthorStatsFilter(FilterSet):
+    """Declared without a model, so it also filters the rows `store.authors.stats` groups from Book."""
+    books_count = NumberFilter()
+    books_count__gte = NumberFilter('books_count', 'gte')
+    books_count__lte = NumberFilter('books_count', 'lte')
+    average_price__gte = NumberFilter('average_price', 'gte')
+    average_price__lte = NumberFilter('average_price', 'lte')
+    total_likes__gte = NumberFilter('total_likes', 'gte')
+    total_likes__lte = NumberFilter('total_likes', 'lte')
+    average_rating__gte = NumberFilter('average_rating', 'gte')
+    average_rating__lte = NumberFilter('average_rating', 'lte')
+    average_rating__isnull = BooleanFilter('average_rating', 'isnull')
+
+
+class AuthorOrderingFilter(OrderingFilter):
+    def filter_queryset(self, request, queryset, view):
+        # Authors nobody rated are left out of a ranking by rating, like on the rating leaderboard,
+        # which also keeps NULLs out of the pagination cursors.
+        ordering = self.get_ordering(request, queryset, view) or []
+        if any(field.lstrip('-') == 'average_rating' for field in ordering):
+            queryset = queryset.filter(average_rating__isnull=False)
+        return super().filter_queryset(request, queryset, view)
@@ -0,0 +1,173 @@
+"""
+Top-N boards of the most liked and the best rated books, for the whole catalogue and per author.
+
+While STORE_LEADERBOARDS is on, each board holds the exact top STORE_LEADERBOARD_SIZE +
+STORE_LEADERBOARD_BUFFER books in store.LeaderboardEntry, so a request reads N rows off an index
+instead of sorting the catalogue. Counter updates move the changed books on their boards. The buffer
+lets books drop off the bottom without refilling the board from Book every time, and a `complete`
+board, one holding every book that qualifies, also takes books below its last entry.
+Concurrent writes can leave a board a place off until `manage.py rebuild_leaderboards` runs.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from store.models import Book, Leaderboard, LeaderboardEntry
+
+LIKES = 'likes'
+RATING = 'rating'
+KINDS = (LIKES, RATING)
+GLOBAL = ''
+SCORE_FIELDS = {LIKES: 'likes_count', RATING: 'rating'}
+
+
+def capacity():
+    return settings.STORE_LEADERBOARD_SIZE + settings.STORE_LEADERBOARD_BUFFER
+
+
+def qualifies(kind):
+    if kind == LIKES:
+        return Q(likes_count__gt=0)
+    return Q(rating__isnull=False, rating_count__gte=settings.STORE_LEADERBOARD_MIN_VOTES)
+
+
+def score(kind, book):
+    """The score of a `.values()` book row on a board of `kind`, None when it doesn't qualify."""
+    if kind == LIKES:
+        return book['likes_count'] or None
+    if book['rating'] is None or book['rating_count'] < settings.STORE_LEADERBOARD_MIN_VOTES:
+        return None
+    return book['rating']
+
+
+def ranked(kind, scope=GLOBAL):
+    """Every book of a board in order, sorted from Book: what the board is kept equal to."""
+    books = Book.objects.filter(qualifies(kind))
+    if scope != GLOBAL:
+        books = books.filter(author_name=scope)
+    return books.order_by(f'-{SCORE_FIELDS[kind]}', 'id')
+
+
+def top(kind, scope=GLOBAL, limit=10):
+    """The first `limit` books of a board as dicts, sorted from Book when the board is off or not built yet."""
+    fields = ('id', 'name', 'author_name', 'likes_count', 'rating')
+    rows = None
+    if settings.STORE_LEADERBOARDS:
+        entries = LeaderboardEntry.objects.filter(leaderboard__kind=kind, leaderboard__scope=scope)
+        rows = [{name: row[f'book__{name}'] for name in fields} for row in
+                entries.order_by('-score', 'book_id').values(*(f'book__{name}' for name in fields))[:limit]]
+        # Boards are built by `rebuild` and by the first write that puts a book on them.
+        if not rows and not Leaderboard.objects.filter(kind=kind, scope=scope).exists():
+            rows = None
+    if rows is None:
+        rows = list(ranked(kind, scope).values(*fields)[:limit])
+    return [{'rank': rank, **row} for rank, row in enumerate(rows, start=1)]
+
+
+def refill(kind, scope):
+    rows = list(ranked(kind, scope).values_list('id', SCORE_FIELDS[kind])[:capacity() + 1])
+    with transaction.atomic():
+        board, _ = Leaderboard.objects.update_or_create(kind=kind, scope=scope,
+                                                        defaults={'complete': len(rows) <= capacity()})
+        board.entries.all().delete()
+        LeaderboardEntry.objects.bulk_create([LeaderboardEntry(leaderboard=board, book_id=book_id, score=value)
+                                              for book_id, value in rows[:capacity()]])
+    return board
+
+
+def rebuild(kinds=KINDS):
+    """Rebuild every board of `kinds` from Book. Returns the number of boards."""
+    with transaction.atomic():
+        Leaderboard.objects.filter(kind__in=kinds).delete()
+        for kind in kinds:
+            refill(kind, GLOBAL)
+            authors = Book.objects.filter(qualifies(kind)).order_by().values_list('author_name', flat=True).distinct()
+            for author_name in authors:
+                refill(kind, author_name)
+    return Leaderboard.objects.filter(kind__in=kinds).count()
+
+
+def refresh(kinds=KINDS):
+    if settings.STORE_LEADERBOARDS:
+        rebuild(kinds)
+
+
+def update_books(book_ids, kinds=KINDS):
+    """Move books whose scores or author changed to their places on the boards of `kinds`."""
+    if not settings.STORE_LEADERBOARDS:
+        return
+    books = {book['id']: book for book in Book.objects.filter(pk__in=book_ids).values(
+        'id', 'author_name', 'likes_count', 'rating', 'rating_count')}
+    for book_id in book_ids:
+        for kind in kinds:
+            _place(kind, book_id, books.get(book_id))
+
+
+def add_books(book_ids):
+    """Place books created without `save`, like imported ones. Only those that qualify for a board are moved."""
+    if not settings.STORE_LEADERBOARDS:
+        return
+    qualifying = Q()
+    for kind in KINDS:
+        qualifying |= qualifies(kind)
+    update_books(list(Book.objects.filter(qualifying, pk__in=book_ids).values_list('pk', flat=True)))
+
+
+def remove_book(book_id, author_name):
+    """Take a deleted book off the boards, refilling the ones left short."""
+    if not settings.STORE_LEADERBOARDS:
+        return
+    LeaderboardEntry.objects.filter(book_id=book_id).delete()
+    boards = _boards(Leaderboard.objects.filter(scope__in=(GLOBAL, author_name)), book_id)
+    for board in boards:
+        if board.size < settings.STORE_LEADERBOARD_SIZE and not board.complete:
+            refill(board.kind, board.scope)
+
+
+def _boards(boards, book_id):
+    entries = LeaderboardEntry.objects.filter(leaderboard=OuterRef('pk'))
+    # The last entry other than the book itself, where books off the board start.
+    others = entries.exclude(book_id=book_id).order_by('score', '-book_id')
+    return boards.annotate(
+        size=Coalesce(Subquery(entries.order_by().values('leaderboard').annotate(total=Count('id')).values('total')),
+                      0),
+        current=Subquery(entries.filter(book_id=book_id).values('score')[:1]),
+        low_score=Subquery(others.values('score')[:1]),
+        low_book=Subquery(others.values('book_id')[:1]))
+
+
+def _place(kind, book_id, book):
+    value = None if book is None else score(kind, book)
+    scopes = [GLOBAL] if book is None else [GLOBAL, book['author_name']]
+    # The boards of the book's scopes and the ones it is on, like the board of its previous author.
+    boards = {board.scope: board for board in _boards(Leaderboard.objects.filter(
+        Q(scope__in=scopes) | Q(pk__in=LeaderboardEntry.objects.filter(book_id=book_id).values('leaderboard')),
+        kind=kind), book_id)}
+
+    for scope, board in boards.items():
+        _move(board, book_id, value if scope in scopes else None)
+    if value is not None:
+        for scope in scopes:
+            if scope not in boards:
+                refill(kind, scope)
+
+
+def _move(board, book_id, value):
+    present = board.current is not None
+    above_low = board.low_score is None or (value is not None and (
+        value > board.low_score or value == board.low_score and book_id < board.low_book))
+
+    if value is not None and present and (board.complete or above_low):
+        if board.current != value:
+            board.entries.filter(book_id=book_id).update(score=value)
+    elif value is not None and not present and (board.complete or above_low and board.low_score is not None):
+        LeaderboardEntry.objects.create(leaderboard=board, book_id=book_id, score=value)
+        if board.size + 1 > capacity():
+            board.entries.filter(pk__in=board.entries.order_by('score', '-book_id').values('pk')[:1]).delete()
+            Leaderboard.objects.filter(pk=board.pk).update(complete=False)
+    elif present:
+        # The book no longer qualifies, or fell below the last entry where books off the board may outrank it.
+        board.entries.filter(book_id=book_id).delete()
+        if board.size - 1 < settings.STORE_LEADERBOARD_SIZE and not board.complete:
+            refill(board.kind, board.scope)
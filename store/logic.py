@@ -1,9 +1,405 @@
-from django.db.models import Avg
+from decimal import Decimal
 
-from store.models import UserBookRelation
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Avg, Count, DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Now, NullIf
+from django.utils import timezone
+
+from store import authors, leaderboards
+from store.cache import invalidate_all, invalidate_book, invalidate_library
+from store.db import primary
+from store.models import Book, BookSummary, PendingRating, PendingRelationWrite, UserBookRelation
 
 
 def set_rating(book):
-    rating = UserBookRelation.objects.filter(book=book).aggregate(rating=Avg('rate')).get('rating')
-    book.rating = rating
-    book.save()
+    with primary():
+        aggregate = UserBookRelation.objects.filter(book=book).aggregate(
+            rating=Avg('rate'), rating_sum=Sum('rate'), rating_count=Count('rate'))
+    book.rating = aggregate['rating']
+    book.rating_sum = aggregate['rating_sum'] or 0
+    book.rating_count = aggregate['rating_count']
+    book.save(update_fields=['rating', 'rating_sum', 'rating_count'])
+
+
+def rating_expression(rating_sum, rating_count):
+    return ExpressionWrapper(
+        ExpressionWrapper(rating_sum * Decimal('1.0'), output_field=DecimalField()) / NullIf(rating_count, 0),
+        output_field=DecimalField(max_digits=3, decimal_places=2))
+
+
+def update_book_counters(book_id, old_like=False, new_like=False, old_rate=None, new_rate=None):
+    apply_counter_deltas(book_id, delta_likes=new_like - old_like,
+                         delta_sum=(new_rate or 0) - (old_rate or 0),
+                         delta_count=(new_rate is not None) - (old_rate is not None))
+
+
+def apply_counter_deltas(book_id, delta_likes=0, delta_sum=0, delta_count=0):
+    """Shift the denormalized counters of a book in one UPDATE, for any number of relation changes at once."""
+    changes = {'version': F('version') + 1, 'updated_at': Now()}
+
+    if delta_likes:
+        changes['likes_count'] = F('likes_count') + delta_likes
+
+    boards = [leaderboards.LIKES] if delta_likes else []
+    if (delta_sum or delta_count) and settings.STORE_RATING_MODE == 'deferred':
+        enqueue_rating(book_id)
+        # The rates reach the author's statistics with the recomputed rating.
+        delta_sum = delta_count = 0
+    elif delta_sum or delta_count:
+        rating_sum = ExpressionWrapper(F('rating_sum') + delta_sum, output_field=IntegerField())
+        rating_count = ExpressionWrapper(F('rating_count') + delta_count, output_field=IntegerField())
+        changes.update(rating_sum=rating_sum, rating_count=rating_count,
+                       rating=rating_expression(rating_sum, rating_count))
+        boards.append(leaderboards.RATING)
+
+    Book.objects.filter(pk=book_id).update(**changes)
+    invalidate_book(book_id)
+    refresh_book_summaries([book_id])
+    if boards:
+        leaderboards.update_books([book_id], boards)
+    authors.shift(book_id, delta_likes=delta_likes, delta_sum=delta_sum, delta_count=delta_count)
+
+
+def enqueue_rating(book_id):
+    """
+    Queue a book for `process_pending_ratings`. A book already in the queue keeps its place, but the row is
+    still locked, so a worker can't pick it up until the rate change calling this has committed.
+    """
+    quote = connection.ops.quote_name
+    table = quote(PendingRating._meta.db_table)
+    sql = (f'INSERT INTO {table} ({quote("book_id")}, {quote("enqueued_at")}) VALUES (%s, %s) '
+           f'ON CONFLICT ({quote("book_id")}) DO UPDATE SET {quote("enqueued_at")} = {table}.{quote("enqueued_at")}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [book_id, connection.ops.adapt_datetimefield_value(timezone.now())])
+
+
+def process_pending_ratings(batch_size=500, delay=0):
+    """
+    Recompute the ratings of up to `batch_size` queued books that have waited at least `delay` seconds.
+    Waiting lets a burst of votes on one book be handled by one recomputation. Returns the number of books.
+    """
+    with transaction.atomic():
+        pending = PendingRating.objects.select_for_update(skip_locked=True).filter(
+            enqueued_at__lte=timezone.now() - timedelta(seconds=delay)).order_by('enqueued_at')
+        book_ids = list(pending.values_list('book_id', flat=True)[:batch_size])
+        if book_ids:
+            recompute_ratings(book_ids)
+            PendingRating.objects.filter(book_id__in=book_ids).delete()
+    return len(book_ids)
+
+
+def recompute_ratings(book_ids):
+    rating_sum, rating_count = _rating_subqueries()
+    books = Book.objects.filter(pk__in=book_ids)
+    books.update(rating_sum=rating_sum, rating_count=rating_count)
+    books.update(rating=rating_expression(F('rating_sum'), F('rating_count')),
+                 version=F('version') + 1, updated_at=Now())
+    for book_id in book_ids:
+        invalidate_book(book_id)
+    refresh_book_summaries(book_ids)
+    leaderboards.update_books(book_ids, [leaderboards.RATING])
+    authors.refresh_books(book_ids)
+
+
+def _rating_subqueries():
+    relations = UserBookRelation.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    rating_sum = Coalesce(Subquery(relations.annotate(total=Sum('rate')).values('total')), 0)
+    rating_count = Coalesce(Subquery(relations.annotate(total=Count('rate')).values('total')), 0)
+    return rating_sum, rating_count
+
+
+def rebuild_ratings():
+    rating_sum, rating_count = _rating_subqueries()
+
+    with transaction.atomic():
+        drifted = list(Book.objects.annotate(expected_sum=rating_sum, expected_count=rating_count).exclude(
+            rating_sum=F('expected_sum'), rating_count=F('expected_count')).values_list('pk', flat=True))
+        if drifted:
+            recompute_ratings(drifted)
+    return len(drifted)
+
+
+def expected_likes():
+    relations = UserBookRelation.objects.filter(book=OuterRef('pk'), like=True).order_by().values('book')
+    return Coalesce(Subquery(relations.annotate(total=Count('id')).values('total')), 0)
+
+
+def likes_drift():
+    return Book.objects.annotate(expected_likes=expected_likes()).exclude(likes_count=F('expected_likes'))
+
+
+def rebuild_likes_count(book_ids):
+    book_ids = list(book_ids)
+    with transaction.atomic():
+        fixed = Book.objects.filter(pk__in=book_ids).update(
+            likes_count=expected_likes(), version=F('version') + 1, updated_at=Now())
+        for book_id in book_ids:
+            invalidate_book(book_id)
+        refresh_book_summaries(book_ids)
+        leaderboards.update_books(book_ids, [leaderboards.LIKES])
+        authors.refresh_books(book_ids)
+    return fixed
+
+
+def summary_values(queryset):
+    """`queryset` as `.values()` rows holding the BookSummary columns, computed from the live tables."""
+    return queryset.order_by().annotate(
+        summary_owner_name=F('owner__username'),
+    ).values('id', 'name', 'author_name', 'price', 'discount', 'price_with_discount', 'likes_count', 'rating',
+             'version', 'updated_at', 'summary_owner_name')
+
+
+def refresh_book_summaries(book_ids=None):
+    """
+    Upsert the BookSummary rows of `book_ids` (a list or a `values('pk')` queryset) from the live tables
+    in one statement, or rebuild all of them when `book_ids` is None.
+    Does nothing unless STORE_BOOK_SUMMARY is enabled.
+    """
+    if not settings.STORE_BOOK_SUMMARY:
+        return
+    if book_ids is None:
+        rebuild_book_summaries()
+    else:
+        _write_summaries(Book.objects.filter(pk__in=book_ids), upsert=True)
+
+
+def rebuild_book_summaries():
+    with transaction.atomic():
+        BookSummary.objects.all().delete()
+        _write_summaries(Book.objects.all())
+        invalidate_all()
+    return BookSummary.objects.count()
+
+
+def _write_summaries(queryset, upsert=False):
+    query = summary_values(queryset).query
+    columns = [name.replace('summary_', '', 1) for name in (*query.values_select, *query.annotation_select)]
+    select, params = query.sql_with_params()
+
+    quote = connection.ops.quote_name
+    sql = (f'INSERT INTO {quote(BookSummary._meta.db_table)} ({", ".join(quote(column) for column in columns)}) '
+           f'{select}')
+    if upsert:
+        updates = ', '.join(f'{quote(column)} = EXCLUDED.{quote(column)}' for column in columns if column != 'id')
+        sql += f' ON CONFLICT ({quote("id")}) DO UPDATE SET {updates}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+RELATION_VALUES = ('like', 'in_bookmarks', 'rate')
+# Upserts of one relation retried on PostgreSQL while concurrent requests keep creating and deleting it.
+UPSERT_ATTEMPTS = 3
+
+
+def upsert_relation(user_id, book_id, values):
+    """
+    Create or update the (user, book) relation in one statement and apply its book side effects
+    in the same transaction. Returns `(relation, created)`, raises `Book.DoesNotExist` for an unknown book.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            relation, created, old_like, old_rate = _upsert_relation_returning_old(user_id, book_id, values)
+        else:
+            relation, created, old_like, old_rate = _lock_and_upsert_relation(user_id, book_id, values)
+
+        if created or old_like != relation.like or old_rate != relation.rate:
+            update_book_counters(book_id, old_like=old_like, new_like=relation.like,
+                                 old_rate=old_rate, new_rate=relation.rate)
+        invalidate_library(user_id)
+    return relation, created
+
+
+def bulk_upsert_relations(user_id, items):
+    """
+    Upsert many relations of one user in a single statement. Items for the same book are merged in order
+    and every affected book gets its counters updated once. Returns `{book_id: status}`.
+    """
+    merged = {}
+    for item in items:
+        merged.setdefault(item['book_id'], {}).update(
+            (name, value) for name, value in item.items() if name in RELATION_VALUES)
+
+    with transaction.atomic():
+        statuses = write_relations([(user_id, book_id, values) for book_id, values in merged.items()])
+    return {book_id: status for (_, book_id), status in statuses.items()}
+
+
+def write_relations(writes):
+    """
+    Apply `(user_id, book_id, values)` writes, at most one per pair, with multi-row upserts and one counter
+    update per book however many users changed it. Returns `{(user_id, book_id): status}`, to be called
+    in a transaction.
+    """
+    defaults = {'like': False, 'in_bookmarks': False, 'rate': None}
+    user_ids = {user_id for user_id, _, _ in writes}
+    book_ids = {book_id for _, book_id, _ in writes}
+    old = {(row[0], row[1]): dict(zip(RELATION_VALUES, row[2:])) for row in
+           UserBookRelation.objects.select_for_update().filter(user_id__in=user_ids, book_id__in=book_ids)
+           .values_list('user_id', 'book_id', *RELATION_VALUES)}
+
+    statuses, rows, deltas, changed_users = {}, [], {}, set()
+    for user_id, book_id, values in writes:
+        before = old.get((user_id, book_id))
+        after = {**(before or defaults), **values}
+        if before is None:
+            status = 'created'
+        elif before != after:
+            status = 'updated'
+        else:
+            statuses[(user_id, book_id)] = 'unchanged'
+            continue
+        statuses[(user_id, book_id)] = status
+
+        rows.append([user_id, book_id, *(after[name] for name in RELATION_VALUES)])
+        changed_users.add(user_id)
+        before = before or defaults
+        if status == 'created' or before['like'] != after['like'] or before['rate'] != after['rate']:
+            delta = deltas.setdefault(book_id, [0, 0, 0])
+            delta[0] += after['like'] - before['like']
+            delta[1] += (after['rate'] or 0) - (before['rate'] or 0)
+            delta[2] += (after['rate'] is not None) - (before['rate'] is not None)
+
+    for chunk in range(0, len(rows), 500):
+        _bulk_upsert_rows(rows[chunk:chunk + 500])
+    for book_id, (delta_likes, delta_sum, delta_count) in deltas.items():
+        apply_counter_deltas(book_id, delta_likes=delta_likes, delta_sum=delta_sum, delta_count=delta_count)
+    for user_id in changed_users:
+        invalidate_library(user_id)
+    return statuses
+
+
+def enqueue_relation_write(user_id, book_id, values):
+    """
+    Queue relation values for `process_relation_writes`, merged into the values already queued for the
+    same (user, book). Returns the merged values, raises `Book.DoesNotExist` for an unknown book.
+    """
+    with transaction.atomic():
+        if not Book.objects.filter(pk=book_id).exists():
+            raise Book.DoesNotExist()
+        pending, created = PendingRelationWrite.objects.select_for_update().get_or_create(
+            user_id=user_id, book_id=book_id, defaults={'values': values})
+        if not created:
+            pending.values = {**pending.values, **values}
+            pending.save(update_fields=['values'])
+    return pending.values
+
+
+def process_relation_writes(batch_size=500, delay=0):
+    """
+    Apply up to `batch_size` queued relation writes that have waited at least `delay` seconds,
+    so repeated writes to one relation and votes on one hot book land as a single change. Returns the number applied.
+    """
+    with transaction.atomic():
+        pending = list(PendingRelationWrite.objects.select_for_update(skip_locked=True).filter(
+            enqueued_at__lte=timezone.now() - timedelta(seconds=delay)).order_by('enqueued_at')[:batch_size])
+        if pending:
+            write_relations([(write.user_id, write.book_id, write.values) for write in pending])
+            PendingRelationWrite.objects.filter(pk__in=[write.pk for write in pending]).delete()
+    return len(pending)
+
+
+def user_library(user_id):
+    """The ids of the books a user liked, bookmarked and rated, sorted, with `rates` lined up with `rated`."""
+    library = {'liked': [], 'bookmarked': [], 'rated': [], 'rates': []}
+    relations = UserBookRelation.objects.filter(
+        Q(like=True) | Q(in_bookmarks=True) | Q(rate__isnull=False), user_id=user_id,
+    ).order_by('book_id').values_list('book_id', 'like', 'in_bookmarks', 'rate')
+    for book_id, like, in_bookmarks, rate in relations:
+        if like:
+            library['liked'].append(book_id)
+        if in_bookmarks:
+            library['bookmarked'].append(book_id)
+        if rate is not None:
+            library['rated'].append(book_id)
+            library['rates'].append(rate)
+    return library
+
+
+def delta_encode(ids):
+    """[3, 10, 12] -> [3, 7, 2]: gaps between sorted ids are small numbers, which keeps big lists short."""
+    return [current - previous for previous, current in zip([0, *ids], ids)]
+
+
+def _bulk_upsert_rows(rows):
+    quote = connection.ops.quote_name
+    columns = ['user_id', 'book_id', *RELATION_VALUES]
+    updates = ', '.join(f'{quote(name)} = EXCLUDED.{quote(name)}' for name in RELATION_VALUES)
+    placeholders = ', '.join(f'({", ".join(["%s"] * len(columns))})' for _ in rows)
+    sql = (f'INSERT INTO {quote(UserBookRelation._meta.db_table)} ({", ".join(quote(column) for column in columns)}) '
+           f'VALUES {placeholders} ON CONFLICT ({quote("user_id")}, {quote("book_id")}) DO UPDATE SET {updates}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+
+
+def _upsert_sql(values):
+    quote = connection.ops.quote_name
+    meta = UserBookRelation._meta
+    fields = [meta.get_field(name) for name in ('user', 'book', *RELATION_VALUES)]
+    casts = ', '.join(f'CAST(%s AS {field.db_type(connection)})' for field in fields)
+    # Without values the conflict branch still has to touch the row for RETURNING to yield it.
+    updates = [f'{quote(name)} = EXCLUDED.{quote(name)}' for name in RELATION_VALUES if name in values]
+    updates = updates or [f'{quote("user_id")} = EXCLUDED.{quote("user_id")}']
+    returning = ', '.join(quote(field.column) for field in meta.concrete_fields)
+    # Selecting the row only when the book exists turns an unknown book into an empty result
+    # instead of a foreign key error that may be deferred until commit.
+    sql = (f'INSERT INTO {quote(meta.db_table)} ({", ".join(quote(field.column) for field in fields)}) '
+           f'SELECT {casts} WHERE EXISTS (SELECT 1 FROM {quote(Book._meta.db_table)} WHERE {quote("id")} = %s) '
+           f'ON CONFLICT ({quote("user_id")}, {quote("book_id")}) DO UPDATE SET {", ".join(updates)} '
+           f'RETURNING {returning}')
+    defaults = {'like': False, 'in_bookmarks': False, 'rate': None, **values}
+    return sql, lambda user_id, book_id: [user_id, book_id, *(defaults[name] for name in RELATION_VALUES), book_id]
+
+
+def _relation_from_row(row):
+    meta = UserBookRelation._meta
+    return UserBookRelation.from_db(connection.alias, [field.attname for field in meta.concrete_fields], row)
+
+
+def _upsert_relation_returning_old(user_id, book_id, values):
+    """
+    `_lock_and_upsert_relation` for PostgreSQL, which also tells from `xmax` whether the upsert inserted the row:
+    one a concurrent request created after the lock found nothing has no old values to diff against, so that
+    attempt is rolled back and run again, this time locking the row.
+    """
+    upsert, params = _upsert_sql(values)
+    sql = f'{upsert}, xmax = 0 AS inserted'
+
+    for _ in range(UPSERT_ATTEMPTS):
+        with transaction.atomic(), connection.cursor() as cursor:
+            old = _lock_relation(user_id, book_id)
+            cursor.execute(sql, params(user_id, book_id))
+            result = cursor.fetchone()
+            if result is None:
+                raise Book.DoesNotExist()
+            *row, inserted = result
+            if inserted or old is not None:
+                break
+            transaction.set_rollback(True)
+    else:
+        raise OperationalError(f'The relation of user {user_id} to book {book_id} kept changing during the upsert.')
+
+    if inserted:
+        return _relation_from_row(row), True, False, None
+    return _relation_from_row(row), False, *old
+
+
+def _lock_relation(user_id, book_id):
+    return UserBookRelation.objects.select_for_update().filter(
+        user_id=user_id, book_id=book_id).values_list('like', 'rate').first()
+
+
+def _lock_and_upsert_relation(user_id, book_id, values):
+    old = _lock_relation(user_id, book_id)
+    sql, params = _upsert_sql(values)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params(user_id, book_id))
+        row = cursor.fetchone()
+    if row is None:
+        raise Book.DoesNotExist()
+
+    if old is None:
+        return _relation_from_row(row), True, False, None
+    return _relation_from_row(row), False, *old
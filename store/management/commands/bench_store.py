@@ -0,0 +1,69 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store import bench
+
+
+class Command(BaseCommand):
+    help = 'Run request scenarios against the seeded database and report latency percentiles and query counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help='Scenarios to run, all of them by default.')
+        parser.add_argument('--list', action='store_true', help='List the scenarios and exit.')
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=10, help='Untimed requests before each scenario.')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Requests in flight at once. SQLite serializes writes, so use PostgreSQL above 1.')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the response cache between requests instead of clearing it.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', help='JSON results of a previous run to compare with.')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for scenario in bench.SCENARIOS.values():
+                self.stdout.write(f'{scenario.name:<26}{scenario.description}')
+            return
+
+        names = options['scenarios'] or list(bench.SCENARIOS)
+        unknown = [name for name in names if name not in bench.SCENARIOS]
+        if unknown:
+            raise CommandError(f'Unknown scenario(s): {", ".join(unknown)}.')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING('DEBUG is on, timings include its overhead.'))
+
+        try:
+            runner = bench.Bench(options['requests'], options['warmup'], options['concurrency'],
+                                 options['warm_cache'], options['seed'])
+        except ValueError as e:
+            raise CommandError(e)
+        results = runner.run(names)
+
+        self.stdout.write(f'{"scenario":<26}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+                          f'{"queries":>9}{"errors":>8}')
+        for name, result in results['scenarios'].items():
+            self.stdout.write(f'{name:<26}{_format(result["throughput"]):>10}{_format(result["p50_ms"]):>10}'
+                              f'{_format(result["p95_ms"]):>10}{_format(result["p99_ms"]):>10}'
+                              f'{_format(result["queries"]):>9}{result["errors"]:>8}')
+
+        if baseline is not None:
+            self.stdout.write(f'\nCompared with {baseline["meta"].get("commit") or options["compare"]}:')
+            for name, metric, old, new, change in bench.compare(baseline, results):
+                change = 'n/a' if change is None else f'{change:+.1f}%'
+                self.stdout.write(f'{name:<26}{metric:<12}{_format(old):>10} -> {_format(new):<10}{change:>9}')
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}.'))
+
+
+def _format(value):
+    return '-' if value is None else f'{value:.2f}'
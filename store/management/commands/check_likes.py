@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from store.logic import likes_drift, rebuild_likes_count
+
+
+class Command(BaseCommand):
+    help = 'Compare the denormalized likes_count of every book with its relations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite the counters that are out of sync.')
+
+    def handle(self, *args, **options):
+        drifted = list(likes_drift().values_list('id', 'likes_count', 'expected_likes'))
+        for book_id, likes_count, expected in drifted:
+            self.stdout.write(f'Book {book_id}: likes_count={likes_count}, expected {expected}')
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All like counters are consistent.'))
+        elif options['fix']:
+            fixed = rebuild_likes_count([book_id for book_id, _, _ in drifted])
+            self.stdout.write(self.style.SUCCESS(f'Fixed {fixed} book(s).'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(drifted)} book(s) out of sync, run with --fix to repair.'))
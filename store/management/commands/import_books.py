@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from store import transfer
+
+
+class Command(BaseCommand):
+    help = 'Import books from a CSV or JSON Lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=transfer.FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--owner', help='Username of the owner of the imported books.')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or transfer.guess_format(options['path'])
+        if fmt is None:
+            raise CommandError('Unknown file format, pass --format.')
+
+        owner = None
+        if options['owner']:
+            try:
+                owner = User.objects.get(username=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError(f'User "{options["owner"]}" does not exist.')
+
+        with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+            result = transfer.import_books(transfer.read_rows(lines, fmt), owner=owner,
+                                           chunk_size=options['chunk_size'])
+
+        for error in result['errors']:
+            self.stdout.write(f'Line {error["line"]}: {error["errors"]}')
+        message = f'Imported {result["created"]} book(s), {result["failed"]} row(s) failed.'
+        self.stdout.write(self.style.WARNING(message) if result['failed'] else self.style.SUCCESS(message))
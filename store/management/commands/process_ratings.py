@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.logic import process_pending_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the ratings queued while STORE_RATING_MODE is "deferred".'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--delay', type=float, default=1.0,
+                            help='Seconds a queued book waits, so a burst of votes is handled at once.')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained.')
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                processed = process_pending_ratings(options['batch_size'], options['delay'])
+                total += processed
+                if processed:
+                    self.stdout.write(f'Recomputed {processed} rating(s).')
+                if processed < options['batch_size']:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Done, {total} rating(s) recomputed.'))
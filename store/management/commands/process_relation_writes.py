@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.logic import process_relation_writes
+
+
+class Command(BaseCommand):
+    help = 'Apply the relation writes queued while STORE_RELATION_WRITE_MODE is "coalesced".'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--delay', type=float, default=1.0,
+                            help='Seconds a queued write waits, so repeated writes to a relation are merged.')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained.')
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                processed = process_relation_writes(options['batch_size'], options['delay'])
+                total += processed
+                if processed:
+                    self.stdout.write(f'Applied {processed} relation write(s).')
+                if processed < options['batch_size']:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Done, {total} relation write(s) applied.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store import authors
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-author statistics from the books.'
+
+    def handle(self, *args, **options):
+        rebuilt = authors.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the statistics of {rebuilt} author(s).'))
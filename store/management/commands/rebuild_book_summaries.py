@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store.logic import rebuild_book_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the BookSummary read model from the books and their relations.'
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_book_summaries()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} book summary row(s).'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store import leaderboards
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the most liked and best rated leaderboards from the books.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=leaderboards.KINDS, help='Only rebuild the boards of one kind.')
+
+    def handle(self, *args, **options):
+        rebuilt = leaderboards.rebuild([options['kind']] if options['kind'] else leaderboards.KINDS)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} leaderboard(s).'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store.logic import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the rating aggregates of every book from its user relations.'
+
+    def handle(self, *args, **options):
+        drifted = rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Ratings rebuilt, {drifted} book(s) had drifted.'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from store import bench
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with users, books and relations for `bench_store`.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--relations-per-user', type=int, default=20,
+                            help='Average number of books each user likes, rates or bookmarks.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same data.')
+        parser.add_argument('--clear', action='store_true', help='Delete the previously seeded users and books first.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted = bench.clear()
+            self.stdout.write(f'Deleted {deleted} object(s).')
+        counts = bench.seed(options['books'], options['users'], options['relations_per_user'], options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {counts["users"]} user(s), {counts["books"]} book(s) and {counts["relations"]} relation(s).'))
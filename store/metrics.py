@@ -0,0 +1,213 @@
+"""
+Lightweight request instrumentation for production.
+
+Every request is counted with its latency. A STORE_METRICS_SAMPLE_RATE share of them also records the
+number of queries, DB time, serialization time of the views using `SerializeTimingMixin` and render time,
+and reports them in a `Server-Timing` header.
+`metrics_view` exposes the numbers in the Prometheus text format. They are kept per process, so a
+scraper sees each worker separately, the same as with LocMemCache.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Timing:
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = None
+        self.view_start = None
+        self.render = 0.0
+        self.render_start = None
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+    def view_started(self):
+        self.view_start = (time.perf_counter(), self.db)
+
+    def view_finished(self):
+        start, db = self.view_start
+        self.serialize = time.perf_counter() - start - (self.db - db)
+
+    def rendered(self, response):
+        self.render = time.perf_counter() - self.render_start
+
+    def server_timing(self, total):
+        serialize = '' if self.serialize is None else f'serialize;dur={self.serialize * 1000:.2f}, '
+        return (f'db;dur={self.db * 1000:.2f};desc="{self.queries} queries", {serialize}'
+                f'render;dur={self.render * 1000:.2f}, total;dur={total * 1000:.2f}')
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = Counter()
+        self.latency_buckets = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+        self.latency_sum = Counter()
+        self.latency_count = Counter()
+        self.sampled = Counter()
+        self.queries = Counter()
+        self.db_seconds = Counter()
+        self.serialize_seconds = Counter()
+        self.render_seconds = Counter()
+
+    def observe(self, endpoint, method, status, duration, timing=None):
+        key = (endpoint, method)
+        with self.lock:
+            self.requests[(endpoint, method, status)] += 1
+            self.latency_sum[key] += duration
+            self.latency_count[key] += 1
+            buckets = self.latency_buckets[key]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+            if timing is not None:
+                self.sampled[key] += 1
+                self.queries[key] += timing.queries
+                self.db_seconds[key] += timing.db
+                if timing.serialize is not None:
+                    self.serialize_seconds[key] += timing.serialize
+                self.render_seconds[key] += timing.render
+
+    def render(self):
+        with self.lock:
+            lines = [
+                '# HELP store_requests_total Requests handled.',
+                '# TYPE store_requests_total counter',
+                *(f'store_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}'
+                  for (endpoint, method, status), count in sorted(self.requests.items())),
+                '# HELP store_request_duration_seconds Time spent handling requests.',
+                '# TYPE store_request_duration_seconds histogram',
+            ]
+            for key, buckets in sorted(self.latency_buckets.items()):
+                labels = {'endpoint': key[0], 'method': key[1]}
+                lines.extend(f'store_request_duration_seconds_bucket{_labels(**labels, le=bound)} {value}'
+                             for bound, value in zip(LATENCY_BUCKETS, buckets))
+                lines.extend([
+                    f'store_request_duration_seconds_bucket{_labels(**labels, le="+Inf")} {self.latency_count[key]}',
+                    f'store_request_duration_seconds_sum{_labels(**labels)} {self.latency_sum[key]}',
+                    f'store_request_duration_seconds_count{_labels(**labels)} {self.latency_count[key]}',
+                ])
+
+            for name, values, help_text in (
+                    ('store_sampled_requests_total', self.sampled, 'Requests sampled for the counters below.'),
+                    ('store_db_queries_total', self.queries, 'Queries run by sampled requests.'),
+                    ('store_db_duration_seconds_total', self.db_seconds, 'DB time of sampled requests.'),
+                    ('store_serialize_duration_seconds_total', self.serialize_seconds,
+                     'Time sampled requests spent in the view outside the DB, serializing for the most part.'),
+                    ('store_render_duration_seconds_total', self.render_seconds,
+                     'Time sampled requests spent encoding the response body.')):
+                lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} counter'])
+                lines.extend(f'{name}{_labels(endpoint=endpoint, method=method)} {value}'
+                             for (endpoint, method), value in sorted(values.items()))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """
+    Keep it first in MIDDLEWARE so the latency covers the other middleware too. It runs natively under
+    ASGI, where it only sees the queries of views running on the request's thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks the instance as a coroutine function for the handler, like Django's MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        start, timing = self.start(request)
+        with self.instrument(timing):
+            response = self.get_response(request)
+        return self.finish(request, response, start, timing)
+
+    async def __acall__(self, request):
+        start, timing = self.start(request)
+        with self.instrument(timing):
+            response = await self.get_response(request)
+        return self.finish(request, response, start, timing)
+
+    def start(self, request):
+        timing = Timing() if random.random() < settings.STORE_METRICS_SAMPLE_RATE else None
+        request.metrics_timing = timing
+        return time.perf_counter(), timing
+
+    def instrument(self, timing):
+        stack = ExitStack()
+        if timing is not None:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timing.record_query))
+        return stack
+
+    def finish(self, request, response, start, timing):
+        duration = time.perf_counter() - start
+        endpoint = request.resolver_match.view_name if request.resolver_match else 'unmatched'
+        metrics.observe(endpoint, request.method, response.status_code, duration, timing)
+        if timing is not None:
+            response['Server-Timing'] = timing.server_timing(duration)
+        return response
+
+    def process_template_response(self, request, response):
+        timing = getattr(request, 'metrics_timing', None)
+        if timing is not None:
+            timing.render_start = time.perf_counter()
+            response.add_post_render_callback(timing.rendered)
+        return response
+
+
+class SerializeTimingMixin:
+    """
+    For APIViews. DRF serializes inside the view, before the response is rendered, so the time the view
+    spends outside the DB is reported as the `serialize` part of sampled requests.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        timing = getattr(request, 'metrics_timing', None)
+        if timing is not None:
+            timing.view_started()
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        timing = getattr(request, 'metrics_timing', None)
+        if timing is not None and timing.view_start is not None:
+            timing.view_finished()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.STORE_METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.14 on 2026-10-17 19:22
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Sum
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    aggregates = UserBookRelation.objects.filter(rate__isnull=False).values('book').annotate(
+        rating=Avg('rate'), rating_sum=Sum('rate'), rating_count=Count('rate'))
+    for aggregate in aggregates.iterator():
+        Book.objects.filter(pk=aggregate['book']).update(
+            rating=aggregate['rating'], rating_sum=aggregate['rating_sum'], rating_count=aggregate['rating_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_auto_20261017_1922'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
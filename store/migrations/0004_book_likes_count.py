@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-17 19:23
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_likes_count(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    likes = UserBookRelation.objects.filter(like=True).values('book').annotate(total=Count('id'))
+    for row in likes.iterator():
+        Book.objects.filter(pk=row['book']).update(likes_count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_book_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_likes_count, migrations.RunPython.noop),
+    ]
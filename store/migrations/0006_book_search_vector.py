@@ -0,0 +1,55 @@
+# Generated by Django 3.1.14 on 2026-10-17 19:31
+
+from django.db import migrations
+
+SEARCH_DOCUMENT = """
+    setweight(to_tsvector('simple', coalesce({row}.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({row}.author_name, '')), 'B') ||
+    setweight(to_tsvector('simple', {row}.price::text), 'C')
+"""
+
+CREATE_SQL = f"""
+ALTER TABLE store_book ADD COLUMN search_vector tsvector;
+
+CREATE FUNCTION store_book_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_DOCUMENT.format(row='NEW')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_book_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, author_name, price ON store_book
+    FOR EACH ROW EXECUTE PROCEDURE store_book_search_vector_update();
+
+UPDATE store_book SET search_vector = {SEARCH_DOCUMENT.format(row='store_book')};
+
+CREATE INDEX store_book_search_vector_gin ON store_book USING gin (search_vector);
+"""
+
+DROP_SQL = """
+DROP TRIGGER IF EXISTS store_book_search_vector_trigger ON store_book;
+DROP FUNCTION IF EXISTS store_book_search_vector_update();
+ALTER TABLE store_book DROP COLUMN IF EXISTS search_vector;
+"""
+
+
+def create_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_book_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_vector, drop_search_vector),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.1.14 on 2026-10-17 19:29
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Max, Q, Sum
+
+
+def remove_duplicate_relations(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    duplicates = UserBookRelation.objects.values('user', 'book').annotate(
+        total=Count('id'), keep=Max('id')).filter(total__gt=1)
+
+    book_ids = set()
+    for duplicate in duplicates.iterator():
+        UserBookRelation.objects.filter(user=duplicate['user'], book=duplicate['book']).exclude(
+            pk=duplicate['keep']).delete()
+        book_ids.add(duplicate['book'])
+
+    for book_id in book_ids:
+        aggregate = UserBookRelation.objects.filter(book=book_id).aggregate(
+            rating=Avg('rate'), rating_sum=Sum('rate'), rating_count=Count('rate'),
+            likes_count=Count('id', filter=Q(like=True)))
+        aggregate['rating_sum'] = aggregate['rating_sum'] or 0
+        Book.objects.filter(pk=book_id).update(**aggregate)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_book_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_relations, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author_name', 'id'], name='store_book_author_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(like=True), fields=['book'], name='store_relation_liked_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='userbookrelation',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='store_relation_user_book_uniq'),
+        ),
+    ]
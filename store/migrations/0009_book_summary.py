@@ -0,0 +1,37 @@
+# Generated by Django 3.1.14 on 2026-10-17 19:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_pending_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSummary',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('author_name', models.CharField(max_length=255)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=7)),
+                ('discount', models.DecimalField(decimal_places=2, max_digits=7, null=True)),
+                ('price_with_discount', models.DecimalField(decimal_places=2, max_digits=7, null=True)),
+                ('owner_name', models.CharField(max_length=150, null=True)),
+                ('likes_count', models.PositiveIntegerField(default=0)),
+                ('rating', models.DecimalField(decimal_places=2, max_digits=3, null=True)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='booksummary',
+            index=models.Index(fields=['price', 'id'], name='store_summary_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booksummary',
+            index=models.Index(fields=['author_name', 'id'], name='store_summary_author_id_idx'),
+        ),
+    ]
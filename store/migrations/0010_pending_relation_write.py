@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-17 19:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store', '0009_book_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingRelationWrite',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('values', models.JSONField()),
+                ('enqueued_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='pendingrelationwrite',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='store_pending_write_user_book_uniq'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.1.14 on 2026-10-17 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_leaderboards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('author_name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('books_count', models.PositiveIntegerField(default=0)),
+                ('price_sum', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('average_price', models.DecimalField(decimal_places=2, max_digits=7)),
+                ('total_likes', models.PositiveIntegerField(default=0)),
+                ('votes_sum', models.PositiveIntegerField(default=0)),
+                ('votes_count', models.PositiveIntegerField(default=0)),
+                ('average_rating', models.DecimalField(decimal_places=2, max_digits=3, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='authorstats',
+            index=models.Index(fields=['books_count', 'author_name'], name='store_author_books_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='authorstats',
+            index=models.Index(fields=['average_price', 'author_name'], name='store_author_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='authorstats',
+            index=models.Index(fields=['total_likes', 'author_name'], name='store_author_likes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='authorstats',
+            index=models.Index(fields=['average_rating', 'author_name'], name='store_author_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.1.14 on 2026-10-17 20:07
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_price_with_discount(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    Book.objects.filter(discount__isnull=False).update(price_with_discount=F('price') - F('discount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_author_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='price_with_discount',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=7, null=True),
+        ),
+        migrations.RunPython(fill_price_with_discount, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price_with_discount', 'id'], name='store_book_discount_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['rating', 'id'], name='store_book_rating_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booksummary',
+            index=models.Index(fields=['price_with_discount', 'id'], name='store_summary_discount_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booksummary',
+            index=models.Index(fields=['rating', 'id'], name='store_summary_rating_id_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 
 class Book(models.Model):
@@ -9,11 +10,56 @@ class Book(models.Model):
     owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='my_books')
     readers = models.ManyToManyField(User, through='UserBookRelation', related_name='books')
     discount = models.DecimalField(max_digits=7, decimal_places=2, blank=True, null=True)
+    # Stored so that price ranges after discount compare an indexed column, kept by `save`.
+    price_with_discount = models.DecimalField(max_digits=7, decimal_places=2, null=True, editable=False)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=None, null=True)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    likes_count = models.PositiveIntegerField(default=0)
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    COUNTER_FIELDS = ('rating', 'rating_sum', 'rating_count', 'likes_count')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+            models.Index(fields=['author_name', 'id'], name='store_book_author_id_idx'),
+            models.Index(fields=['price_with_discount', 'id'], name='store_book_discount_id_idx'),
+            models.Index(fields=['rating', 'id'], name='store_book_rating_id_idx'),
+        ]
 
     def __str__(self):
         return f'ID {self.id}: {self.name}'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Read without loading a deferred author_name, the statistics of the previous author follow a move.
+        self.old_author_name = self.__dict__.get('author_name')
+
+    def set_price_with_discount(self):
+        """Compute the stored `price_with_discount`, to be called by code that skips `save`, like `bulk_create`."""
+        to_python = self._meta.get_field('price').to_python
+        self.price_with_discount = None if self.discount is None else to_python(self.price) - to_python(self.discount)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            # The counters only move through the F() updates of store.logic, writing them back as loaded
+            # would undo the relation writes that landed since this instance was read.
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+        if update_fields is None or {'price', 'discount'} & set(update_fields):
+            self.set_price_with_discount()
+            if update_fields is not None:
+                update_fields = {*update_fields, 'price_with_discount'}
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version', 'updated_at'}
+        super().save(*args, **kwargs)
+        self.old_author_name = self.author_name
+
 
 class UserBookRelation(models.Model):
     RATE_CHOICES = (
@@ -29,18 +75,138 @@ class UserBookRelation(models.Model):
     in_bookmarks = models.BooleanField(default=False)
     rate = models.PositiveSmallIntegerField(choices=RATE_CHOICES, null=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='store_relation_user_book_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['book'], condition=models.Q(like=True), name='store_relation_liked_idx'),
+        ]
+
     def __str__(self):
         return f' user: {self.user}, {self.book}, rate: {self.rate}'
 
     def __init__(self, *args, **kwargs):
         super(UserBookRelation, self).__init__(*args, **kwargs)
         self.old_rate = self.rate
+        self.old_like = self.like
 
     def save(self, *args, **kwargs):
         creating = not self.pk
+        old_rate = None if creating else self.old_rate
+        old_like = False if creating else self.old_like
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            from store.cache import invalidate_library
+            invalidate_library(self.user_id)
+            if creating or old_rate != self.rate or old_like != self.like:
+                from store.logic import update_book_counters
+                update_book_counters(self.book_id, old_like=old_like, new_like=self.like,
+                                     old_rate=old_rate, new_rate=self.rate)
+
+        self.old_rate = self.rate
+        self.old_like = self.like
+
+
+class PendingRating(models.Model):
+    """A book whose rating has to be recomputed by the `process_ratings` worker (STORE_RATING_MODE = 'deferred')."""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    enqueued_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+
+class PendingRelationWrite(models.Model):
+    """
+    Relation values queued while STORE_RELATION_WRITE_MODE is 'coalesced', merged per (user, book)
+    until `process_relation_writes` applies them.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    values = models.JSONField()
+    enqueued_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='store_pending_write_user_book_uniq'),
+        ]
+
+
+class BookSummary(models.Model):
+    """
+    Read model holding every column of the book list, kept in sync by `store.logic.refresh_book_summaries`
+    while STORE_BOOK_SUMMARY is enabled. `id` is the id of the mirrored book.
+    """
+    id = models.IntegerField(primary_key=True)
+    name = models.CharField(max_length=255)
+    author_name = models.CharField(max_length=255)
+    price = models.DecimalField(max_digits=7, decimal_places=2)
+    discount = models.DecimalField(max_digits=7, decimal_places=2, null=True)
+    price_with_discount = models.DecimalField(max_digits=7, decimal_places=2, null=True)
+    owner_name = models.CharField(max_length=150, null=True)
+    likes_count = models.PositiveIntegerField(default=0)
+    rating = models.DecimalField(max_digits=3, decimal_places=2, null=True)
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['price', 'id'], name='store_summary_price_id_idx'),
+            models.Index(fields=['author_name', 'id'], name='store_summary_author_id_idx'),
+            models.Index(fields=['price_with_discount', 'id'], name='store_summary_discount_id_idx'),
+            models.Index(fields=['rating', 'id'], name='store_summary_rating_id_idx'),
+        ]
+
+
+class Leaderboard(models.Model):
+    """
+    One top-N board of `store.leaderboards`, `scope` being an author name or '' for the whole catalogue.
+    `complete` boards hold every book that qualifies for them.
+    """
+    kind = models.CharField(max_length=16)
+    scope = models.CharField(max_length=255, blank=True)
+    complete = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'scope'], name='store_leaderboard_kind_scope_uniq'),
+        ]
+
+
+class LeaderboardEntry(models.Model):
+    leaderboard = models.ForeignKey(Leaderboard, on_delete=models.CASCADE, related_name='entries')
+    # Entries of deleted books are removed by a signal while STORE_LEADERBOARDS is on, sparing every
+    # book delete a cascade query.
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    score = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['leaderboard', 'book'], name='store_lb_entry_board_book_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['leaderboard', '-score', 'book'], name='store_lb_entry_rank_idx'),
+        ]
+
+
+class AuthorStats(models.Model):
+    """
+    Statistics of the books of one `author_name`, kept by `store.authors` while STORE_AUTHOR_STATS is enabled.
+    `average_rating` is weighted by votes: the average of every rate given to the author's books.
+    """
+    author_name = models.CharField(max_length=255, primary_key=True)
+    books_count = models.PositiveIntegerField(default=0)
+    price_sum = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    average_price = models.DecimalField(max_digits=7, decimal_places=2)
+    total_likes = models.PositiveIntegerField(default=0)
+    votes_sum = models.PositiveIntegerField(default=0)
+    votes_count = models.PositiveIntegerField(default=0)
+    average_rating = models.DecimalField(max_digits=3, decimal_places=2, null=True)
 
-        if self.old_rate != self.rate or creating:
-            from store.logic import set_rating
-            set_rating(self.book)
+    class Meta:
+        indexes = [
+            models.Index(fields=['books_count', 'author_name'], name='store_author_books_idx'),
+            models.Index(fields=['average_price', 'author_name'], name='store_author_price_idx'),
+            models.Index(fields=['total_likes', 'author_name'], name='store_author_likes_idx'),
+            models.Index(fields=['average_rating', 'author_name'], name='store_author_rating_idx'),
+        ]
@@ -0,0 +1,143 @@
+from base64 import b64decode
+from urllib import parse
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination, Cursor, _reverse_ordering
+
+
+class BookKeysetPagination(CursorPagination):
+    """
+    Keyset pagination over the (ordering field, id) pair.
+
+    Pages are selected with a `WHERE (field, id) > (last seen values)` seek instead of OFFSET,
+    so the cost of a page does not depend on its depth and cursors stay stable across inserts.
+    Pagination is only applied when the client sends `cursor` or `page_size`, so plain
+    `GET /book/` keeps returning the whole list. Paginated lists take one `ordering` field.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    ordering = 'id'
+    tiebreaker = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        query_params = request.query_params
+        if self.cursor_query_param not in query_params and self.page_size_query_param not in query_params:
+            return None
+
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.model = queryset.model
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            _, reverse, current_position = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self.get_seek_filter(current_position, reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+
+        has_following_position = len(results) > len(self.page)
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = has_following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None
+
+        # The next page seeks past the last row shown and the previous page seeks back from the first one.
+        if self.page:
+            self.next_position = self._get_position_from_instance(self.page[-1], self.ordering)
+            self.previous_position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            self.next_position = self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        requested = super().get_ordering(request, queryset, view)
+        ordering = [field for field in requested if field.lstrip('-') != self.tiebreaker]
+        if not ordering:
+            return tuple(requested[:1]) or (self.tiebreaker,)
+        if len(ordering) > 1:
+            # Cursors only hold the ordering field and the tiebreaker, further fields would be dropped.
+            message = f'Paginated lists are ordered by one field, got {", ".join(ordering)}.'
+            raise ValidationError({'ordering': [message]})
+        descending = ordering[0].startswith('-')
+        return ordering[0], ('-' if descending else '') + self.tiebreaker
+
+    def get_seek_filter(self, position, reverse):
+        seek = Q()
+        equal = {}
+        for order, value in zip(self.ordering, position):
+            attr = order.lstrip('-')
+            lookup = 'lt' if reverse != order.startswith('-') else 'gt'
+            seek |= Q(**equal, **{f'{attr}__{lookup}': value})
+            equal[attr] = value
+        # A bound on the leading column lets the planner turn the OR into an index range scan.
+        leading = self.ordering[0].lstrip('-')
+        lookup = 'lte' if reverse != self.ordering[0].startswith('-') else 'gte'
+        return Q(**{f'{leading}__{lookup}': position[0]}) & seek
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = [self._to_python(order, value)
+                        for order, value in zip(self.ordering, tokens['p'])]
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def _to_python(self, order, value):
+        try:
+            field = self.model._meta.get_field(order.lstrip('-'))
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+    def _get_position_from_instance(self, instance, ordering):
+        return [str(instance[order.lstrip('-')] if isinstance(instance, dict) else getattr(instance, order.lstrip('-')))
+                for order in ordering]
+
+
+class AuthorKeysetPagination(BookKeysetPagination):
+    """BookKeysetPagination over the (ordering field, author_name) pair, author names being unique."""
+    ordering = 'author_name'
+    tiebreaker = 'author_name'
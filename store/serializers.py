@@ -1,31 +1,142 @@
-from django.contrib.auth.models import User
+from django.db.models import OuterRef, Subquery
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 
-from store.models import Book, UserBookRelation
+from store.models import AuthorStats, Book, UserBookRelation
 
+READERS_ALL = 'all'
+READERS_NONE = 'none'
+READERS_COUNT = 'count'
+# Added by ?with_my_state=1, the caller's own relation to each book.
+MY_STATE_FIELDS = ('my_like', 'my_in_bookmarks', 'my_rate')
 
-class BookReaderSerializer(ModelSerializer):
-    class Meta:
-        model = User
-        fields = ('first_name', 'last_name')
+
+def reader_relations(limit=None):
+    """The relations naming the readers of books in the order they were made, the first `limit` per book if given."""
+    # UserBookRelation.__init__ reads like and rate, deferring them would load each row again.
+    relations = UserBookRelation.objects.select_related('user').only(
+        'book', 'user', 'like', 'rate', 'user__first_name', 'user__last_name').order_by('id')
+    if isinstance(limit, int):
+        # Picked by the database, so a hot book doesn't load every reader to show a few.
+        first = UserBookRelation.objects.filter(book=OuterRef('book')).order_by('id').values('id')[:limit]
+        relations = relations.filter(id__in=Subquery(first))
+    return relations
+
+
+class BookReadersField(serializers.Field):
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, book):
+        # Prefetched by BookViewSet, written books fetch theirs here.
+        relations = getattr(book, 'reader_relations', None)
+        if relations is None:
+            relations = reader_relations(self.context.get('readers')).filter(book=book)
+        return [{'first_name': relation.user.first_name, 'last_name': relation.user.last_name}
+                for relation in relations]
 
 
 class BooksSerializer(ModelSerializer):
     annotated_likes = serializers.IntegerField(read_only=True)
     price_with_discount = serializers.DecimalField(max_digits=7, decimal_places=2, read_only=True)
     owner_name = serializers.CharField(read_only=True)
-    readers = BookReaderSerializer(many=True, read_only=True)
+    readers = BookReadersField()
+    readers_count = serializers.IntegerField(read_only=True)
+    my_like = serializers.BooleanField(read_only=True)
+    my_in_bookmarks = serializers.BooleanField(read_only=True)
+    my_rate = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Book
         fields = (
             'id', 'name', 'author_name', 'price', 'discount', 'price_with_discount', 'owner_name', 'annotated_likes',
             'rating',
-            'readers')
+            'readers', 'readers_count', *MY_STATE_FIELDS)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        readers = self.context.get('readers', READERS_ALL)
+        if readers in (READERS_NONE, READERS_COUNT):
+            self.fields.pop('readers')
+        if readers != READERS_COUNT:
+            self.fields.pop('readers_count')
+        if not self.context.get('with_my_state'):
+            for name in MY_STATE_FIELDS:
+                self.fields.pop(name)
+
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+class BookValuesSerializer:
+    """
+    Read-only twin of BooksSerializer for lists: builds the same dicts from `.values()` rows
+    and fetches readers with one query, skipping model instances and per-field `to_representation`.
+    """
+    decimal_fields = ('price', 'discount', 'price_with_discount', 'rating')
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        self.fields = list(BooksSerializer(context=self.context).fields)
+
+    def values(self, queryset, *extra):
+        columns = {name for name in self.fields if name != 'readers'} | {'id', *extra}
+        return queryset.prefetch_related(None).values(*columns)
+
+    def to_representation(self, rows):
+        readers = self.get_readers([row['id'] for row in rows]) if 'readers' in self.fields else {}
+        decimals = [name for name in self.decimal_fields if name in self.fields]
+        data = []
+        for row in rows:
+            for name in decimals:
+                if row[name] is not None:
+                    row[name] = f'{row[name]:.2f}'
+            row['readers'] = readers.get(row['id'], [])
+            data.append({name: row[name] for name in self.fields})
+        return data
+
+    def get_readers(self, book_ids):
+        readers = {}
+        relations = reader_relations(self.context.get('readers')).filter(book_id__in=book_ids).values_list(
+            'book_id', 'user__first_name', 'user__last_name')
+        for book_id, first_name, last_name in relations:
+            readers.setdefault(book_id, []).append({'first_name': first_name, 'last_name': last_name})
+        return readers
+
+
+class BookPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves books from `context['books']` when the view has preloaded them,
+    so validating a list of relations does not look up every book separately.
+    """
+
+    def to_internal_value(self, data):
+        books = self.context.get('books')
+        if books is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return books[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
 
 
 class UserBookRelationSerializer(ModelSerializer):
+    book = BookPrimaryKeyField(queryset=Book.objects.all())
+
     class Meta:
         model = UserBookRelation
         fields = ('book', 'like', 'in_bookmarks', 'rate')
+
+
+class AuthorStatsSerializer(ModelSerializer):
+    class Meta:
+        model = AuthorStats
+        fields = ('author_name', 'books_count', 'average_price', 'total_likes', 'average_rating')
@@ -0,0 +1,103 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from store import authors, cache, leaderboards
+from store.logic import refresh_book_summaries, update_book_counters
+from store.models import Book, BookSummary, UserBookRelation
+
+# The Book columns AuthorStats is grouped from.
+AUTHOR_STATS_FIELDS = {'author_name', 'price', 'likes_count', 'rating_sum', 'rating_count'}
+# The User columns book responses show, as owner_name and in readers.
+USER_NAME_FIELDS = {'username', 'first_name', 'last_name'}
+# The books being deleted in this context, whose relations go with them without touching their counters.
+deleting_books = ContextVar('deleting_books', default=frozenset())
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_cache(sender, instance, **kwargs):
+    cache.invalidate_book(instance.pk)
+
+
+@receiver(post_save, sender=Book)
+def refresh_book_summary(sender, instance, **kwargs):
+    refresh_book_summaries([instance.pk])
+
+
+@receiver(post_save, sender=Book)
+def update_leaderboards(sender, instance, update_fields=None, **kwargs):
+    # set_rating saves the rating with update_fields, an author change moves the book between author boards.
+    if update_fields is None or {'author_name', 'likes_count', 'rating', 'rating_count'} & set(update_fields):
+        leaderboards.update_books([instance.pk])
+
+
+@receiver(post_save, sender=Book)
+def refresh_author_stats(sender, instance, update_fields=None, **kwargs):
+    # A book moved to another author leaves its previous author's statistics to regroup too.
+    if update_fields is None or AUTHOR_STATS_FIELDS & set(update_fields):
+        authors.refresh({instance.author_name, instance.old_author_name} - {None})
+
+
+@receiver(post_delete, sender=Book)
+def remove_from_author_stats(sender, instance, **kwargs):
+    authors.refresh([instance.author_name])
+
+
+@receiver(post_delete, sender=Book)
+def remove_from_leaderboards(sender, instance, **kwargs):
+    leaderboards.remove_book(instance.pk, instance.author_name)
+
+
+@receiver(post_delete, sender=Book)
+def invalidate_libraries(sender, instance, **kwargs):
+    # The book's relations skip their own invalidation, so every library that had it goes stale.
+    cache.invalidate_libraries()
+
+
+@receiver(pre_delete, sender=Book)
+def mark_deleting(sender, instance, **kwargs):
+    deleting_books.set(deleting_books.get() | {instance.pk})
+
+
+@receiver(post_delete, sender=Book)
+def unmark_deleting(sender, instance, **kwargs):
+    deleting_books.set(deleting_books.get() - {instance.pk})
+
+
+@receiver(post_delete, sender=UserBookRelation)
+def remove_relation(sender, instance, **kwargs):
+    # Also sent for queryset deletes and the cascade from User, which never call UserBookRelation.delete.
+    if instance.book_id in deleting_books.get():
+        return
+    cache.invalidate_library(instance.user_id)
+    update_book_counters(instance.book_id, old_like=instance.old_like, old_rate=instance.old_rate)
+
+
+@receiver(post_delete, sender=Book)
+def delete_book_summary(sender, instance, **kwargs):
+    if settings.STORE_BOOK_SUMMARY:
+        BookSummary.objects.filter(id=instance.pk).delete()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_names(sender, instance, created=False, update_fields=None, **kwargs):
+    # Any book may show the user, so every cached response goes. Logins only save last_login and keep them.
+    if not created and (update_fields is None or USER_NAME_FIELDS & set(update_fields)):
+        cache.invalidate_all()
+
+
+@receiver(post_save, sender=User)
+def refresh_owner_summaries(sender, instance, created, update_fields=None, **kwargs):
+    if not created and (update_fields is None or 'username' in update_fields):
+        refresh_book_summaries(Book.objects.filter(owner=instance).values('pk'))
+
+
+@receiver(post_delete, sender=User)
+def clear_owner_summaries(sender, instance, **kwargs):
+    # The owner's books were already switched to owner=NULL with a bulk UPDATE, which sends no Book signals.
+    refresh_book_summaries(BookSummary.objects.filter(owner_name=instance.username).values('id'))
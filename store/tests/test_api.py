@@ -1,16 +1,24 @@
 import json
+import threading
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
 from django.db import connection
 from django.db.models import Count, Case, When, Avg, F
+from django.test import TransactionTestCase, override_settings
 from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from django.contrib.auth.models import User
 from rest_framework.exceptions import ErrorDetail
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 
+from store import cache
+from store.logic import process_relation_writes, upsert_relation
 from store.models import Book, UserBookRelation
 from store.serializers import BooksSerializer
+from store.views import BookViewSet
 
 
 class BooksApiTestCase(APITestCase):
@@ -26,10 +34,9 @@ class BooksApiTestCase(APITestCase):
         url = reverse('book-list')
         with CaptureQueriesContext(connection) as queries:
             response = self.client.get(url)
-            self.assertEqual(2, len(queries))
+            self.assertEqual(3, len(queries))
         books = Book.objects.all().annotate(
             owner_name=F('owner__username'),
-            price_with_discount=F('price') - F('discount'),
             annotated_likes=Count(Case(When(userbookrelation__like=True, then=1)))).order_by('id')
         serializer_data = BooksSerializer(books, many=True).data
         self.assertEqual(serializer_data, response.data)
@@ -43,7 +50,6 @@ class BooksApiTestCase(APITestCase):
         response = self.client.get(url, data={'price': 200})
         books = Book.objects.filter(id__in=[self.book2.id, self.book3.id]).annotate(
             owner_name=F('owner__username'),
-            price_with_discount=F('price') - F('discount'),
             annotated_likes=Count(Case(When(userbookrelation__like=True, then=1)))).order_by('id')
         serializer_data = BooksSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
@@ -53,7 +59,6 @@ class BooksApiTestCase(APITestCase):
         url = reverse('book-list')
         books = Book.objects.filter(id__in=[self.book1.id, self.book3.id]).annotate(
             owner_name=F('owner__username'),
-            price_with_discount=F('price') - F('discount'),
             annotated_likes=Count(Case(When(userbookrelation__like=True, then=1)))).order_by('id')
         response = self.client.get(url, data={'search': 'author 1'})
         serializer_data = BooksSerializer(books, many=True).data
@@ -65,7 +70,6 @@ class BooksApiTestCase(APITestCase):
         response = self.client.get(url, data={'ordering': 'name'})
         books = Book.objects.all().annotate(
             owner_name=F('owner__username'),
-            price_with_discount=F('price') - F('discount'),
             annotated_likes=Count(Case(When(userbookrelation__like=True, then=1)))).order_by('id')
         serializer_data = BooksSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
@@ -100,6 +104,26 @@ class BooksApiTestCase(APITestCase):
         self.book1.refresh_from_db()
         self.assertEqual(4000.00, self.book1.price)
 
+    def test_update_keeps_counters(self):
+        user2 = User.objects.create(username='test username2')
+        get_object = BookViewSet.get_object
+
+        def get_object_then_rate(view):
+            book = get_object(view)
+            # A relation write landing after the view loaded the book, before it saves it.
+            upsert_relation(user2.id, book.id, {'like': True, 'rate': 1})
+            return book
+
+        self.client.force_login(self.user)
+        with mock.patch.object(BookViewSet, 'get_object', get_object_then_rate):
+            response = self.client.patch(reverse('book-detail', args=(self.book1.id,)),
+                                         data=json.dumps({'price': '4000.00'}), content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.book1.refresh_from_db()
+        self.assertEqual(Decimal('4000.00'), self.book1.price)
+        self.assertEqual((6, 2, Decimal('3.00')), (self.book1.rating_sum, self.book1.rating_count, self.book1.rating))
+        self.assertEqual(2, self.book1.likes_count)
+
     def test_delete(self):
         self.assertEqual(3, Book.objects.all().count())
         url = reverse('book-detail', args={self.book2.id})
@@ -108,6 +132,29 @@ class BooksApiTestCase(APITestCase):
         self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
         self.assertEqual(2, Book.objects.all().count())
 
+    def test_update_queries(self):
+        url = reverse('book-detail', args=(self.book1.id,))
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, data=json.dumps({'price': '400.00'}), content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        # Select the book, update it and fetch its readers, the owner is the requesting user.
+        self.assertEqual(3, len(queries), '\n'.join(query['sql'] for query in queries))
+        self.assertEqual('350.00', response.data['price_with_discount'])
+        self.assertEqual('test username', response.data['owner_name'])
+        self.assertEqual(1, response.data['annotated_likes'])
+        self.assertEqual([{'first_name': '', 'last_name': ''}], response.data['readers'])
+
+    def test_delete_queries(self):
+        url = reverse('book-detail', args=(self.book1.id,))
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(url)
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        # Select the book and its relations for their delete signals, then delete the relations, its queued rating
+        # and relation writes, and itself.
+        self.assertEqual(6, len(queries), '\n'.join(query['sql'] for query in queries))
+
     def test_update_not_owner(self):
         self.user2 = User.objects.create(username='test username2')
         url = reverse('book-detail', args=(self.book1.id,))
@@ -140,6 +187,15 @@ class BooksApiTestCase(APITestCase):
         self.book1.refresh_from_db()
         self.assertEqual(4000.00, self.book1.price)
 
+    def test_update_not_owner_but_staff_response(self):
+        staff = User.objects.create(username='staff', is_staff=True)
+        self.client.force_authenticate(staff)
+        url = reverse('book-detail', args=(self.book2.id,))
+        response = self.client.patch(url, data=json.dumps({'discount': '20.00'}), content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('test username', response.data['owner_name'])
+        self.assertEqual('180.00', response.data['price_with_discount'])
+
     def test_delete_not_owner(self):
         self.assertEqual(3, Book.objects.all().count())
         self.user2 = User.objects.create(username='test username2')
@@ -182,6 +238,29 @@ class BooksRelationApiTestCase(APITestCase):
         relation = UserBookRelation.objects.get(user=self.user1, book=self.book1)
         self.assertTrue(relation.like)
 
+    def test_like_counter(self):
+        url = reverse('userbookrelation-detail', args=(self.book1.id,))
+        self.client.force_login(self.user1)
+        for like in (True, True, False, False, True):
+            response = self.client.patch(url, data=json.dumps({'like': like}), content_type='application/json')
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.client.force_login(self.user2)
+        self.client.patch(url, data=json.dumps({'like': True}), content_type='application/json')
+        self.book1.refresh_from_db()
+        self.assertEqual(2, self.book1.likes_count)
+
+        UserBookRelation.objects.get(user=self.user2, book=self.book1).delete()
+        self.book1.refresh_from_db()
+        self.assertEqual(1, self.book1.likes_count)
+
+    def test_list_without_relation_join(self):
+        UserBookRelation.objects.create(user=self.user2, book=self.book1, like=True)
+        url = reverse('book-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertNotIn('store_userbookrelation', queries[0]['sql'])
+        self.assertEqual(1, response.data[0]['annotated_likes'])
+
     def test_in_bookmarks(self):
         url = reverse('userbookrelation-detail', args=(self.book2.id,))
         data = {
@@ -214,8 +293,468 @@ class BooksRelationApiTestCase(APITestCase):
         json_data = json.dumps(data)
         self.client.force_login(self.user1)
         response = self.client.patch(url, data=json_data, content_type='application/json')
-        relation = UserBookRelation.objects.get(user=self.user1, book=self.book1)
         self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code, )
         self.assertEqual({'rate': [ErrorDetail(string='"6" is not a valid choice.', code='invalid_choice')]},
                          response.data)
-        self.assertEqual(relation.rate, None)
+        self.assertFalse(UserBookRelation.objects.filter(user=self.user1, book=self.book1).exists())
+
+
+class BooksPaginationApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test username')
+        self.books = [Book.objects.create(name=f'Test book {i}', price=100 + 10 * (i % 3), author_name=f'author{i}',
+                                          owner=self.user) for i in range(7)]
+
+    def get_all_pages(self, data):
+        url = reverse('book-list')
+        ids = []
+        response = self.client.get(url, data=data)
+        while True:
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            ids += [book['id'] for book in response.data['results']]
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_not_paginated_by_default(self):
+        url = reverse('book-list')
+        response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(7, len(response.data))
+
+    def test_pages(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'page_size': 3})
+        self.assertEqual([book.id for book in self.books[:3]], [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['previous'])
+        self.assertEqual([book.id for book in self.books], self.get_all_pages({'page_size': 3}))
+
+    def test_pages_ordering_with_ties(self):
+        expected = [book.id for book in sorted(self.books, key=lambda book: (book.price, book.id))]
+        self.assertEqual(expected, self.get_all_pages({'page_size': 2, 'ordering': 'price'}))
+        expected = [book.id for book in sorted(self.books, key=lambda book: (-book.price, -book.id))]
+        self.assertEqual(expected, self.get_all_pages({'page_size': 2, 'ordering': '-price'}))
+
+    def test_one_ordering_field(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'page_size': 2, 'ordering': 'price,-author_name'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual({'ordering': ['Paginated lists are ordered by one field, got price, -author_name.']},
+                         response.data)
+        # The tiebreaker is always part of the order, naming it is fine.
+        expected = [book.id for book in sorted(self.books, key=lambda book: (book.price, book.id))]
+        self.assertEqual(expected, self.get_all_pages({'page_size': 2, 'ordering': 'price,id'}))
+        # Unpaginated lists still sort on several fields.
+        response = self.client.get(url, data={'ordering': 'price,-author_name'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_previous(self):
+        url = reverse('book-list')
+        first = self.client.get(url, data={'page_size': 3, 'ordering': 'price'})
+        second = self.client.get(first.data['next'])
+        response = self.client.get(second.data['previous'])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(first.data['results'], response.data['results'])
+
+    def test_stable_across_inserts(self):
+        url = reverse('book-list')
+        first = self.client.get(url, data={'page_size': 3})
+        Book.objects.create(name='Test book new', price=50, author_name='author', owner=self.user)
+        second = self.client.get(first.data['next'])
+        self.assertEqual([book.id for book in self.books[3:6]], [book['id'] for book in second.data['results']])
+
+    def test_no_offset(self):
+        url = reverse('book-list')
+        first = self.client.get(url, data={'page_size': 3, 'ordering': 'author_name'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(first.data['next'])
+            self.assertEqual(3, len(queries))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertFalse([query for query in queries if 'OFFSET' in query['sql'].upper()])
+
+    def test_invalid_cursor(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'cursor': 'garbage'})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+
+class BooksReadersApiTestCase(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='test username', first_name='Ivan', last_name='Petrov')
+        self.user2 = User.objects.create(username='test username2', first_name='Shpak', last_name='Shpakov')
+        self.book1 = Book.objects.create(name='Test book 1', price=100, author_name='author1', owner=self.user1)
+        self.book2 = Book.objects.create(name='Test book 2', price=200, author_name='author2', owner=self.user1)
+        UserBookRelation.objects.create(user=self.user1, book=self.book1, like=True)
+        UserBookRelation.objects.create(user=self.user2, book=self.book1)
+        self.url = reverse('book-list')
+
+    def test_all(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        readers_sql = queries[-1]['sql']
+        self.assertIn('"first_name"', readers_sql)
+        self.assertNotIn('"password"', readers_sql)
+        self.assertEqual([{'first_name': 'Ivan', 'last_name': 'Petrov'},
+                          {'first_name': 'Shpak', 'last_name': 'Shpakov'}], response.data[0]['readers'])
+        self.assertNotIn('readers_count', response.data[0])
+
+    def test_none(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, data={'readers': 'none'})
+        self.assertEqual(2, len(queries))
+        self.assertNotIn('readers', response.data[0])
+        self.assertNotIn('readers_count', response.data[0])
+
+    def test_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, data={'readers': 'count'})
+        self.assertEqual(2, len(queries))
+        self.assertEqual([2, 0], [book['readers_count'] for book in response.data])
+        self.assertNotIn('readers', response.data[0])
+
+    def test_top_n(self):
+        response = self.client.get(self.url, data={'readers': 1})
+        self.assertEqual([{'first_name': 'Ivan', 'last_name': 'Petrov'}], response.data[0]['readers'])
+        response = self.client.get(reverse('book-detail', args=(self.book1.id,)), data={'readers': 1})
+        self.assertEqual(1, len(response.data['readers']))
+
+    def test_top_n_fetched(self):
+        for i in range(3, 6):
+            UserBookRelation.objects.create(user=User.objects.create(username=f'test username{i}'), book=self.book1)
+        with mock.patch.object(UserBookRelation, 'from_db', side_effect=UserBookRelation.from_db) as from_db:
+            response = self.client.get(self.url, data={'readers': 2})
+        self.assertEqual(2, from_db.call_count)
+        self.assertEqual(['Ivan', 'Shpak'], [reader['first_name'] for reader in response.data[0]['readers']])
+
+        response = self.client.get(self.url, data={'readers': 0})
+        self.assertEqual([], response.data[0]['readers'])
+
+    def test_wrong(self):
+        response = self.client.get(self.url, data={'readers': 'everyone'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+
+class BooksFastListApiTestCase(APITestCase):
+    queries = [
+        {},
+        {'fields': 'id,name,price_with_discount'},
+        {'exclude': 'readers'},
+        {'readers': 'count'},
+        {'readers': '1'},
+        {'readers': 'none', 'ordering': '-price'},
+        {'page_size': 2, 'ordering': 'author_name'},
+        {'search': 'author1'},
+        {'price': 200},
+    ]
+
+    def setUp(self):
+        self.users = [User.objects.create(username=f'username{i}', first_name=f'First {i}', last_name=f'Last {i}')
+                      for i in range(3)]
+        self.books = [
+            Book.objects.create(name='Test book 1', price=100, author_name='author1', owner=self.users[0],
+                                discount='15.50'),
+            Book.objects.create(name='Test book 2', price=200, author_name='author2', owner=self.users[1]),
+            Book.objects.create(name='Test book 3 author1', price=200, author_name='author3'),
+        ]
+        for user in self.users:
+            UserBookRelation.objects.create(user=user, book=self.books[0], like=True, rate=5)
+        UserBookRelation.objects.create(user=self.users[2], book=self.books[1], rate=2)
+        self.url = reverse('book-list')
+
+    def get(self, params, fast):
+        cache.get_cache().clear()
+        with override_settings(STORE_FAST_BOOK_LIST=fast):
+            response = self.client.get(self.url, params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response
+
+    def test_parity(self):
+        for params in self.queries:
+            with self.subTest(params=params):
+                self.assertEqual(self.get(params, fast=False).data, self.get(params, fast=True).data)
+
+    def test_pagination_parity(self):
+        params = {'page_size': 1, 'ordering': '-price'}
+        for _ in self.books:
+            slow, fast = self.get(params, fast=False).data, self.get(params, fast=True).data
+            self.assertEqual(slow, fast)
+            params['cursor'] = parse_qs(urlparse(fast['next']).query)['cursor'][0] if fast['next'] else None
+        self.assertIsNone(params['cursor'])
+
+    def test_queries(self):
+        cache.get_cache().clear()
+        with override_settings(STORE_FAST_BOOK_LIST=True), CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertEqual(3, len(queries))
+
+
+class BooksSparseFieldsApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test username', first_name='Ivan')
+        self.books = [Book.objects.create(name=f'Test book {i}', price=100 + i, author_name=f'author{i}',
+                                          owner=self.user, discount=10) for i in range(20)]
+        for book in self.books:
+            UserBookRelation.objects.create(user=self.user, book=book, like=True, rate=4)
+        self.url = reverse('book-list')
+
+    def get(self, data):
+        cache.get_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, data=data)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response, queries
+
+    def test_fields(self):
+        response, queries = self.get({'fields': 'id,name'})
+        self.assertEqual([{'id': book.id, 'name': book.name} for book in self.books], response.data)
+        self.assertEqual(2, len(queries))
+        books_sql = queries[-1]['sql']
+        self.assertNotIn('auth_user', books_sql)
+        self.assertNotIn('"discount"', books_sql)
+        self.assertNotIn('"rating"', books_sql)
+
+    def test_exclude(self):
+        response, queries = self.get({'exclude': 'readers,owner_name'})
+        self.assertEqual(['id', 'name', 'author_name', 'price', 'discount', 'price_with_discount', 'annotated_likes',
+                          'rating'], list(response.data[0]))
+        self.assertEqual('90.00', response.data[0]['price_with_discount'])
+        self.assertEqual(2, len(queries))
+        self.assertNotIn('auth_user', queries[-1]['sql'])
+
+    def test_fields_with_annotation(self):
+        response, queries = self.get({'fields': 'id,owner_name,annotated_likes'})
+        self.assertEqual({'id': self.books[0].id, 'owner_name': 'test username', 'annotated_likes': 1},
+                         response.data[0])
+        self.assertIn('auth_user', queries[-1]['sql'])
+
+    def test_fields_with_readers_count(self):
+        response, _ = self.get({'fields': 'id,readers', 'readers': 'count'})
+        self.assertEqual({'id': self.books[0].id, 'readers_count': 1}, response.data[0])
+
+    def test_fields_paginated_ordering(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, data={'fields': 'id', 'ordering': '-price', 'page_size': 5})
+            response = self.client.get(response.data['next'])
+        self.assertEqual([{'id': book.id} for book in reversed(self.books[10:15])], response.data['results'])
+        self.assertEqual(4, len(queries))
+
+    def test_unknown(self):
+        response = self.client.get(self.url, data={'fields': 'id,password'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_comparison(self):
+        _, full_queries = self.get({})
+        _, sparse_queries = self.get({'fields': 'id,name,price'})
+        self.assertEqual(3, len(full_queries))
+        self.assertEqual(2, len(sparse_queries))
+        self.assertLess(len(sparse_queries[-1]['sql']), len(full_queries[-2]['sql']))
+        self.assertLess(float(sparse_queries[-1]['time']) + float(sparse_queries[0]['time']),
+                        sum(float(query['time']) for query in full_queries) + 0.001)
+
+
+class BooksRelationUpsertApiTestCase(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='test username')
+        self.user2 = User.objects.create(username='test username2')
+        self.book = Book.objects.create(name='Test book 1', price=200, author_name='author1', owner=self.user1)
+        self.url = reverse('userbookrelation-detail', args=(self.book.id,))
+
+    def patch(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response, [query['sql'] for query in queries if 'store_' in query['sql']]
+
+    def test_create_and_update(self):
+        self.client.force_login(self.user1)
+        response, queries = self.patch({'like': True, 'rate': 4})
+        self.assertEqual({'book': self.book.id, 'like': True, 'in_bookmarks': False, 'rate': 4}, response.data)
+        self.assertLessEqual(len(queries), 3)
+
+        response, queries = self.patch({'rate': 2})
+        self.assertEqual({'book': self.book.id, 'like': True, 'in_bookmarks': False, 'rate': 2}, response.data)
+        self.assertLessEqual(len(queries), 3)
+        self.assertEqual(1, UserBookRelation.objects.count())
+        self.book.refresh_from_db()
+        self.assertEqual(('2.00', 1), (str(self.book.rating), self.book.likes_count))
+
+    def test_bookmark_has_no_book_write(self):
+        self.client.force_login(self.user1)
+        self.patch({'like': True})
+        response, queries = self.patch({'in_bookmarks': True})
+        self.assertTrue(response.data['in_bookmarks'])
+        self.assertFalse([sql for sql in queries if sql.startswith('UPDATE "store_book"')])
+
+    def test_empty_patch_creates(self):
+        self.client.force_login(self.user2)
+        response, _ = self.patch({})
+        self.assertEqual({'book': self.book.id, 'like': False, 'in_bookmarks': False, 'rate': None}, response.data)
+        self.assertTrue(UserBookRelation.objects.filter(user=self.user2, book=self.book).exists())
+
+    def test_missing_book(self):
+        self.client.force_login(self.user1)
+        url = reverse('userbookrelation-detail', args=(self.book.id + 100,))
+        response = self.client.patch(url, data=json.dumps({'like': True}), content_type='application/json')
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+
+class BooksRelationBulkApiTestCase(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='test username')
+        self.user2 = User.objects.create(username='test username2')
+        self.books = [Book.objects.create(name=f'Test book {i}', price=200, author_name='author1', owner=self.user1)
+                      for i in range(10)]
+        self.url = reverse('userbookrelation-bulk')
+
+    def post(self, data, expected_status=status.HTTP_200_OK):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(expected_status, response.status_code, response.data)
+        return response, [query['sql'] for query in queries if 'store_' in query['sql']]
+
+    def test_bulk(self):
+        UserBookRelation.objects.create(user=self.user1, book=self.books[0], like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user1, book=self.books[1], in_bookmarks=True)
+        self.client.force_login(self.user1)
+        data = [
+            {'book': self.books[0].id, 'like': False, 'rate': 3},
+            {'book': self.books[1].id, 'in_bookmarks': True},
+            {'book': self.books[2].id, 'like': True, 'rate': 4},
+        ]
+        response, _ = self.post(data)
+        expected_data = [
+            {'book': self.books[0].id, 'status': 'updated'},
+            {'book': self.books[1].id, 'status': 'unchanged'},
+            {'book': self.books[2].id, 'status': 'created'},
+        ]
+        self.assertEqual(expected_data, response.data)
+
+        relations = UserBookRelation.objects.filter(user=self.user1).order_by('book_id')
+        self.assertEqual([(False, False, 3), (False, True, None), (True, False, 4)],
+                         [(relation.like, relation.in_bookmarks, relation.rate) for relation in relations])
+        books = Book.objects.filter(id__in=[book.id for book in self.books[:3]]).order_by('id')
+        self.assertEqual([('3.00', 0), (None, 0), ('4.00', 1)],
+                         [(book.rating and str(book.rating), book.likes_count) for book in books])
+
+    def test_bulk_same_book(self):
+        self.client.force_login(self.user1)
+        data = [
+            {'book': self.books[0].id, 'like': True, 'rate': 2},
+            {'book': self.books[0].id, 'rate': 5},
+        ]
+        response, queries = self.post(data)
+        self.assertEqual(['created', 'created'], [item['status'] for item in response.data])
+        self.assertEqual(1, len([sql for sql in queries if sql.startswith('UPDATE "store_book"')]))
+        self.books[0].refresh_from_db()
+        self.assertEqual(('5.00', 1, 1), (str(self.books[0].rating), self.books[0].likes_count,
+                                          self.books[0].rating_count))
+
+    def test_bulk_query_count(self):
+        for book in self.books:
+            UserBookRelation.objects.create(user=self.user2, book=book)
+        self.client.force_login(self.user2)
+        _, queries_small = self.post([{'book': book.id, 'in_bookmarks': True} for book in self.books[:2]])
+        _, queries_large = self.post([{'book': book.id, 'in_bookmarks': True} for book in self.books])
+        self.assertEqual(len(queries_small), len(queries_large))
+
+        _, queries = self.post([{'book': book.id, 'like': True} for book in self.books])
+        self.assertEqual(len(self.books), len([sql for sql in queries if sql.startswith('UPDATE "store_book"')]))
+        self.assertEqual(len(self.books) + len(queries_large), len(queries))
+
+    def test_bulk_invalid(self):
+        self.client.force_login(self.user1)
+        data = [
+            {'book': self.books[0].id, 'like': True},
+            {'book': self.books[-1].id + 100, 'like': True},
+            {'book': self.books[1].id, 'rate': 10},
+        ]
+        response, _ = self.post(data, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual({}, response.data[0])
+        self.assertIn('book', response.data[1])
+        self.assertIn('rate', response.data[2])
+        self.assertFalse(UserBookRelation.objects.exists())
+
+        response, _ = self.post({'book': self.books[0].id}, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_unauthorized(self):
+        response = self.client.post(self.url, data=json.dumps([]), content_type='application/json')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+
+@override_settings(STORE_RELATION_WRITE_MODE='coalesced')
+class BooksRelationCoalescedApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test username')
+        self.book = Book.objects.create(name='Test book 1', price=200, author_name='author1', owner=self.user)
+        self.url = reverse('userbookrelation-detail', args=(self.book.id,))
+        self.client.force_authenticate(self.user)
+
+    def test_coalesced(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book, in_bookmarks=True)
+        response = self.client.patch(self.url, data={'rate': 4}, format='json')
+        self.assertEqual(status.HTTP_202_ACCEPTED, response.status_code)
+        response = self.client.patch(self.url, data={'like': True}, format='json')
+        self.assertEqual({'book': self.book.id, 'like': True, 'in_bookmarks': True, 'rate': 4}, response.data)
+
+        # Nothing is applied until the queue is processed.
+        self.book.refresh_from_db()
+        self.assertEqual((0, 0), (self.book.likes_count, self.book.rating_count))
+
+        process_relation_writes()
+        self.book.refresh_from_db()
+        self.assertEqual((1, '4.00'), (self.book.likes_count, str(self.book.rating)))
+
+    def test_unknown_book(self):
+        url = reverse('userbookrelation-detail', args=(self.book.id + 100,))
+        response = self.client.patch(url, data={'like': True}, format='json')
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+
+class BooksRelationConcurrencyTestCase(TransactionTestCase):
+    threads = 8
+    requests_per_thread = 5
+
+    def setUp(self):
+        self.users = [User.objects.create(username=f'username{i}') for i in range(self.threads)]
+        self.book = Book.objects.create(name='Test book 1', price=200, author_name='author1', owner=self.users[0])
+        self.url = reverse('userbookrelation-detail', args=(self.book.id,))
+
+    def hammer(self, user, barrier, errors):
+        client = APIClient()
+        client.force_authenticate(user)
+        barrier.wait()
+        try:
+            for i in range(self.requests_per_thread):
+                data = {'like': i % 2 == 0, 'rate': i % 5 + 1}
+                response = client.patch(self.url, data=json.dumps(data), content_type='application/json')
+                if response.status_code != status.HTTP_200_OK:
+                    errors.append(response.status_code)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    def test_hammer(self):
+        barrier = threading.Barrier(self.threads * 2)
+        errors = []
+        # Two threads per user race on creating the same relation row.
+        workers = [threading.Thread(target=self.hammer, args=(user, barrier, errors))
+                   for user in self.users for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        relations = list(UserBookRelation.objects.filter(book=self.book))
+        if connection.vendor == 'sqlite':
+            # SQLite rejects the writers that lose a lock race instead of queueing them.
+            errors = [error for error in errors if 'locked' not in str(error)]
+        else:
+            self.assertEqual(self.threads, len(relations))
+        self.assertEqual([], errors)
+        self.assertEqual(len(relations), len({relation.user_id for relation in relations}))
+
+        self.book.refresh_from_db()
+        self.assertEqual(len([relation for relation in relations if relation.like]), self.book.likes_count)
+        self.assertEqual(sum(relation.rate for relation in relations), self.book.rating_sum)
+        self.assertEqual(len(relations), self.book.rating_count)
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import threading
+from unittest import mock
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.response import Response
+
+from store import cache
+from store.models import Book, UserBookRelation
+from store.views import BookViewSet
+
+
+class AsyncBooksApiTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        self.user = User.objects.create(username='test username', first_name='Ivan', last_name='Petrov')
+        self.book1 = Book.objects.create(name='Test book 1', price=100, author_name='author1', owner=self.user,
+                                         discount='15.00')
+        self.book2 = Book.objects.create(name='Test book 2', price=200, author_name='author2', owner=self.user)
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True, rate=5)
+
+    def request(self, method, url, **kwargs):
+        async def request():
+            return await getattr(self.async_client, method)(url, **kwargs)
+
+        return async_to_sync(request)()
+
+    def get(self, url, **params):
+        return self.request('get', url + (f'?{urlencode(params)}' if params else ''))
+
+    def test_list(self):
+        expected = self.client.get(reverse('book-list'), {'ordering': '-price'})
+        cache.get_cache().clear()
+        response = self.get(reverse('async-book-list'), ordering='-price')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(json.loads(expected.content), json.loads(response.content))
+        self.assertEqual(expected['ETag'], response['ETag'])
+
+    def test_detail(self):
+        expected = self.client.get(reverse('book-detail', args=(self.book1.id,)))
+        response = self.get(reverse('async-book-detail', args=(self.book1.id,)))
+        self.assertEqual(json.loads(expected.content), json.loads(response.content))
+
+        response = self.get(reverse('async-book-detail', args=(self.book2.id + 100,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_relation(self):
+        url = reverse('async-userbookrelation-detail', args=(self.book2.id,))
+        response = self.request('patch', url, data=json.dumps({'like': True}), content_type='application/json')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        self.async_client.force_login(self.user)
+        response = self.request('patch', url, data=json.dumps({'like': True, 'rate': 3}),
+                                content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({'book': self.book2.id, 'like': True, 'in_bookmarks': False, 'rate': 3},
+                         json.loads(response.content))
+        self.book2.refresh_from_db()
+        self.assertEqual((1, '3.00'), (self.book2.likes_count, str(self.book2.rating)))
+
+    # The debug toolbar middleware is sync-only, which would put every request back on one thread.
+    @override_settings(MIDDLEWARE=[name for name in settings.MIDDLEWARE if 'debug_toolbar' not in name])
+    def test_concurrent(self):
+        threads = set()
+        # Only lets the views through once all four are in at the same time, requests served one by one break it.
+        barrier = threading.Barrier(4, timeout=5)
+
+        def slow_list(view, request, *args, **kwargs):
+            threads.add(threading.get_ident())
+            barrier.wait()
+            return Response([])
+
+        async def burst():
+            return await asyncio.gather(*(self.async_client.get(reverse('async-book-list')) for _ in range(4)))
+
+        with mock.patch.object(BookViewSet, 'list', slow_list):
+            responses = async_to_sync(burst)()
+
+        self.assertEqual([status.HTTP_200_OK] * 4, [response.status_code for response in responses])
+        self.assertEqual(4, len(threads))
+        self.assertFalse(barrier.broken)
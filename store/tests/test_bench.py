@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from store import bench
+from store.logic import likes_drift
+from store.models import Book, UserBookRelation
+
+
+class SeedTestCase(TestCase):
+    def test_seed(self):
+        counts = bench.seed(books=50, users=10, relations_per_user=5)
+        self.assertEqual(50, Book.objects.count())
+        self.assertEqual(counts['relations'], UserBookRelation.objects.count())
+        self.assertFalse(likes_drift().exists())
+
+        # Seeding again adds new users instead of clashing with the existing ones.
+        bench.seed(books=5, users=5)
+        self.assertEqual(15, len(bench.Context().users))
+
+        bench.clear()
+        self.assertFalse(Book.objects.exists())
+
+    def test_context_without_seed(self):
+        User.objects.create(username='someone')
+        Book.objects.create(name='Test book 1', price=100, author_name='author1')
+        with self.assertRaisesMessage(ValueError, 'run `manage.py seed_store` first'):
+            bench.Context()
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, bench.percentile(values, 50))
+        self.assertEqual(99, bench.percentile(values, 99))
+        self.assertEqual(100, bench.percentile(values, 100))
+        self.assertIsNone(bench.percentile([], 50))
+
+
+class BenchCommandTestCase(TestCase):
+    def setUp(self):
+        call_command('seed_store', books=30, users=5, relations_per_user=5, stdout=StringIO())
+        self.output = os.path.join(tempfile.mkdtemp(), 'results.json')
+
+    def test_bench(self):
+        scenarios = ['list_page', 'list_deep_page', 'list_summary', 'detail', 'rate_hot_book', 'relations_bulk']
+        call_command('bench_store', *scenarios, requests=3, warmup=1, output=self.output, stdout=StringIO())
+        with open(self.output) as file:
+            results = json.load(file)
+
+        self.assertEqual(30, results['meta']['books'])
+        self.assertEqual(scenarios, list(results['scenarios']))
+        for result in results['scenarios'].values():
+            self.assertEqual(3, result['requests'])
+            self.assertEqual(0, result['errors'])
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['queries'], 0)
+
+        out = StringIO()
+        call_command('bench_store', 'detail', requests=3, warmup=0, compare=self.output, stdout=out)
+        self.assertIn('detail                    p50_ms', out.getvalue())
+
+    def test_unknown_scenario(self):
+        with self.assertRaises(CommandError):
+            call_command('bench_store', 'nope', stdout=StringIO())
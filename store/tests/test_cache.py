@@ -0,0 +1,165 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store import cache
+from store.models import Book, UserBookRelation
+
+
+class BooksCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        cache.stats.clear()
+        self.user = User.objects.create(username='test username', first_name='Ivan')
+        self.user2 = User.objects.create(username='test username2', first_name='Shpak')
+        self.book1 = Book.objects.create(name='Test book 1', price=100, author_name='author1', owner=self.user)
+        self.book2 = Book.objects.create(name='Test book 2', price=200, author_name='author2', owner=self.user)
+        self.list_url = reverse('book-list')
+        self.detail_url = reverse('book-detail', args=(self.book1.id,))
+        self.relation_url = reverse('userbookrelation-detail', args=(self.book1.id,))
+
+    def warm(self):
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+
+    def assertFresh(self):
+        list_response = self.client.get(self.list_url)
+        detail_response = self.client.get(self.detail_url)
+        self.assertEqual(0, cache.stats['hits'])
+        return list_response.data, detail_response.data
+
+    def test_hit(self):
+        self.warm()
+        self.assertEqual({'misses': 2}, dict(cache.stats))
+        with CaptureQueriesContext(connection) as queries:
+            list_response = self.client.get(self.list_url)
+            detail_response = self.client.get(self.detail_url)
+        self.assertEqual(0, len(queries))
+        self.assertEqual({'misses': 2, 'hits': 2}, dict(cache.stats))
+        self.assertEqual(2, len(list_response.data))
+        self.assertEqual(self.book1.name, detail_response.data['name'])
+
+    def test_params_keyed_separately(self):
+        self.client.get(self.list_url)
+        response = self.client.get(self.list_url, data={'price': 200})
+        self.assertEqual(0, cache.stats['hits'])
+        self.assertEqual([self.book2.id], [book['id'] for book in response.data])
+
+    def test_model_save(self):
+        self.warm()
+        cache.stats.clear()
+        self.book1.name = 'Renamed'
+        self.book1.save()
+        list_data, detail_data = self.assertFresh()
+        self.assertEqual('Renamed', list_data[0]['name'])
+        self.assertEqual('Renamed', detail_data['name'])
+
+    def test_update(self):
+        self.warm()
+        cache.stats.clear()
+        self.client.force_login(self.user)
+        data = {'name': self.book1.name, 'price': '4000.00', 'author_name': self.book1.author_name}
+        response = self.client.put(self.detail_url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        list_data, detail_data = self.assertFresh()
+        self.assertEqual('4000.00', list_data[0]['price'])
+        self.assertEqual('4000.00', detail_data['price'])
+
+    def test_create(self):
+        self.warm()
+        cache.stats.clear()
+        self.client.force_login(self.user)
+        data = {'name': 'New', 'price': '10.00', 'author_name': 'author'}
+        response = self.client.post(self.list_url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(3, len(self.client.get(self.list_url).data))
+        self.assertEqual(0, cache.stats['hits'])
+
+    def test_delete(self):
+        self.warm()
+        cache.stats.clear()
+        self.client.force_login(self.user)
+        response = self.client.delete(self.detail_url)
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertEqual(1, len(self.client.get(self.list_url).data))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(self.detail_url).status_code)
+        self.assertEqual(0, cache.stats['hits'])
+
+    def test_like(self):
+        self.warm()
+        cache.stats.clear()
+        self.client.force_login(self.user2)
+        self.client.patch(self.relation_url, data=json.dumps({'like': True}), content_type='application/json')
+        list_data, detail_data = self.assertFresh()
+        self.assertEqual(1, list_data[0]['annotated_likes'])
+        self.assertEqual(1, detail_data['annotated_likes'])
+        self.assertEqual([{'first_name': 'Shpak', 'last_name': ''}], detail_data['readers'])
+
+    def test_rate(self):
+        UserBookRelation.objects.create(user=self.user2, book=self.book1)
+        self.warm()
+        cache.stats.clear()
+        self.client.force_login(self.user2)
+        self.client.patch(self.relation_url, data=json.dumps({'rate': 4}), content_type='application/json')
+        list_data, detail_data = self.assertFresh()
+        self.assertEqual('4.00', list_data[0]['rating'])
+        self.assertEqual('4.00', detail_data['rating'])
+
+    def test_bookmark_keeps_cache(self):
+        UserBookRelation.objects.create(user=self.user2, book=self.book1)
+        self.warm()
+        cache.stats.clear()
+        self.client.force_login(self.user2)
+        self.client.patch(self.relation_url, data=json.dumps({'in_bookmarks': True}), content_type='application/json')
+        self.client.get(self.list_url)
+        self.assertEqual(1, cache.stats['hits'])
+
+    def test_relation_delete(self):
+        UserBookRelation.objects.create(user=self.user2, book=self.book1, like=True)
+        self.warm()
+        cache.stats.clear()
+        UserBookRelation.objects.get(user=self.user2, book=self.book1).delete()
+        list_data, detail_data = self.assertFresh()
+        self.assertEqual(0, list_data[0]['annotated_likes'])
+        self.assertEqual([], detail_data['readers'])
+
+    def test_other_book_detail_kept(self):
+        self.warm()
+        cache.stats.clear()
+        self.book2.name = 'Renamed'
+        self.book2.save()
+        self.client.get(self.detail_url)
+        self.assertEqual(1, cache.stats['hits'])
+
+    def test_user_renamed(self):
+        UserBookRelation.objects.create(user=self.user2, book=self.book1, like=True)
+        self.warm()
+        cache.stats.clear()
+        self.user.username = 'renamed owner'
+        self.user.save()
+        self.user2.first_name = 'Renamed'
+        self.user2.save(update_fields=['first_name'])
+        list_data, detail_data = self.assertFresh()
+        self.assertEqual('renamed owner', list_data[0]['owner_name'])
+        self.assertEqual([{'first_name': 'Renamed', 'last_name': ''}], detail_data['readers'])
+
+    def test_user_deleted(self):
+        UserBookRelation.objects.create(user=self.user2, book=self.book1, like=True)
+        self.warm()
+        cache.stats.clear()
+        self.user2.delete()
+        _, detail_data = self.assertFresh()
+        self.assertEqual([], detail_data['readers'])
+
+    def test_login_keeps_cache(self):
+        self.warm()
+        cache.stats.clear()
+        self.client.force_login(self.user2)
+        User.objects.create(username='test username3')
+        self.client.get(self.list_url)
+        self.assertEqual(1, cache.stats['hits'])
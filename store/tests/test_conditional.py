@@ -0,0 +1,120 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Now
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store import cache
+from store.models import Book, UserBookRelation
+from store.serializers import BooksSerializer
+
+
+class BooksConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        self.user = User.objects.create(username='test username')
+        self.book1 = Book.objects.create(name='Test book 1', price=100, author_name='author1', owner=self.user)
+        self.book2 = Book.objects.create(name='Test book 2', price=200, author_name='author2', owner=self.user)
+        self.list_url = reverse('book-list')
+        self.detail_url = reverse('book-detail', args=(self.book1.id,))
+
+    def test_version(self):
+        self.assertEqual(1, self.book1.version)
+        self.book1.name = 'Renamed'
+        self.book1.save()
+        self.book1.refresh_from_db()
+        self.assertEqual(2, self.book1.version)
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True)
+        self.book1.refresh_from_db()
+        self.assertEqual(3, self.book1.version)
+
+    def test_list_not_modified(self):
+        response = self.client.get(self.list_url)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEqual(0, len(queries))
+
+        cache.get_cache().clear()
+        with mock.patch.object(BooksSerializer, 'to_representation') as to_representation, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEqual(etag, response['ETag'])
+        self.assertFalse(to_representation.called)
+        self.assertEqual(1, len(queries))
+
+    def test_list_written_elsewhere(self):
+        etag = self.client.get(self.list_url)['ETag']
+        # Another worker's write never bumps the list version in this process's local memory.
+        Book.objects.filter(pk=self.book2.pk).update(name='Renamed', version=F('version') + 1, updated_at=Now())
+        with mock.patch.object(cache, 'get', return_value=None):
+            response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_list_shared_cache(self):
+        with mock.patch('store.conditional.is_shared', return_value=True):
+            etag = self.client.get(self.list_url)['ETag']
+            with mock.patch.object(cache, 'get', return_value=None), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEqual(0, len(queries))
+
+    def test_list_etag_per_params(self):
+        etag = self.client.get(self.list_url)['ETag']
+        response = self.client.get(self.list_url, data={'price': 200}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_list_modified(self):
+        etag = self.client.get(self.list_url)['ETag']
+        self.client.force_login(self.user)
+        url = reverse('userbookrelation-detail', args=(self.book2.id,))
+        self.client.patch(url, data=json.dumps({'like': True}), content_type='application/json')
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_list_delete(self):
+        etag = self.client.get(self.list_url)['ETag']
+        self.book2.delete()
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(1, len(response.data))
+
+    def test_detail_not_modified(self):
+        response = self.client.get(self.detail_url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        with mock.patch.object(BooksSerializer, 'to_representation') as to_representation:
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+            cache.get_cache().clear()
+            response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertFalse(to_representation.called)
+
+    def test_detail_modified(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        self.book1.price = 150
+        self.book1.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('150.00', response.data['price'])
+
+        etag = response['ETag']
+        self.book2.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+    def test_detail_missing(self):
+        response = self.client.get(reverse('book-detail', args=(self.book2.id + 100,)), HTTP_IF_NONE_MATCH='"x"')
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
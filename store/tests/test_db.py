@@ -0,0 +1,154 @@
+import json
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connections, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from store import cache, db
+from store.logic import set_rating
+from store.models import Book, UserBookRelation
+
+REPLICA = 'replica_test'
+
+
+@override_settings(STORE_DB_REPLICAS=[REPLICA])
+class ReplicaRouterTestCase(TransactionTestCase):
+    # Resolved when the class is set up, after REPLICA was added.
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # A second alias on the test database stands in for a replica, only while these tests run.
+        connections.databases[REPLICA] = {**connections['default'].settings_dict, 'TEST': {'MIRROR': 'default'}}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.databases[REPLICA]
+
+    def setUp(self):
+        cache.get_cache().clear()
+        db._down_until.clear()
+        self.user = User.objects.create(username='test username')
+        self.book = Book.objects.create(name='Test book 1', price=100, author_name='author1', owner=self.user)
+        self.client = APIClient()
+
+    def capture(self, func):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            func()
+        store_queries = lambda queries: [query['sql'] for query in queries if 'store_' in query['sql']]
+        return store_queries(primary), store_queries(replica)
+
+    def test_reads_on_replica(self):
+        primary, replica = self.capture(lambda: self.client.get(reverse('book-list')))
+        self.assertEqual([], primary)
+        self.assertTrue(replica)
+
+        primary, replica = self.capture(lambda: self.client.get(reverse('book-detail', args=(self.book.id,))))
+        self.assertEqual([], primary)
+        self.assertTrue(replica)
+
+    def test_writes_on_primary(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('book-detail', args=(self.book.id,))
+        primary, replica = self.capture(lambda: self.client.patch(url, data=json.dumps({'name': 'Renamed'}),
+                                                                  content_type='application/json'))
+        self.assertTrue(primary)
+        self.assertEqual([], replica)
+
+        url = reverse('userbookrelation-detail', args=(self.book.id,))
+        primary, replica = self.capture(lambda: self.client.patch(url, data=json.dumps({'rate': 4}),
+                                                                  content_type='application/json'))
+        self.assertTrue(primary)
+        self.assertEqual([], replica)
+
+    def test_export_on_replica(self):
+        response = self.client.get(reverse('book-export'))
+        primary, replica = self.capture(lambda: b''.join(response.streaming_content))
+        self.assertEqual([], primary)
+        self.assertTrue(replica)
+
+    def test_primary_inside_transactions(self):
+        with db.read_from_replica():
+            self.assertEqual(REPLICA, Book.objects.all().db)
+            with transaction.atomic():
+                self.assertEqual('default', Book.objects.all().db)
+            with db.primary():
+                self.assertEqual('default', Book.objects.all().db)
+
+    def test_set_rating_on_primary(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book, rate=3)
+        with db.read_from_replica():
+            book = Book.objects.get(pk=self.book.pk)
+            self.assertEqual(REPLICA, book._state.db)
+            primary, replica = self.capture(lambda: set_rating(book))
+        self.assertEqual(2, len(primary))
+        self.assertEqual([], replica)
+
+    def test_unhealthy_replica(self):
+        connections[REPLICA].close()
+        with mock.patch.object(connections[REPLICA], 'ensure_connection', side_effect=OperationalError), \
+                CaptureQueriesContext(connections['default']) as primary:
+            response = self.client.get(reverse('book-list'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue([query for query in primary if 'store_book' in query['sql']])
+        self.assertIn(REPLICA, db._down_until)
+
+        # The replica is skipped without another connection attempt until STORE_DB_RETRY_AFTER passes.
+        with mock.patch.object(connections[REPLICA], 'ensure_connection') as ensure_connection:
+            self.client.get(reverse('book-list'))
+        ensure_connection.assert_not_called()
+
+    def test_no_replicas(self):
+        with override_settings(STORE_DB_REPLICAS=[]):
+            primary, replica = self.capture(lambda: self.client.get(reverse('book-list')))
+        self.assertTrue(primary)
+        self.assertEqual([], replica)
+
+
+class ConnectionHealthCheckTestCase(TransactionTestCase):
+    def setUp(self):
+        self.connection = connections['default']
+        self.connection.ensure_connection()
+        self.connection.store_used_at = time.monotonic()
+
+    def check(self, **settings):
+        with mock.patch.dict(self.connection.settings_dict, CONN_MAX_AGE=60), \
+                mock.patch.object(self.connection, 'is_usable', return_value=False) as is_usable, \
+                mock.patch.object(self.connection, 'close') as close, \
+                override_settings(**settings):
+            db.check_persistent_connections()
+        return is_usable.called, close.called
+
+    def test_recently_used(self):
+        self.assertEqual((False, False), self.check())
+
+    def test_idle(self):
+        self.connection.store_used_at -= 31
+        self.assertEqual((True, True), self.check(STORE_DB_PING_IDLE_AFTER=30))
+        self.assertEqual((False, False), self.check(STORE_DB_PING_IDLE_AFTER=60))
+
+    def test_after_error(self):
+        with mock.patch.object(self.connection, 'errors_occurred', True):
+            self.assertEqual((True, True), self.check())
+
+    def test_disabled(self):
+        self.connection.store_used_at -= 31
+        self.assertEqual((False, False), self.check(STORE_DB_HEALTH_CHECKS=False))
+
+    def test_no_ping_per_request(self):
+        with mock.patch.dict(self.connection.settings_dict, CONN_MAX_AGE=60):
+            self.client.get(reverse('book-list'))
+            with mock.patch.object(type(self.connection), 'is_usable') as is_usable:
+                self.client.get(reverse('book-list'))
+        is_usable.assert_not_called()
@@ -0,0 +1,132 @@
+from unittest import skipUnless
+
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store import transfer
+from store.filters import search_text
+from store.logic import rebuild_book_summaries, upsert_relation
+from store.models import Book
+
+
+class SearchTextTestCase(SimpleTestCase):
+    def test_terms(self):
+        # Splitting into words is left to to_tsvector, which keeps '200.00' whole.
+        self.assertEqual("war& 'peace':* 200.00", search_text(["war&", "'peace':*", '200.00']))
+
+    def test_no_words(self):
+        self.assertEqual('', search_text(['!', '&|']))
+        self.assertEqual('', search_text([]))
+
+
+class BookSearchApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test username')
+        self.book1 = Book.objects.create(name='War and Peace', price=100, author_name='Leo Tolstoy', owner=self.user)
+        self.book2 = Book.objects.create(name='Anna Karenina', price=200, author_name='Leo Tolstoy', owner=self.user)
+        self.book3 = Book.objects.create(name='Peace Talks', price=300, author_name='Jim Butcher', owner=self.user)
+        self.url = reverse('book-list')
+
+    def search(self, term, **params):
+        response = self.client.get(self.url, data={'search': term, **params})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [book['id'] for book in response.data]
+
+    def test_search(self):
+        self.assertEqual([self.book1.id, self.book2.id], sorted(self.search('tolstoy')))
+        self.assertEqual([self.book2.id], self.search('leo anna'))
+        self.assertEqual([self.book3.id], self.search('300'))
+
+    def test_ordering_param_wins(self):
+        self.assertEqual([self.book3.id, self.book1.id], self.search('peace', ordering='-price'))
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search needs PostgreSQL')
+    def test_ranked(self):
+        # The name is weighted above the author, so the title match comes first.
+        Book.objects.create(name='Butcher', price=10, author_name='Peace Talks', owner=self.user)
+        self.assertEqual(self.book3.id, self.search('peace talks')[0])
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search needs PostgreSQL')
+    def test_numeric_term(self):
+        # The price is indexed as the lexeme '200.00', not as the words 200 and 00.
+        self.assertEqual([self.book2.id], self.search('200.00'))
+        self.assertEqual([self.book2.id], self.search('200.0'))
+        self.assertEqual([], self.search('200.01'))
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search needs PostgreSQL')
+    def test_uses_search_vector(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search('tolstoy')
+        self.assertIn('@@ to_tsquery', queries[-2]['sql'])
+        self.assertIn('to_tsvector', queries[-2]['sql'])
+        self.assertNotIn('LIKE', queries[-2]['sql'].upper())
+
+
+class BookFilterApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test username')
+        self.book1 = Book.objects.create(name='Test book 1', price=100, discount=30, author_name='author1')
+        self.book2 = Book.objects.create(name='Test book 2', price=200, author_name='author2')
+        self.book3 = Book.objects.create(name='Test book 3', price='250.50', discount='0.50', author_name='author3')
+        self.book4 = Book.objects.create(name='Test book 4', price=50, author_name='author1')
+        upsert_relation(self.user.id, self.book1.id, {'rate': 5})
+        upsert_relation(self.user.id, self.book2.id, {'rate': 3})
+        upsert_relation(self.user.id, self.book4.id, {'rate': 4})
+
+    def filter(self, **params):
+        response = self.client.get(reverse('book-list'), data=params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [book['id'] for book in response.data]
+
+    def assertFilters(self):
+        self.assertEqual([self.book2.id], self.filter(price=200))
+        self.assertEqual([self.book1.id, self.book2.id], self.filter(price__gte=100, price__lte=200))
+        self.assertEqual([self.book1.id, self.book4.id], self.filter(price__in='50,100'))
+        self.assertEqual([self.book1.id], self.filter(price_with_discount__lte=70))
+        self.assertEqual([self.book3.id], self.filter(price_with_discount__gte='250.00'))
+        self.assertEqual([self.book1.id, self.book4.id], self.filter(rating__gte=4))
+        self.assertEqual([self.book2.id, self.book4.id], self.filter(rating__in='3,4', rating__lte='4.5'))
+        self.assertEqual([self.book1.id, self.book3.id], self.filter(has_discount='true'))
+        self.assertEqual([self.book2.id, self.book4.id], self.filter(has_discount='false'))
+        self.assertEqual([self.book1.id, self.book3.id, self.book4.id], self.filter(author_name__in='author1,author3'))
+        self.assertEqual([self.book2.id, self.book3.id], self.filter(id__in=f'{self.book2.id},{self.book3.id}'))
+
+    def test_filters(self):
+        self.assertFilters()
+
+    @override_settings(STORE_BOOK_SUMMARY=True)
+    def test_filters_summary(self):
+        rebuild_book_summaries()
+        self.assertFilters()
+
+    def test_invalid(self):
+        for params in ({'price__gte': 'cheap'}, {'price__in': '10,many'}, {'rating__lte': '4,5'}):
+            response = self.client.get(reverse('book-list'), data=params)
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code, params)
+
+
+class PriceWithDiscountTestCase(TestCase):
+    def test_save(self):
+        book = Book.objects.create(name='Test book', price=100, author_name='author')
+        self.assertIsNone(book.price_with_discount)
+        book.discount = Decimal('20.50')
+        book.save(update_fields=['discount'])
+        book.price = 200
+        book.save()
+        self.assertEqual(Decimal('179.50'), Book.objects.get(pk=book.pk).price_with_discount)
+
+        book.name = 'Renamed'
+        book.save(update_fields=['name'])
+        self.assertEqual(Decimal('179.50'), Book.objects.get(pk=book.pk).price_with_discount)
+
+    def test_import(self):
+        transfer.import_books([(1, {'name': 'Imported', 'author_name': 'author', 'price': '7.10', 'discount': '1'},
+                                None)])
+        self.assertEqual(Decimal('6.10'), Book.objects.get().price_with_discount)
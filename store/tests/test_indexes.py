@@ -0,0 +1,64 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.test import TestCase
+
+from store.filters import BookFilter
+from store.models import Book, BookSummary, UserBookRelation
+from store.tests.utils import ExplainTestMixin
+
+
+class HotPathIndexesTestCase(ExplainTestMixin, TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'username{i}') for i in range(3)]
+        self.books = [Book.objects.create(name=f'Test book {i}', price=100 + i % 5, author_name=f'author{i % 7}',
+                                          owner=self.users[0]) for i in range(30)]
+        for user in self.users:
+            for book in self.books[::3]:
+                UserBookRelation.objects.create(user=user, book=book, like=book.id % 2 == 0)
+
+    def test_filter_price(self):
+        self.assertUsesIndex(Book.objects.filter(price=Decimal('102.00')), 'store_book_price_id_idx')
+
+    def test_keyset_price(self):
+        seek = Q(price__gte=101) & (Q(price__gt=101) | Q(price=101, id__gt=self.books[3].id))
+        self.assertUsesIndex(Book.objects.filter(seek).order_by('price', 'id')[:21], 'store_book_price_id_idx')
+
+    def filtered(self, queryset=None, **params):
+        return BookFilter(params, queryset=Book.objects.all() if queryset is None else queryset).qs
+
+    def test_filter_price_range(self):
+        self.assertUsesIndex(self.filtered(price__gte='101', price__lte='103'), 'store_book_price_id_idx')
+
+    def test_filter_price_in(self):
+        self.assertUsesIndex(self.filtered(price__in='101,103'), 'store_book_price_id_idx')
+
+    def test_filter_price_with_discount_range(self):
+        # Compares the stored column, `price - discount` would leave no index to use.
+        params = {'price_with_discount__gte': '50', 'price_with_discount__lte': '90'}
+        self.assertUsesIndex(self.filtered(**params), 'store_book_discount_id_idx')
+        self.assertUsesIndex(self.filtered(BookSummary.objects.all(), **params), 'store_summary_discount_id_idx')
+
+    def test_filter_rating_range(self):
+        self.assertUsesIndex(self.filtered(rating__gte='4', rating__lte='5'), 'store_book_rating_id_idx')
+        self.assertUsesIndex(self.filtered(BookSummary.objects.all(), rating__gte='4'), 'store_summary_rating_id_idx')
+
+    def test_filter_author_in(self):
+        self.assertUsesIndex(self.filtered(author_name__in='author1,author3'), 'store_book_author_id_idx')
+
+    def test_order_author_name(self):
+        self.assertUsesIndex(Book.objects.order_by('author_name', 'id')[:21], 'store_book_author_id_idx')
+
+    def test_relation_lookup(self):
+        self.assertUsesIndex(UserBookRelation.objects.filter(user=self.users[1], book=self.books[3]),
+                             'store_relation_user_book_uniq', 'sqlite_autoindex_store_userbookrelation')
+
+    def test_liked_partial_index(self):
+        self.assertUsesIndex(UserBookRelation.objects.filter(book=self.books[6], like=True),
+                             'store_relation_liked_idx')
+
+    def test_unique_relation(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            UserBookRelation.objects.create(user=self.users[0], book=self.books[0])
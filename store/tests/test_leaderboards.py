@@ -0,0 +1,168 @@
+import random
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store import leaderboards, transfer
+from store.logic import process_pending_ratings, rebuild_likes_count, rebuild_ratings, upsert_relation, write_relations
+from store.models import Book, Leaderboard, LeaderboardEntry, UserBookRelation
+
+SIZE = 3
+AUTHORS = ('author0', 'author1', 'author2')
+
+
+@override_settings(STORE_LEADERBOARDS=True, STORE_LEADERBOARD_SIZE=SIZE, STORE_LEADERBOARD_BUFFER=1)
+class LeaderboardTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'username{i}') for i in range(6)]
+        self.books = [Book.objects.create(name=f'Test book {i}', price=100, author_name=AUTHORS[i % 3])
+                      for i in range(12)]
+
+    def assertBoards(self, message=''):
+        for kind in leaderboards.KINDS:
+            for scope in (leaderboards.GLOBAL, *AUTHORS):
+                expected = list(leaderboards.ranked(kind, scope).values_list('id', flat=True)[:SIZE])
+                if expected:
+                    # Served from the board, not from the fallback sorting Book.
+                    self.assertTrue(Leaderboard.objects.filter(kind=kind, scope=scope).exists())
+                actual = [row['id'] for row in leaderboards.top(kind, scope, SIZE)]
+                self.assertEqual(expected, actual, f'{kind} board of {scope or "everyone"} {message}')
+
+    def test_brute_force(self):
+        rng = random.Random(0)
+        for step in range(300):
+            user, book = rng.choice(self.users), rng.choice(self.books)
+            action = rng.random()
+            if action < 0.6:
+                upsert_relation(user.id, book.id, {'like': rng.random() < 0.6, 'rate': rng.choice([None, 1, 3, 4, 5])})
+            elif action < 0.75:
+                relation = UserBookRelation.objects.filter(user=user, book=book).first()
+                if relation is not None:
+                    relation.delete()
+            elif action < 0.85:
+                write_relations([(other.id, book.id, {'like': True, 'rate': 5}) for other in self.users[:3]])
+            else:
+                book.refresh_from_db()
+                book.author_name = rng.choice(AUTHORS)
+                book.save()
+            self.assertBoards(f'after step {step}')
+
+        for book in self.books[:8]:
+            book.delete()
+            self.assertBoards(f'after deleting book {book.id}')
+
+    def test_min_votes(self):
+        with override_settings(STORE_LEADERBOARD_MIN_VOTES=2):
+            upsert_relation(self.users[0].id, self.books[0].id, {'rate': 5})
+            upsert_relation(self.users[0].id, self.books[1].id, {'rate': 3})
+            upsert_relation(self.users[1].id, self.books[1].id, {'rate': 4})
+            self.assertEqual([self.books[1].id], [row['id'] for row in leaderboards.top(leaderboards.RATING)])
+            self.assertBoards()
+
+    @override_settings(STORE_RATING_MODE='deferred')
+    def test_deferred_rating(self):
+        upsert_relation(self.users[0].id, self.books[0].id, {'rate': 5})
+        self.assertEqual([], leaderboards.top(leaderboards.RATING))
+        process_pending_ratings()
+        self.assertEqual([self.books[0].id], [row['id'] for row in leaderboards.top(leaderboards.RATING)])
+
+    def test_bulk_created_books(self):
+        upsert_relation(self.users[0].id, self.books[0].id, {'like': True, 'rate': 3})
+        Book.objects.bulk_create([
+            Book(name='Bulk book 1', price=100, author_name='author1', likes_count=5, rating=5, rating_count=1),
+            Book(name='Bulk book 2', price=100, author_name='author2')])
+        liked, other = Book.objects.filter(name__startswith='Bulk book').order_by('name').values_list('pk', flat=True)
+        with CaptureQueriesContext(connection) as queries:
+            leaderboards.add_books([liked, other])
+        self.assertBoards()
+        self.assertEqual(liked, leaderboards.top(leaderboards.LIKES)[0]['id'])
+
+        # Books that qualify for no board cost the one query finding that out.
+        with CaptureQueriesContext(connection) as more_queries:
+            leaderboards.add_books([other])
+        self.assertEqual(1, len(more_queries))
+        self.assertLess(len(more_queries), len(queries))
+
+    def test_import(self):
+        upsert_relation(self.users[0].id, self.books[0].id, {'like': True})
+        with mock.patch.object(leaderboards, 'add_books') as add_books, \
+                mock.patch.object(leaderboards, 'refresh') as refresh:
+            transfer.import_books([(1, {'name': 'Imported', 'author_name': 'author1', 'price': '7.10'}, None)])
+        if connection.features.can_return_rows_from_bulk_insert:
+            add_books.assert_called_once_with([Book.objects.get(name='Imported').pk])
+        else:
+            refresh.assert_called_once_with()
+        self.assertBoards()
+
+    def test_rebuild(self):
+        for book in self.books[:5]:
+            upsert_relation(self.users[0].id, book.id, {'like': True, 'rate': 4})
+        # Counters changed behind the boards' back.
+        Book.objects.filter(pk=self.books[6].id).update(likes_count=10)
+        LeaderboardEntry.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_leaderboards', stdout=out)
+        self.assertIn('Rebuilt 8 leaderboard(s).', out.getvalue())
+        self.assertEqual(self.books[6].id, leaderboards.top(leaderboards.LIKES)[0]['id'])
+
+        Book.objects.filter(pk=self.books[1].id).update(rating_sum=1, rating=1)
+        # Repairs move the books they fix instead of rebuilding every board.
+        with mock.patch.object(leaderboards, 'rebuild') as rebuild:
+            rebuild_likes_count([self.books[6].id])
+            self.assertEqual(1, rebuild_ratings())
+        self.assertFalse(rebuild.called)
+        self.assertBoards()
+
+    def test_disabled(self):
+        with override_settings(STORE_LEADERBOARDS=False):
+            upsert_relation(self.users[0].id, self.books[0].id, {'like': True})
+            self.assertFalse(LeaderboardEntry.objects.exists())
+            self.assertEqual([self.books[0].id], [row['id'] for row in leaderboards.top(leaderboards.LIKES)])
+
+
+@override_settings(STORE_LEADERBOARDS=True)
+class LeaderboardApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test username')
+        self.user2 = User.objects.create(username='test username2')
+        self.book1 = Book.objects.create(name='Test book 1', price=100, author_name='author1')
+        self.book2 = Book.objects.create(name='Test book 2', price=100, author_name='author2')
+        self.book3 = Book.objects.create(name='Test book 3', price=100, author_name='author2')
+        for user in (self.user, self.user2):
+            UserBookRelation.objects.create(user=user, book=self.book2, like=True, rate=4)
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True, rate=5)
+
+    def test_likes(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('leaderboard', args=('likes',)))
+        self.assertEqual(1, len(queries))
+        self.assertEqual([
+            {'rank': 1, 'id': self.book2.id, 'name': 'Test book 2', 'author_name': 'author2', 'likes_count': 2,
+             'rating': '4.00'},
+            {'rank': 2, 'id': self.book1.id, 'name': 'Test book 1', 'author_name': 'author1', 'likes_count': 1,
+             'rating': '5.00'},
+        ], response.data)
+
+    def test_rating_by_author(self):
+        response = self.client.get(reverse('leaderboard', args=('rating',)))
+        self.assertEqual([self.book1.id, self.book2.id], [row['id'] for row in response.data])
+        response = self.client.get(reverse('leaderboard', args=('rating',)), {'author': 'author2', 'limit': 1})
+        self.assertEqual([self.book2.id], [row['id'] for row in response.data])
+        response = self.client.get(reverse('leaderboard', args=('rating',)), {'author': 'nobody'})
+        self.assertEqual([], response.data)
+
+    def test_invalid(self):
+        self.assertEqual(status.HTTP_404_NOT_FOUND,
+                         self.client.get(reverse('leaderboard', args=('price',))).status_code)
+        for limit in ('0', '101', 'ten'):
+            response = self.client.get(reverse('leaderboard', args=('likes',)), {'limit': limit})
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
@@ -0,0 +1,148 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store import cache
+from store.logic import delta_encode, user_library
+from store.models import Book, UserBookRelation
+
+
+class LibraryApiTestCase(APITestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        self.user = User.objects.create(username='test username')
+        self.user2 = User.objects.create(username='test username2')
+        self.books = [Book.objects.create(name=f'Test book {i}', price=100, author_name='author1', owner=self.user)
+                      for i in range(5)]
+        UserBookRelation.objects.create(user=self.user, book=self.books[3], like=True, rate=4)
+        UserBookRelation.objects.create(user=self.user, book=self.books[0], like=True, in_bookmarks=True)
+        UserBookRelation.objects.create(user=self.user, book=self.books[4], in_bookmarks=True, rate=2)
+        UserBookRelation.objects.create(user=self.user, book=self.books[1])
+        UserBookRelation.objects.create(user=self.user2, book=self.books[2], like=True)
+        self.ids = [book.id for book in self.books]
+        self.url = reverse('me-library')
+
+    def test_get(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('ids', response.data['encoding'])
+        self.assertEqual([self.ids[0], self.ids[3]], response.data['liked'])
+        self.assertEqual([self.ids[0], self.ids[4]], response.data['bookmarked'])
+        self.assertEqual([self.ids[3], self.ids[4]], response.data['rated'])
+        self.assertEqual([4, 2], response.data['rates'])
+        self.assertEqual(user_library(self.user.id), {name: response.data[name] for name in user_library(self.user.id)})
+
+    def test_delta(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url, {'encoding': 'delta'})
+        self.assertEqual([self.ids[0], self.ids[3] - self.ids[0]], response.data['liked'])
+        self.assertEqual([4, 2], response.data['rates'])
+        self.assertEqual([3, 7, 2], delta_encode([3, 10, 12]))
+
+        response = self.client.get(self.url, {'encoding': 'bitmap'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_anonymous(self):
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(self.url).status_code)
+
+    def test_cached_until_relations_change(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(0, len(queries))
+        self.assertEqual(etag, response['ETag'])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+        # Other users' writes leave the library alone.
+        self.client.force_authenticate(self.user2)
+        self.client.patch(reverse('userbookrelation-detail', args=(self.ids[1],)), {'like': True}, format='json')
+        self.client.force_authenticate(self.user)
+        self.assertEqual(etag, self.client.get(self.url)['ETag'])
+
+        self.client.patch(reverse('userbookrelation-detail', args=(self.ids[1],)), {'in_bookmarks': True},
+                          format='json')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([self.ids[0], self.ids[1], self.ids[4]], response.data['bookmarked'])
+
+        self.client.post(reverse('userbookrelation-bulk'), [{'book': self.ids[2], 'rate': 5}], format='json')
+        self.assertEqual([self.ids[2], self.ids[3], self.ids[4]], self.client.get(self.url).data['rated'])
+
+        self.books[0].delete()
+        self.assertEqual([self.ids[3]], self.client.get(self.url).data['liked'])
+
+
+class BooksMyStateApiTestCase(APITestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        self.user = User.objects.create(username='test username')
+        self.user2 = User.objects.create(username='test username2')
+        self.book1 = Book.objects.create(name='Test book 1', price=100, author_name='author1', owner=self.user)
+        self.book2 = Book.objects.create(name='Test book 2', price=200, author_name='author2', owner=self.user)
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book2, in_bookmarks=True)
+
+    def state(self, data):
+        return [(book['id'], book['my_like'], book['my_in_bookmarks'], book['my_rate']) for book in data]
+
+    def test_list(self):
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book-list'), {'with_my_state': 1})
+        self.assertEqual(3, len(queries))
+        self.assertEqual([(self.book1.id, True, False, 5), (self.book2.id, False, False, None)],
+                         self.state(response.data))
+        self.assertEqual(response.data, self.client.get(reverse('book-list'), {'with_my_state': 1}).data)
+
+        # The cached response of one user isn't served to another.
+        self.client.force_authenticate(self.user2)
+        response = self.client.get(reverse('book-list'), {'with_my_state': 1})
+        self.assertEqual([(self.book1.id, False, False, None), (self.book2.id, False, True, None)],
+                         self.state(response.data))
+        self.assertIn('Authorization', response['Vary'])
+
+    def test_fast_list_parity(self):
+        self.client.force_authenticate(self.user)
+        params = {'with_my_state': 1, 'page_size': 10}
+        expected = self.client.get(reverse('book-list'), params).data
+        cache.get_cache().clear()
+        for settings in ({'STORE_FAST_BOOK_LIST': True}, {'STORE_BOOK_SUMMARY': True}):
+            with override_settings(**settings):
+                self.assertEqual(expected, self.client.get(reverse('book-list'), params).data)
+            cache.get_cache().clear()
+
+    def test_detail(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('book-detail', args=(self.book1.id,))
+        response = self.client.get(url, {'with_my_state': 1})
+        self.assertEqual(True, response.data['my_like'])
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+
+        self.client.patch(reverse('userbookrelation-detail', args=(self.book1.id,)), {'in_bookmarks': True},
+                          format='json')
+        response = self.client.get(url, {'with_my_state': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(True, response.data['my_in_bookmarks'])
+
+    def test_sparse_fields(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('book-list'), {'with_my_state': 1, 'fields': 'id,my_rate'})
+        self.assertEqual([{'id': self.book1.id, 'my_rate': 5}, {'id': self.book2.id, 'my_rate': None}], response.data)
+
+        response = self.client.get(reverse('book-list'), {'fields': 'id,my_rate'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_without_my_state(self):
+        response = self.client.get(reverse('book-list'), {'with_my_state': 1})
+        self.assertNotIn('my_like', response.data[0])
+        self.client.force_authenticate(self.user)
+        self.assertNotIn('my_like', self.client.get(reverse('book-list')).data[0])
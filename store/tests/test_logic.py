@@ -1,7 +1,14 @@
+from io import StringIO
+from unittest import skipUnless
+
 from django.contrib.auth.models import User
-from store.logic import set_rating
-from django.test import TestCase
-from store.models import UserBookRelation, Book
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from store.logic import (set_rating, rebuild_ratings, process_pending_ratings, enqueue_relation_write,
+                         process_relation_writes, upsert_relation)
+from django.test import TestCase, override_settings
+from store.models import UserBookRelation, Book, PendingRating, PendingRelationWrite
 
 
 class SetRatingTestCase(TestCase):
@@ -26,3 +33,233 @@ class SetRatingTestCase(TestCase):
         set_rating(self.book1)
         self.book1.refresh_from_db()
         self.assertEqual('4.67', str(self.book1.rating))
+
+    def test_incremental(self):
+        self.book1.refresh_from_db()
+        self.assertEqual('4.67', str(self.book1.rating))
+        self.assertEqual((14, 3), (self.book1.rating_sum, self.book1.rating_count))
+
+        relation = UserBookRelation.objects.get(user=self.user3, book=self.book1)
+        relation.rate = 2
+        with CaptureQueriesContext(connection) as queries:
+            relation.save()
+        self.assertFalse([query for query in queries if 'AVG' in query['sql'].upper()])
+        self.book1.refresh_from_db()
+        self.assertEqual('4.00', str(self.book1.rating))
+
+        relation.rate = None
+        relation.save()
+        self.book1.refresh_from_db()
+        self.assertEqual('5.00', str(self.book1.rating))
+        self.assertEqual((10, 2), (self.book1.rating_sum, self.book1.rating_count))
+
+    def test_incremental_unchanged_rate(self):
+        relation = UserBookRelation.objects.get(user=self.user1, book=self.book1)
+        relation.in_bookmarks = True
+        with CaptureQueriesContext(connection) as queries:
+            relation.save()
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "store_book"')])
+
+    def test_incremental_last_rate_removed(self):
+        relation = UserBookRelation.objects.create(user=self.user1, book=self.book2, rate=3)
+        self.book2.refresh_from_db()
+        self.assertEqual('3.00', str(self.book2.rating))
+        relation.rate = None
+        relation.save()
+        self.book2.refresh_from_db()
+        self.assertIsNone(self.book2.rating)
+        self.assertEqual((0, 0), (self.book2.rating_sum, self.book2.rating_count))
+
+    def test_bulk_delete(self):
+        self.user3.delete()
+        UserBookRelation.objects.filter(user=self.user2).delete()
+        self.book1.refresh_from_db()
+        self.assertEqual(1, self.book1.likes_count)
+        self.assertEqual(('5.00', 5, 1), (str(self.book1.rating), self.book1.rating_sum, self.book1.rating_count))
+
+
+class UpsertRelationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='username1')
+        self.book = Book.objects.create(name='Test book 1', price='100.00', author_name='Mark 1')
+
+    @skipUnless(connection.vendor == 'postgresql', 'the xmax upsert runs on PostgreSQL')
+    def test_update_existing_twice(self):
+        relation, created = upsert_relation(self.user.id, self.book.id, {'like': True, 'rate': 4})
+        self.assertTrue(created)
+
+        relation, created = upsert_relation(self.user.id, self.book.id, {'rate': 2})
+        self.assertFalse(created)
+        self.assertEqual((True, 2), (relation.like, relation.rate))
+        relation, created = upsert_relation(self.user.id, self.book.id, {'like': False})
+        self.assertFalse(created)
+        self.assertEqual((False, 2), (relation.like, relation.rate))
+
+        self.book.refresh_from_db()
+        self.assertEqual((0, 2, 1), (self.book.likes_count, self.book.rating_sum, self.book.rating_count))
+        self.assertEqual(1, UserBookRelation.objects.count())
+
+    def test_unknown_book(self):
+        with self.assertRaises(Book.DoesNotExist):
+            upsert_relation(self.user.id, self.book.id + 1, {'like': True})
+        self.assertFalse(UserBookRelation.objects.exists())
+
+
+class RebuildRatingsTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='username1')
+        self.user2 = User.objects.create(username='username2')
+        self.book1 = Book.objects.create(name='Test book 1', price='100.00', author_name='Mark 1')
+        self.book2 = Book.objects.create(name='Test book 2', price='200.00', author_name='Mark 1')
+        UserBookRelation.objects.create(user=self.user1, book=self.book1, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book1, rate=2)
+
+    def test_no_drift(self):
+        version = Book.objects.get(pk=self.book1.pk).version
+        self.assertEqual(0, rebuild_ratings())
+        self.assertEqual(version, Book.objects.get(pk=self.book1.pk).version)
+
+    def test_drift(self):
+        UserBookRelation.objects.filter(user=self.user2).update(rate=4)
+        Book.objects.filter(pk=self.book2.pk).update(rating_sum=7, rating_count=1, rating=7)
+        out = StringIO()
+        call_command('rebuild_ratings', stdout=out)
+        self.assertIn('2 book(s) had drifted', out.getvalue())
+        self.book1.refresh_from_db()
+        self.book2.refresh_from_db()
+        self.assertEqual(('4.50', 9, 2), (str(self.book1.rating), self.book1.rating_sum, self.book1.rating_count))
+        self.assertEqual((None, 0, 0), (self.book2.rating, self.book2.rating_sum, self.book2.rating_count))
+
+
+class CheckLikesTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='username1')
+        self.book = Book.objects.create(name='Test book 1', price='100.00', author_name='Mark 1')
+        UserBookRelation.objects.create(user=self.user, book=self.book, like=True)
+
+    def test_consistent(self):
+        out = StringIO()
+        call_command('check_likes', stdout=out)
+        self.assertIn('All like counters are consistent', out.getvalue())
+
+    def test_fix(self):
+        Book.objects.filter(pk=self.book.pk).update(likes_count=5)
+        out = StringIO()
+        call_command('check_likes', stdout=out)
+        self.assertIn(f'Book {self.book.pk}: likes_count=5, expected 1', out.getvalue())
+        self.book.refresh_from_db()
+        self.assertEqual(5, self.book.likes_count)
+
+        call_command('check_likes', '--fix', stdout=out)
+        self.book.refresh_from_db()
+        self.assertEqual(1, self.book.likes_count)
+
+
+@override_settings(STORE_RATING_MODE='deferred')
+class DeferredRatingTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='username1')
+        self.user2 = User.objects.create(username='username2')
+        self.book1 = Book.objects.create(name='Test book 1', price='100.00', author_name='Mark 1')
+        self.book2 = Book.objects.create(name='Test book 2', price='200.00', author_name='Mark 1')
+
+    def test_deferred(self):
+        UserBookRelation.objects.create(user=self.user1, book=self.book1, like=True, rate=5)
+        relation = UserBookRelation.objects.create(user=self.user2, book=self.book1, rate=2)
+        relation.rate = 3
+        relation.save()
+        UserBookRelation.objects.create(user=self.user1, book=self.book2, in_bookmarks=True)
+
+        self.book1.refresh_from_db()
+        self.assertEqual((None, 0, 0, 1),
+                         (self.book1.rating, self.book1.rating_sum, self.book1.rating_count, self.book1.likes_count))
+        self.assertEqual([self.book1.id], list(PendingRating.objects.values_list('book_id', flat=True)))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(1, process_pending_ratings())
+        self.assertEqual(0, process_pending_ratings())
+        self.assertEqual(2, len([query for query in queries if query['sql'].startswith('UPDATE "store_book"')]))
+
+        self.book1.refresh_from_db()
+        self.assertEqual(('4.00', 8, 2), (str(self.book1.rating), self.book1.rating_sum, self.book1.rating_count))
+        self.assertFalse(PendingRating.objects.exists())
+
+    def test_keeps_queue_position(self):
+        UserBookRelation.objects.create(user=self.user1, book=self.book1, rate=5)
+        enqueued_at = PendingRating.objects.get().enqueued_at
+        UserBookRelation.objects.create(user=self.user2, book=self.book1, rate=1)
+        self.assertEqual(enqueued_at, PendingRating.objects.get().enqueued_at)
+
+    def test_delay(self):
+        UserBookRelation.objects.create(user=self.user1, book=self.book1, rate=5)
+        self.assertEqual(0, process_pending_ratings(delay=60))
+        self.assertEqual(1, process_pending_ratings(delay=0))
+
+    def test_delete(self):
+        relation = UserBookRelation.objects.create(user=self.user1, book=self.book1, rate=5)
+        process_pending_ratings()
+        relation.delete()
+        process_pending_ratings()
+        self.book1.refresh_from_db()
+        self.assertEqual((None, 0), (self.book1.rating, self.book1.rating_count))
+
+    def test_command(self):
+        for book in (self.book1, self.book2):
+            UserBookRelation.objects.create(user=self.user1, book=book, rate=4)
+        out = StringIO()
+        call_command('process_ratings', '--once', '--delay', '0', '--batch-size', '1', stdout=out)
+        self.assertIn('Done, 2 rating(s) recomputed.', out.getvalue())
+        self.assertEqual(['4.00', '4.00'], [str(book.rating) for book in Book.objects.order_by('id')])
+
+
+class CoalescedRelationWritesTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'username{i}') for i in range(3)]
+        self.book1 = Book.objects.create(name='Test book 1', price='100.00', author_name='Mark 1')
+        self.book2 = Book.objects.create(name='Test book 2', price='200.00', author_name='Mark 1')
+
+    def test_merges_writes(self):
+        UserBookRelation.objects.create(user=self.users[0], book=self.book1, like=True, rate=2)
+        enqueue_relation_write(self.users[0].id, self.book1.id, {'rate': 5})
+        enqueue_relation_write(self.users[0].id, self.book1.id, {'like': False})
+        merged = enqueue_relation_write(self.users[0].id, self.book1.id, {'in_bookmarks': True})
+        self.assertEqual({'rate': 5, 'like': False, 'in_bookmarks': True}, merged)
+        self.assertEqual(merged, PendingRelationWrite.objects.get().values)
+
+        self.assertEqual(1, process_relation_writes())
+        relation = UserBookRelation.objects.get()
+        self.assertEqual((False, True, 5), (relation.like, relation.in_bookmarks, relation.rate))
+        self.book1.refresh_from_db()
+        self.assertEqual((0, '5.00', 1), (self.book1.likes_count, str(self.book1.rating), self.book1.rating_count))
+        self.assertFalse(PendingRelationWrite.objects.exists())
+
+    def test_one_counter_update_per_book(self):
+        for rate, user in enumerate(self.users, start=3):
+            enqueue_relation_write(user.id, self.book1.id, {'like': True, 'rate': rate})
+        enqueue_relation_write(self.users[0].id, self.book2.id, {'like': True})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(4, process_relation_writes())
+        self.assertEqual(2, len([query for query in queries if query['sql'].startswith('UPDATE "store_book"')]))
+
+        self.book1.refresh_from_db()
+        self.assertEqual((3, '4.00', 12, 3), (self.book1.likes_count, str(self.book1.rating),
+                                               self.book1.rating_sum, self.book1.rating_count))
+        self.book2.refresh_from_db()
+        self.assertEqual(1, self.book2.likes_count)
+
+    def test_delay(self):
+        enqueue_relation_write(self.users[0].id, self.book1.id, {'like': True})
+        self.assertEqual(0, process_relation_writes(delay=60))
+        self.assertEqual(1, process_relation_writes(delay=0))
+
+    def test_unknown_book(self):
+        with self.assertRaises(Book.DoesNotExist):
+            enqueue_relation_write(self.users[0].id, self.book2.id + 100, {'like': True})
+
+    def test_command(self):
+        enqueue_relation_write(self.users[0].id, self.book1.id, {'like': True})
+        out = StringIO()
+        call_command('process_relation_writes', '--once', '--delay', '0', stdout=out)
+        self.assertIn('Done, 1 relation write(s) applied.', out.getvalue())
+        self.assertTrue(UserBookRelation.objects.get().like)
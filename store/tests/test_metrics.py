@@ -0,0 +1,111 @@
+import json
+import re
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store import cache
+from store.metrics import metrics
+from store.models import Book, UserBookRelation
+from store.serializers import BooksSerializer
+from store.tests.utils import query_budget
+
+
+class MetricsMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        metrics.reset()
+        self.user = User.objects.create(username='test username')
+        self.book = Book.objects.create(name='Test book 1', price=100, author_name='author1', owner=self.user)
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response.content.decode()
+
+    @override_settings(STORE_METRICS_SAMPLE_RATE=1)
+    def test_sampled(self):
+        response = self.client.get(reverse('book-list'))
+        db, serialize, render, total = response['Server-Timing'].split(', ')
+        self.assertRegex(db, r'^db;dur=[\d.]+;desc="3 queries"$')
+        self.assertRegex(serialize, r'^serialize;dur=[\d.]+$')
+        self.assertRegex(render, r'^render;dur=[\d.]+$')
+        self.assertRegex(total, r'^total;dur=[\d.]+$')
+
+        text = self.scrape()
+        self.assertIn('store_requests_total{endpoint="book-list",method="GET",status="200"} 1', text)
+        self.assertIn('store_request_duration_seconds_count{endpoint="book-list",method="GET"} 1', text)
+        self.assertIn('store_request_duration_seconds_bucket{endpoint="book-list",method="GET",le="+Inf"} 1', text)
+        self.assertIn('store_sampled_requests_total{endpoint="book-list",method="GET"} 1', text)
+        self.assertIn('store_db_queries_total{endpoint="book-list",method="GET"} 3', text)
+
+    @override_settings(STORE_METRICS_SAMPLE_RATE=1)
+    def test_serialize_apart_from_render(self):
+        to_representation = BooksSerializer.to_representation
+        # A clock that only moves while serializing.
+        now = [0.0]
+
+        def slow_to_representation(serializer, instance):
+            now[0] += 0.05
+            return to_representation(serializer, instance)
+
+        with mock.patch('store.metrics.time') as clock, \
+                mock.patch.object(BooksSerializer, 'to_representation', slow_to_representation):
+            clock.perf_counter.side_effect = lambda: now[0]
+            response = self.client.get(reverse('book-detail', args=(self.book.id,)))
+        timings = dict(re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing']))
+        self.assertEqual('50.00', timings['serialize'])
+        self.assertEqual('0.00', timings['render'])
+        self.assertIn('store_serialize_duration_seconds_total{endpoint="book-detail",method="GET"}', self.scrape())
+
+    @override_settings(STORE_METRICS_SAMPLE_RATE=1)
+    def test_views_without_serialize_timing(self):
+        response = self.client.get(reverse('author-list'))
+        self.assertNotIn('serialize', response['Server-Timing'])
+
+    @override_settings(STORE_METRICS_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        response = self.client.get(reverse('book-detail', args=(self.book.id + 100,)))
+        self.assertNotIn('Server-Timing', response)
+        text = self.scrape()
+        self.assertIn('store_requests_total{endpoint="book-detail",method="GET",status="404"} 1', text)
+        self.assertNotIn('store_sampled_requests_total{endpoint="book-detail"', text)
+
+    def test_forbidden(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+
+class BooksQueryBudgetTestCase(APITestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        self.user = User.objects.create(username='test username')
+        self.books = [Book.objects.create(name=f'Test book {i}', price=100, author_name='author1', owner=self.user)
+                      for i in range(5)]
+        for book in self.books:
+            UserBookRelation.objects.create(user=self.user, book=book, like=True, rate=4)
+
+    @query_budget(list=3, retrieve=3, create=4, partial_update=5, destroy=8)
+    def test_budgets(self):
+        self.client.get(reverse('book-list'))
+        self.client.get(reverse('book-list'), {'readers': 'count', 'page_size': 2})
+        self.client.get(reverse('book-detail', args=(self.books[0].id,)))
+
+        self.client.force_login(self.user)
+        data = json.dumps({'name': 'New book', 'price': '10.00', 'author_name': 'author2'})
+        self.client.post(reverse('book-list'), data=data, content_type='application/json')
+        url = reverse('book-detail', args=(self.books[0].id,))
+        self.client.patch(url, data=json.dumps({'price': '20.00'}), content_type='application/json')
+        self.client.delete(url)
+
+    def test_over_budget(self):
+        @query_budget(list=1)
+        def over_budget(test):
+            test.client.get(reverse('book-list'))
+
+        with self.assertRaisesRegex(AssertionError, 'list: 3 queries, budget 1'):
+            over_budget(self)
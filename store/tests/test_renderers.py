@@ -0,0 +1,35 @@
+import json
+from decimal import Decimal
+from unittest import mock, skipIf
+
+from django.test import SimpleTestCase
+from rest_framework.renderers import JSONRenderer
+
+from store import renderers
+from store.renderers import FastJSONRenderer
+
+
+@skipIf(renderers.orjson is None, 'orjson is not installed')
+class FastJSONRendererTestCase(SimpleTestCase):
+    def test_render(self):
+        data = [{'id': 1, 'name': 'Книга', 'price': Decimal('25.00'), 'discount': None, 'readers': []}]
+        rendered = FastJSONRenderer().render(data)
+        self.assertEqual({'id': 1, 'name': 'Книга', 'price': '25.00', 'discount': None, 'readers': []},
+                         json.loads(rendered)[0])
+
+    def test_matches_stock_renderer(self):
+        data = {'count': 2, 'results': [{'name': 'Test book 1', 'price': '25.00', 'rating': None}]}
+        self.assertEqual(json.loads(JSONRenderer().render(data)), json.loads(FastJSONRenderer().render(data)))
+
+    def test_empty(self):
+        self.assertEqual(b'', FastJSONRenderer().render(None))
+
+    def test_indent_falls_back(self):
+        rendered = FastJSONRenderer().render({'id': 1}, 'application/json; indent=2')
+        self.assertEqual(b'{\n  "id": 1\n}', rendered)
+
+
+class FastJSONRendererFallbackTestCase(SimpleTestCase):
+    def test_without_orjson(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(b'{"id":1}', FastJSONRenderer().render({'id': 1}))
@@ -21,14 +21,13 @@ class BookSerializerTestCase(TestCase):
         UserBookRelation.objects.create(user=user2, book=book1, like=True, rate=5)
         UserBookRelation.objects.create(user=user3, book=book1, like=True, rate=4)
         UserBookRelation.objects.create(user=user1, book=book2, like=True, rate=4)
-        UserBookRelation.objects.create(user=user1, book=book2, like=True, rate=5)
-        user_book = UserBookRelation.objects.create(user=user1, book=book2, like=False)
+        UserBookRelation.objects.create(user=user2, book=book2, like=True, rate=5)
+        user_book = UserBookRelation.objects.create(user=user3, book=book2, like=False)
         user_book.rate = 5
         user_book.save()
 
         books = Book.objects.all().annotate(
             owner_name=F('owner__username'),
-            price_with_discount=F('price') - F('discount'),
             annotated_likes=Count(Case(When(userbookrelation__like=True, then=1)))).order_by('id')
         data = BooksSerializer(books, many=True).data
         expected_data = [
@@ -74,12 +73,12 @@ class BookSerializerTestCase(TestCase):
                         'last_name': 'Petrov'
                     },
                     {
-                        'first_name': 'Ivan',
-                        'last_name': 'Petrov'
+                        'first_name': 'Shpak',
+                        'last_name': 'Shpakov'
                     },
                     {
-                        'first_name': 'Ivan',
-                        'last_name': 'Petrov'
+                        'first_name': 'Bisk',
+                        'last_name': 'Biskanov'
                     }
                 ],
 
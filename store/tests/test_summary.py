@@ -0,0 +1,130 @@
+import json
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store import cache
+from store.logic import bulk_upsert_relations, rebuild_ratings
+from store.models import Book, BookSummary, UserBookRelation
+from store.views import BOOK_ANNOTATIONS
+
+COLUMNS = ('id', 'name', 'author_name', 'price', 'discount', 'price_with_discount', 'owner_name', 'likes_count',
+           'rating', 'version', 'updated_at')
+
+
+@override_settings(STORE_BOOK_SUMMARY=True)
+class BookSummaryTestCase(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='test username', first_name='Ivan', last_name='Petrov')
+        self.user2 = User.objects.create(username='test username2', first_name='Shpak', last_name='Shpakov')
+        self.book1 = Book.objects.create(name='Test book 1', price=100, author_name='author1', owner=self.user1,
+                                         discount='15.50')
+        self.book2 = Book.objects.create(name='Test book 2', price=200, author_name='author2', owner=self.user2)
+        self.book3 = Book.objects.create(name='Test book 3 author1', price=200, author_name='author3')
+        UserBookRelation.objects.create(user=self.user1, book=self.book1, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book1, rate=2)
+        UserBookRelation.objects.create(user=self.user2, book=self.book2, like=True)
+        self.url = reverse('book-list')
+
+    def assertParity(self):
+        live = Book.objects.annotate(**BOOK_ANNOTATIONS).order_by('id').values_list(
+            *COLUMNS[:5], 'price_with_discount', 'owner_name', 'annotated_likes', *COLUMNS[8:])
+        self.assertEqual(list(live), list(BookSummary.objects.order_by('id').values_list(*COLUMNS)))
+
+    def get(self, params, summary):
+        cache.get_cache().clear()
+        with override_settings(STORE_BOOK_SUMMARY=summary):
+            response = self.client.get(self.url, params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response
+
+    def test_incremental(self):
+        self.assertParity()
+
+        self.client.force_login(self.user2)
+        url = reverse('userbookrelation-detail', args=(self.book3.id,))
+        self.client.patch(url, data=json.dumps({'like': True, 'rate': 4}), content_type='application/json')
+        self.assertParity()
+
+        bulk_upsert_relations(self.user1.id, [{'book_id': self.book2.id, 'rate': 3},
+                                              {'book_id': self.book3.id, 'like': True}])
+        self.assertParity()
+
+        UserBookRelation.objects.get(user=self.user1, book=self.book1).delete()
+        self.assertParity()
+
+        self.client.force_login(self.user1)
+        url = reverse('book-detail', args=(self.book1.id,))
+        self.client.patch(url, data=json.dumps({'discount': '20.00', 'name': 'Renamed'}),
+                          content_type='application/json')
+        self.assertParity()
+
+        self.user2.username = 'renamed'
+        self.user2.save()
+        self.assertParity()
+
+        self.user2.delete()
+        self.assertParity()
+
+        self.book3.delete()
+        self.assertParity()
+
+        Book.objects.filter(pk=self.book1.pk).update(rating_sum=0, rating_count=0, rating=None)
+        rebuild_ratings()
+        self.assertParity()
+
+    def test_import(self):
+        self.client.force_login(self.user1)
+        content = 'name,author_name,price,discount\nImported 1,Author,10.00,1.00\nImported 2,Author,20.00,\n'
+        file = SimpleUploadedFile('books.csv', content.encode())
+        self.client.post(reverse('book-import-books'), data={'file': file}, format='multipart')
+        self.assertEqual(5, BookSummary.objects.count())
+        self.assertParity()
+
+    def test_deferred_rating(self):
+        with override_settings(STORE_RATING_MODE='deferred'):
+            UserBookRelation.objects.create(user=self.user1, book=self.book2, rate=1)
+            call_command('process_ratings', '--once', '--delay', '0', stdout=StringIO())
+        self.assertParity()
+
+    def test_api_parity(self):
+        for params in ({}, {'fields': 'id,name,owner_name,price_with_discount'}, {'readers': 'count'},
+                       {'readers': '1', 'ordering': '-price'}, {'page_size': 2, 'ordering': 'author_name'},
+                       {'search': 'author1'}, {'price': 200}):
+            with self.subTest(params=params):
+                live, summary = self.get(params, summary=False), self.get(params, summary=True)
+                self.assertEqual(live.data, summary.data)
+                self.assertEqual(live['ETag'], summary['ETag'])
+
+    def test_no_joins(self):
+        cache.get_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {'readers': 'none'})
+        book_queries = [query['sql'] for query in queries if 'store_booksummary' in query['sql']]
+        self.assertEqual(2, len(book_queries))
+        self.assertFalse([sql for sql in book_queries if 'JOIN' in sql])
+
+    def test_rebuild(self):
+        BookSummary.objects.filter(pk=self.book1.pk).update(name='Stale', likes_count=10)
+        BookSummary.objects.filter(pk=self.book2.pk).delete()
+        BookSummary.objects.create(id=self.book3.id + 100, name='Gone', author_name='', price=1,
+                                   updated_at=self.book3.updated_at)
+        out = StringIO()
+        call_command('rebuild_book_summaries', stdout=out)
+        self.assertIn('Rebuilt 3 book summary row(s).', out.getvalue())
+        self.assertParity()
+
+    def test_disabled(self):
+        BookSummary.objects.all().delete()
+        with override_settings(STORE_BOOK_SUMMARY=False):
+            Book.objects.create(name='Test book 4', price=10, author_name='author4')
+            UserBookRelation.objects.create(user=self.user1, book=self.book2, like=True)
+        self.assertFalse(BookSummary.objects.exists())
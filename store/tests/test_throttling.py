@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store import cache, throttling
+from store.models import Book
+
+
+@override_settings(STORE_RELATION_THROTTLE_RATE='2/s', STORE_RELATION_THROTTLE_BURST=3)
+class RelationWriteThrottleTestCase(APITestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        throttling.local_buckets.clear()
+        self.user = User.objects.create(username='test username')
+        self.user2 = User.objects.create(username='test username2')
+        self.book = Book.objects.create(name='Test book 1', price=100, author_name='author1', owner=self.user)
+        self.url = reverse('userbookrelation-detail', args=(self.book.id,))
+        self.now = 1000.0
+        patcher = mock.patch.object(throttling.time, 'time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, user=None):
+        self.client.force_authenticate(user or self.user)
+        return self.client.patch(self.url, {'like': True}, format='json')
+
+    def assertBucket(self):
+        for _ in range(3):
+            self.assertEqual(status.HTTP_200_OK, self.write().status_code)
+        response = self.write()
+        self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, response.status_code)
+        self.assertEqual('1', response['Retry-After'])
+
+        # Other users have buckets of their own.
+        self.assertEqual(status.HTTP_200_OK, self.write(self.user2).status_code)
+
+        # A token comes back every half second.
+        self.now += 0.5
+        self.assertEqual(status.HTTP_200_OK, self.write().status_code)
+        self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, self.write().status_code)
+        self.now += 10
+        for _ in range(3):
+            self.assertEqual(status.HTTP_200_OK, self.write().status_code)
+
+    def test_local(self):
+        self.assertBucket()
+
+    @override_settings(STORE_RELATION_THROTTLE_BACKEND='cache')
+    def test_cache(self):
+        self.assertBucket()
+        self.assertFalse(throttling.local_buckets.tats)
+
+    def test_disabled(self):
+        with override_settings(STORE_RELATION_THROTTLE_RATE=None):
+            for _ in range(5):
+                self.assertEqual(status.HTTP_200_OK, self.write().status_code)
+
+    def test_bulk(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('userbookrelation-bulk')
+        statuses = [self.client.post(url, [{'book': self.book.id, 'rate': 3}], format='json').status_code
+                    for _ in range(4)]
+        self.assertEqual([200, 200, 200, 429], statuses)
+
+    def test_bulk_costs_a_token_per_item(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('userbookrelation-bulk')
+        books = [Book.objects.create(name=f'Test book {i}', price=100, author_name='author1') for i in range(2, 7)]
+        items = [{'book': book.id, 'like': True} for book in books]
+        self.assertEqual(status.HTTP_200_OK, self.client.post(url, items[:2], format='json').status_code)
+        response = self.client.post(url, items[:2], format='json')
+        self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, response.status_code)
+        self.assertEqual(status.HTTP_200_OK, self.write().status_code)
+
+        # More items than the bucket holds go through once it is full, then the debt has to be waited out.
+        self.now += 10
+        self.assertEqual(status.HTTP_200_OK, self.client.post(url, items, format='json').status_code)
+        response = self.write()
+        self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, response.status_code)
+        self.assertEqual('2', response['Retry-After'])
+        self.now += 1.5
+        self.assertEqual(status.HTTP_200_OK, self.write().status_code)
+
+    def test_parse_rate(self):
+        self.assertEqual(0.1, throttling.parse_rate('10/s'))
+        self.assertEqual(2, throttling.parse_rate('30/min'))
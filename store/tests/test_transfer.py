@@ -0,0 +1,145 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store import cache
+from store.models import Book
+
+CSV_FILE = '''name,author_name,price,discount
+Book 1,Author 1,100.00,10.00
+Book 2,Author 2,200.00,
+,Author 3,300.00,
+Book 4,Author 4,not a price,
+Book 5,Author 5,500.00,
+'''
+
+
+class BooksImportApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test username')
+        self.url = reverse('book-import-books')
+
+    def upload(self, name, content, **params):
+        file = SimpleUploadedFile(name, content.encode())
+        return self.client.post(self.url + ''.join(f'?{key}={value}' for key, value in params.items()),
+                                data={'file': file}, format='multipart')
+
+    def test_csv(self):
+        self.client.force_login(self.user)
+        response = self.upload('books.csv', CSV_FILE)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((3, 2), (response.data['created'], response.data['failed']))
+        self.assertEqual([4, 5], [error['line'] for error in response.data['errors']])
+        self.assertIn('name', response.data['errors'][0]['errors'])
+        self.assertIn('price', response.data['errors'][1]['errors'])
+
+        books = Book.objects.order_by('id')
+        self.assertEqual(['Book 1', 'Book 2', 'Book 5'], [book.name for book in books])
+        self.assertEqual(['10.00', None], [book.discount and str(book.discount) for book in books[:2]])
+        self.assertEqual({self.user.id}, {book.owner_id for book in books})
+
+    def test_jsonl(self):
+        self.client.force_login(self.user)
+        content = '\n'.join([
+            json.dumps({'name': 'Book 1', 'author_name': 'Author 1', 'price': '100.00'}),
+            '{broken',
+            '',
+            json.dumps(['not', 'an', 'object']),
+            json.dumps({'name': 'Book 2', 'author_name': 'Author 2', 'price': 200, 'discount': 5}),
+        ])
+        response = self.upload('books.txt', content, input='jsonl')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((2, 2), (response.data['created'], response.data['failed']))
+        self.assertEqual([2, 4], [error['line'] for error in response.data['errors']])
+
+    def test_invalidates_cache(self):
+        cache.get_cache().clear()
+        self.client.force_login(self.user)
+        self.assertEqual([], self.client.get(reverse('book-list')).data)
+        self.upload('books.csv', CSV_FILE)
+        self.assertEqual(3, len(self.client.get(reverse('book-list')).data))
+
+    def test_unknown_format(self):
+        self.client.force_login(self.user)
+        response = self.upload('books.xml', CSV_FILE)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_unauthorized(self):
+        response = self.upload('books.csv', CSV_FILE)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.assertFalse(Book.objects.exists())
+
+
+class BooksExportApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test username')
+        self.book1 = Book.objects.create(name='Test book 1', price=25, author_name='Author 1', discount=5,
+                                         owner=self.user)
+        self.book2 = Book.objects.create(name='Test book 2', price=55, author_name='Author, 2', owner=self.user)
+        self.url = reverse('book-export')
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        expected = ('id,name,author_name,price,discount,rating,likes_count\r\n'
+                    f'{self.book1.id},Test book 1,Author 1,25.00,5.00,,0\r\n'
+                    f'{self.book2.id},Test book 2,"Author, 2",55.00,,,0\r\n')
+        self.assertEqual(expected, self.export())
+
+    def test_jsonl(self):
+        rows = [json.loads(line) for line in self.export(output='jsonl').splitlines()]
+        self.assertEqual([self.book1.id, self.book2.id], [row['id'] for row in rows])
+        self.assertEqual({'id': self.book2.id, 'name': 'Test book 2', 'author_name': 'Author, 2', 'price': '55.00',
+                          'discount': None, 'rating': None, 'likes_count': 0}, rows[1])
+
+    def test_filter(self):
+        rows = self.export(output='jsonl', price=55).splitlines()
+        self.assertEqual([self.book2.id], [json.loads(row)['id'] for row in rows])
+
+    def test_round_trip(self):
+        content = self.export()
+        self.client.force_login(self.user)
+        file = SimpleUploadedFile('books.csv', content.encode())
+        response = self.client.post(reverse('book-import-books'), data={'file': file}, format='multipart')
+        self.assertEqual((2, 0), (response.data['created'], response.data['failed']))
+        self.assertEqual(2, Book.objects.filter(name='Test book 2').count())
+
+    def test_wrong_output(self):
+        response = self.client.get(self.url, {'output': 'xml'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+
+class ImportBooksCommandTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test username')
+        file, self.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(file, 'w') as csv_file:
+            csv_file.write(CSV_FILE)
+        self.addCleanup(os.remove, self.path)
+
+    def test_import(self):
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_books', self.path, '--owner', 'test username', '--chunk-size', '2', stdout=out)
+        self.assertIn('Imported 3 book(s), 2 row(s) failed.', out.getvalue())
+        self.assertIn('Line 4:', out.getvalue())
+        self.assertEqual(2, len([query for query in queries if query['sql'].startswith('INSERT INTO "store_book"')]))
+        self.assertEqual(3, Book.objects.filter(owner=self.user).count())
+
+    def test_unknown_owner(self):
+        with self.assertRaises(CommandError):
+            call_command('import_books', self.path, '--owner', 'nobody', stdout=StringIO())
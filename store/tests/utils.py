@@ -0,0 +1,55 @@
+from functools import wraps
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from store.views import BookViewSet
+
+
+class ExplainTestMixin:
+    """Asserts on the query plan: `EXPLAIN QUERY PLAN` on SQLite, `EXPLAIN` with seq scans disabled on PostgreSQL."""
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Tiny test tables are always cheaper to scan, so make the planner show what it can use.
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = self.explain(queryset)
+        self.assertTrue(any(name in plan for name in index_names),
+                        f'None of {", ".join(index_names)} is used by:\n{plan}')
+        return plan
+
+
+def query_budget(**budgets):
+    """
+    Fails the decorated test when a BookViewSet action runs more queries than its budget,
+    e.g. `@query_budget(list=3, retrieve=2)`. Rows a streaming response reads later aren't counted.
+    """
+
+    def decorator(test):
+        @wraps(test)
+        def wrapper(self, *args, **kwargs):
+            overruns = []
+            dispatch = BookViewSet.dispatch
+
+            def counted_dispatch(view, request, *view_args, **view_kwargs):
+                with CaptureQueriesContext(connection) as queries:
+                    response = dispatch(view, request, *view_args, **view_kwargs)
+                budget = budgets.get(view.action)
+                if budget is not None and len(queries) > budget:
+                    overruns.append(f'{view.action}: {len(queries)} queries, budget {budget}\n' +
+                                    '\n'.join(query['sql'] for query in queries))
+                return response
+
+            with mock.patch.object(BookViewSet, 'dispatch', counted_dispatch):
+                result = test(self, *args, **kwargs)
+            self.assertFalse(overruns, '\n\n'.join(overruns))
+            return result
+
+        return wrapper
+
+    return decorator
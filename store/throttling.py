@@ -0,0 +1,95 @@
+"""
+Token bucket throttling for relation writes.
+
+Buckets use GCRA (generic cell rate algorithm): each key stores only the time its bucket would be
+full again, which behaves like a bucket of STORE_RELATION_THROTTLE_BURST tokens refilled at
+STORE_RELATION_THROTTLE_RATE, and fits in one cache value. The 'local' backend keeps the buckets
+in process, so each worker allows the full rate. The 'cache' backend shares them through
+STORE_CACHE_ALIAS; its read-then-write can let a few concurrent requests over the limit.
+A bulk write costs a token per item. One larger than the bucket goes through once the bucket is full
+and leaves it in debt for the rest.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from store import cache
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """'10/s' -> 0.1, the seconds a token takes to refill."""
+    count, period = rate.split('/')
+    return PERIODS[period[0]] / int(count)
+
+
+def take(tat, now, interval, burst, cost=1):
+    """
+    Returns the new theoretical arrival time and 0 when `cost` tokens (at most `burst`) are available,
+    else None and the seconds to wait.
+    """
+    tat = max(tat or now, now)
+    wait = tat + interval * min(cost, burst) - now - interval * burst
+    return (tat + interval * cost, 0) if wait <= 0 else (None, wait)
+
+
+class LocalBuckets:
+    def __init__(self, max_keys=100000):
+        self.lock = threading.Lock()
+        self.tats = {}
+        self.max_keys = max_keys
+
+    def take(self, key, interval, burst, cost=1):
+        now = time.time()
+        with self.lock:
+            tat, wait = take(self.tats.get(key), now, interval, burst, cost)
+            if tat is not None:
+                self.tats[key] = tat
+                if len(self.tats) > self.max_keys:
+                    # Buckets that are full again hold no state worth keeping.
+                    self.tats = {key: tat for key, tat in self.tats.items() if tat > now}
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.tats.clear()
+
+
+class CacheBuckets:
+    def take(self, key, interval, burst, cost=1):
+        now = time.time()
+        tat, wait = take(cache.get_cache().get(key), now, interval, burst, cost)
+        if tat is not None:
+            cache.get_cache().set(key, tat, math.ceil(tat - now) + 1)
+        return wait
+
+
+local_buckets = LocalBuckets()
+BACKENDS = {'local': local_buckets, 'cache': CacheBuckets()}
+
+
+class RelationWriteThrottle(BaseThrottle):
+    """Limits each user's relation writes, reads and anonymous requests are left to the other checks."""
+    wait_seconds = None
+
+    def allow_request(self, request, view):
+        rate = settings.STORE_RELATION_THROTTLE_RATE
+        if rate is None or request.method in SAFE_METHODS or not request.user.is_authenticated:
+            return True
+        buckets = BACKENDS[settings.STORE_RELATION_THROTTLE_BACKEND]
+        self.wait_seconds = buckets.take(f'store:throttle:relations:{request.user.id}', parse_rate(rate),
+                                         settings.STORE_RELATION_THROTTLE_BURST, self.get_cost(request, view))
+        return self.wait_seconds == 0
+
+    def get_cost(self, request, view):
+        if getattr(view, 'action', None) == 'bulk' and isinstance(request.data, list):
+            return max(len(request.data), 1)
+        return 1
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,121 @@
+import csv
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from store import authors, leaderboards
+from store.cache import invalidate_all
+from store.logic import refresh_book_summaries
+from store.models import Book, BookSummary
+from store.serializers import BooksSerializer, READERS_NONE
+
+CSV = 'csv'
+JSONL = 'jsonl'
+FORMATS = (CSV, JSONL)
+CONTENT_TYPES = {CSV: 'text/csv', JSONL: 'application/x-ndjson'}
+
+IMPORT_FIELDS = ('name', 'author_name', 'price', 'discount')
+EXPORT_FIELDS = ('id', 'name', 'author_name', 'price', 'discount', 'rating', 'likes_count')
+
+
+def guess_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return {'csv': CSV, 'jsonl': JSONL, 'ndjson': JSONL}.get(extension)
+
+
+def read_rows(lines, fmt):
+    """
+    Yield `(line number, row, error)` for every record in an iterable of text lines.
+    `error` is set instead of `row` when the record itself can't be parsed.
+    """
+    if fmt == CSV:
+        reader = csv.DictReader(lines)
+        for row in reader:
+            # Empty cells are treated as missing, so optional columns like discount may be left blank.
+            yield reader.line_num, {key: value for key, value in row.items() if key is not None and value != ''}, None
+        return
+
+    for line_num, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_num, json.loads(line), None
+        except ValueError as exc:
+            yield line_num, None, {'non_field_errors': [f'Invalid JSON: {exc}']}
+
+
+def import_books(rows, owner=None, chunk_size=500, max_errors=100):
+    """
+    Validate rows from `read_rows` with BooksSerializer and insert the valid ones with one bulk_create per chunk.
+    Every chunk is committed on its own, so rejected rows don't roll back the rest of the file.
+    Returns a summary with the number of created books, failed rows and the first `max_errors` row errors.
+    """
+    serializer = BooksSerializer(context={'readers': READERS_NONE, 'fields': set(IMPORT_FIELDS)})
+    result = {'created': 0, 'failed': 0, 'errors': []}
+    chunk = []
+    for line, row, error in rows:
+        if error is None:
+            try:
+                chunk.append(Book(**serializer.run_validation(row), owner=owner))
+            except ValidationError as exc:
+                error = as_serializer_error(exc)
+
+        if error is not None:
+            result['failed'] += 1
+            if len(result['errors']) < max_errors:
+                result['errors'].append({'line': line, 'errors': error})
+        elif len(chunk) >= chunk_size:
+            result['created'] += _create_books(chunk)
+            chunk = []
+
+    result['created'] += _create_books(chunk)
+    return result
+
+
+def _create_books(books):
+    if not books:
+        return 0
+    # bulk_create skips Book.save and the post_save signal, so the stored price_with_discount, caches, summaries,
+    # author statistics and leaderboards are handled here.
+    for book in books:
+        book.set_price_with_discount()
+    Book.objects.bulk_create(books)
+    invalidate_all()
+    authors.refresh({book.author_name for book in books})
+    if all(book.pk for book in books):
+        refresh_book_summaries([book.pk for book in books])
+        leaderboards.add_books([book.pk for book in books])
+    else:
+        # Backends that don't return ids from bulk_create: pick up every book that has no summary yet.
+        refresh_book_summaries(Book.objects.exclude(pk__in=BookSummary.objects.values('id')).values('pk'))
+        leaderboards.refresh()
+    return len(books)
+
+
+def export_rows(queryset, fmt, chunk_size=2000):
+    """
+    Stream `queryset` as CSV or JSON Lines text, one chunk of rows at a time.
+    Rows are read with `iterator()`, which uses a server-side cursor on PostgreSQL.
+    """
+    rows = queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    if fmt == CSV:
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        encode = writer.writerow
+    else:
+        def encode(row):
+            return json.dumps(dict(zip(EXPORT_FIELDS, row)), cls=DjangoJSONEncoder) + '\n'
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield ''.join(encode(row) for row in chunk)
+
+
+class _Echo:
+    def write(self, value):
+        return value
@@ -1,42 +1,380 @@
+import csv
+import io
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import Count, Case, When, Avg, F
+from django.db import IntegrityError
+from django.db.models import Count, F, FilteredRelation, OuterRef, Prefetch, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import SearchFilter
+from rest_framework.generics import ListAPIView
 from rest_framework.mixins import UpdateModelMixin
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
-from store.models import Book, UserBookRelation
+from store import authors, cache, conditional, db, leaderboards, transfer
+from store.filters import AuthorOrderingFilter, AuthorStatsFilter, BookFilter, BookOrderingFilter, BookSearchFilter
+from store.logic import (RELATION_VALUES, bulk_upsert_relations, delta_encode, enqueue_relation_write, upsert_relation,
+                         user_library)
+from store.metrics import SerializeTimingMixin
+from store.models import Book, BookSummary, UserBookRelation
+from store.pagination import AuthorKeysetPagination, BookKeysetPagination
 from store.permissions import IsOwnerOrStaffOrReadOnly
-from store.serializers import BooksSerializer, UserBookRelationSerializer
+from store.serializers import (AuthorStatsSerializer, BooksSerializer, BookValuesSerializer, UserBookRelationSerializer,
+                               MY_STATE_FIELDS, READERS_ALL, READERS_NONE, READERS_COUNT, reader_relations)
+from store.throttling import RelationWriteThrottle
+
+
+BOOK_ANNOTATIONS = {
+    'owner_name': F('owner__username'),
+    'annotated_likes': F('likes_count'),
+}
+
+
+def my_state_annotations(user):
+    # One LEFT JOIN on the (user, book) unique index instead of a lookup per book.
+    return {
+        'my_relation': FilteredRelation('userbookrelation', condition=Q(userbookrelation__user=user)),
+        'my_like': Coalesce(F('my_relation__like'), Value(False)),
+        'my_in_bookmarks': Coalesce(F('my_relation__in_bookmarks'), Value(False)),
+        'my_rate': F('my_relation__rate'),
+    }
+
+
+def readers_count():
+    relations = UserBookRelation.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    return Coalesce(Subquery(relations.annotate(total=Count('id')).values('total')), 0)
 
 
-class BookViewSet(ModelViewSet):
-    queryset = Book.objects.all().annotate(
-        owner_name=F('owner__username'),
-        annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))),
-        price_with_discount=F('price') - F('discount')).prefetch_related('readers').order_by('id')
+class BookViewSet(SerializeTimingMixin, ModelViewSet):
+    queryset = Book.objects.all().order_by('id')
     serializer_class = BooksSerializer
     permission_classes = [IsOwnerOrStaffOrReadOnly]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filter_fields = ['price']
+    filter_backends = [DjangoFilterBackend, BookSearchFilter, BookOrderingFilter]
+    filterset_class = BookFilter
     search_fields = ['name', 'author_name', 'price']
     ordering_fields = ['price', 'author_name']
+    ordering = ['id']
+    pagination_class = BookKeysetPagination
+    write_actions = ('update', 'partial_update', 'destroy')
+
+    def dispatch(self, request, *args, **kwargs):
+        with db.read_from_replica(request.method in SAFE_METHODS):
+            return super().dispatch(request, *args, **kwargs)
+
+    def get_queryset(self):
+        # BookSummary has no relations to join, so lists with the caller's state are read from Book.
+        if self.action == 'list' and settings.STORE_BOOK_SUMMARY and self.get_my_state_user() is None:
+            return self.get_summary_queryset()
+        if self.action in self.write_actions:
+            # The annotations would be stale after the write and the readers prefetch is dropped by it,
+            # perform_update fills the response fields in instead.
+            return Book.objects.all()
+
+        queryset = super().get_queryset()
+        fields = self.get_requested_fields()
+        queryset = queryset.annotate(**{name: expression for name, expression in BOOK_ANNOTATIONS.items()
+                                        if name in fields})
+        user = self.get_my_state_user()
+        if user is not None and fields & set(MY_STATE_FIELDS):
+            queryset = queryset.annotate(**my_state_annotations(user))
+
+        if self.request.method in SAFE_METHODS and fields != self.get_available_fields():
+            columns = {field.name for field in Book._meta.concrete_fields} & fields
+            queryset = queryset.only('id', *self.ordering_fields, *columns)
+
+        readers = self.get_readers_mode() if 'readers' in fields else READERS_NONE
+        if readers == READERS_COUNT:
+            queryset = queryset.annotate(readers_count=readers_count())
+        elif readers != READERS_NONE:
+            queryset = queryset.prefetch_related(
+                Prefetch('userbookrelation_set', queryset=reader_relations(readers), to_attr='reader_relations'))
+        return queryset
+
+    def get_summary_queryset(self):
+        queryset = BookSummary.objects.order_by('id').annotate(annotated_likes=F('likes_count'))
+        if 'readers' in self.get_requested_fields() and self.get_readers_mode() == READERS_COUNT:
+            queryset = queryset.annotate(readers_count=readers_count())
+        return queryset
+
+    def get_my_state_user(self):
+        """The caller when they asked for ?with_my_state=1 on a read, otherwise None."""
+        if self.action in ('list', 'retrieve') and self.request.user.is_authenticated \
+                and self.request.query_params.get('with_my_state') in ('1', 'true'):
+            return self.request.user
+        return None
+
+    def get_available_fields(self):
+        available = set(BooksSerializer.Meta.fields)
+        if self.get_my_state_user() is None:
+            available -= set(MY_STATE_FIELDS)
+        return available
+
+    def get_requested_fields(self):
+        available = self.get_available_fields()
+        fields, exclude = self.request.query_params.get('fields'), self.request.query_params.get('exclude')
+        requested = set(fields.split(',')) if fields else set(available)
+        excluded = set(exclude.split(',')) if exclude else set()
+
+        unknown = (requested | excluded) - available
+        if unknown:
+            raise ValidationError({'fields': f'Unknown field(s): {", ".join(sorted(unknown))}.'})
+
+        requested -= excluded
+        # readers_count is the ?readers=count form of readers.
+        if 'readers' in requested:
+            requested.add('readers_count')
+        return requested
+
+    def get_readers_mode(self):
+        readers = self.request.query_params.get('readers', READERS_ALL)
+        if readers in (READERS_ALL, READERS_NONE, READERS_COUNT):
+            return readers
+        if readers.isdigit():
+            return int(readers)
+        raise ValidationError({'readers': f'Expected one of all, none, count or a number, got "{readers}".'})
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['readers'] = self.get_readers_mode()
+        context['fields'] = self.get_requested_fields()
+        context['with_my_state'] = self.get_my_state_user() is not None
+        return context
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, cache.list_key(request, self.get_my_state_user_id()),
+            lambda: conditional.list_validators(request, self.filter_queryset(self.get_queryset())),
+            lambda: self.fast_list(request) if settings.STORE_FAST_BOOK_LIST or settings.STORE_BOOK_SUMMARY
+            else super(BookViewSet, self).list(request, *args, **kwargs))
+
+    def fast_list(self, request):
+        serializer = BookValuesSerializer(context=self.get_serializer_context())
+        queryset = self.filter_queryset(self.get_queryset())
+        # The paginator reads the ordering columns back from each row to build its cursors.
+        ordering = {*self.ordering_fields, *({'search_rank'} & set(queryset.query.annotations))}
+        queryset = serializer.values(queryset, *ordering)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.to_representation(page))
+        return Response(serializer.to_representation(list(queryset)))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_field]
+        return self.conditional_response(
+            request, cache.detail_key(request, pk, self.get_my_state_user_id()),
+            lambda: conditional.detail_validators(request, pk),
+            lambda: super(BookViewSet, self).retrieve(request, *args, **kwargs))
+
+    def get_my_state_user_id(self):
+        user = self.get_my_state_user()
+        return None if user is None else user.id
+
+    def conditional_response(self, request, key, get_validators, get_response):
+        user_id = self.get_my_state_user_id()
+        cached = cache.get(key)
+        if cached is None:
+            etag, last_modified = get_validators()
+            if user_id is not None:
+                # The caller's relations change without touching the books' versions or updated_at.
+                etag = etag and conditional.make_etag(request, etag, user_id, cache.library_version(user_id))
+                last_modified = None
+        else:
+            etag, last_modified, data = cached
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            if cached is None:
+                response = get_response()
+                cache.set(key, (etag, last_modified, response.data))
+            else:
+                response = Response(data)
+
+        if etag is not None:
+            response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        if user_id is not None:
+            patch_vary_headers(response, ('Authorization', 'Cookie'))
+        return response
 
     def perform_create(self, serializer):
         serializer.validated_data['owner'] = self.request.user
         serializer.save()
 
+    def perform_update(self, serializer):
+        book = serializer.save()
+        if book.owner_id == self.request.user.id:
+            Book.owner.field.set_cached_value(book, self.request.user)
+        book.owner_name = book.owner.username if book.owner_id is not None else None
+        book.annotated_likes = book.likes_count
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[IsAuthenticated],
+            parser_classes=[MultiPartParser])
+    def import_books(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': ['No file was submitted.']})
+        fmt = request.query_params.get('input') or transfer.guess_format(upload.name)
+        if fmt not in transfer.FORMATS:
+            raise ValidationError({'input': [f'Expected one of {", ".join(transfer.FORMATS)}.']})
+
+        lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            result = transfer.import_books(transfer.read_rows(lines, fmt), owner=request.user)
+        except (UnicodeDecodeError, csv.Error) as exc:
+            raise ValidationError({'file': [f'Could not read the file: {exc}']})
+        return Response(result)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request, *args, **kwargs):
+        fmt = request.query_params.get('output', transfer.CSV)
+        if fmt not in transfer.FORMATS:
+            raise ValidationError({'output': [f'Expected one of {", ".join(transfer.FORMATS)}.']})
+
+        queryset = self.filter_queryset(Book.objects.order_by('id'))
+        # The rows are streamed after dispatch has returned, so pin the database picked for this request.
+        queryset = queryset.using(queryset.db)
+        response = StreamingHttpResponse(transfer.export_rows(queryset, fmt), content_type=transfer.CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="books.{fmt}"'
+        return response
+
 
 class UserBooksRelationView(UpdateModelMixin, GenericViewSet):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [RelationWriteThrottle]
     queryset = UserBookRelation.objects.all()
     serializer_class = UserBookRelationSerializer
     lookup_field = 'book'
+    bulk_max_items = 1000
+
+    def update(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, partial=kwargs.pop('partial', False))
+        serializer.is_valid(raise_exception=True)
+        values = {name: value for name, value in serializer.validated_data.items() if name in RELATION_VALUES}
+        if settings.STORE_RELATION_WRITE_MODE == 'coalesced':
+            return self.enqueue(request, values)
+        try:
+            relation, _ = upsert_relation(request.user.id, int(self.kwargs['book']), values)
+        except (ValueError, Book.DoesNotExist, IntegrityError):
+            raise NotFound()
+        return Response(self.get_serializer(relation).data)
+
+    def enqueue(self, request, values):
+        try:
+            book_id = int(self.kwargs['book'])
+            queued = enqueue_relation_write(request.user.id, book_id, values)
+        except (ValueError, Book.DoesNotExist):
+            raise NotFound()
+        # Answer with the relation as it will be once the queue is applied.
+        relation = UserBookRelation.objects.filter(user=request.user, book_id=book_id).first() \
+            or UserBookRelation(user=request.user, book_id=book_id)
+        for name, value in queued.items():
+            setattr(relation, name, value)
+        return Response(self.get_serializer(relation).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        if len(request.data) > self.bulk_max_items:
+            raise ValidationError({'non_field_errors': [f'At most {self.bulk_max_items} items are allowed.']})
+
+        book_ids = set()
+        for item in request.data:
+            if isinstance(item, dict) and str(item.get('book', '')).isdigit():
+                book_ids.add(int(item['book']))
+        books = Book.objects.only('id').in_bulk(book_ids)
+
+        serializer = self.get_serializer(data=request.data, many=True, context={**self.get_serializer_context(),
+                                                                               'books': books})
+        serializer.is_valid(raise_exception=True)
+        items = [{'book_id': item['book'].id,
+                  **{name: value for name, value in item.items() if name in RELATION_VALUES}}
+                 for item in serializer.validated_data]
+        statuses = bulk_upsert_relations(request.user.id, items)
+        return Response([{'book': item['book_id'], 'status': statuses[item['book_id']]} for item in items])
+
+
+class LibraryView(APIView):
+    """
+    The ids of the books the caller liked, bookmarked and rated. `?encoding=delta` sends each id list
+    as the gaps between consecutive ids. The lists are cached until the caller's relations change.
+    """
+    permission_classes = [IsAuthenticated]
+    encodings = ('ids', 'delta')
+
+    def get(self, request, *args, **kwargs):
+        encoding = request.query_params.get('encoding', 'ids')
+        if encoding not in self.encodings:
+            raise ValidationError({'encoding': [f'Expected one of {", ".join(self.encodings)}.']})
+
+        user_id = request.user.id
+        version = cache.library_version(user_id)
+        etag = conditional.make_etag(request, user_id, version)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            key = cache.library_key(user_id)
+            library = cache.get(key)
+            if library is None:
+                library = user_library(user_id)
+                cache.set(key, library)
+            if encoding == 'delta':
+                library = {**library, **{name: delta_encode(library[name])
+                                         for name in ('liked', 'bookmarked', 'rated')}}
+            response = Response({'version': version, 'encoding': encoding, **library})
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Authorization', 'Cookie'))
+        return response
+
+
+class LeaderboardView(APIView):
+    """The most liked or best rated books, overall or by one `?author=`, `?limit=` of them."""
+
+    def get(self, request, kind, *args, **kwargs):
+        if kind not in leaderboards.KINDS:
+            raise NotFound()
+        limit = request.query_params.get('limit', '10')
+        if not limit.isdigit() or not 1 <= int(limit) <= settings.STORE_LEADERBOARD_SIZE:
+            raise ValidationError({'limit': [f'Expected a number from 1 to {settings.STORE_LEADERBOARD_SIZE}.']})
+
+        rows = leaderboards.top(kind, request.query_params.get('author', leaderboards.GLOBAL), int(limit))
+        for row in rows:
+            if row['rating'] is not None:
+                row['rating'] = f'{row["rating"]:.2f}'
+        return Response(rows)
+
+
+class AuthorListView(ListAPIView):
+    """
+    The book count, average price, total likes and vote-weighted average rating of every author, read from
+    store.AuthorStats while STORE_AUTHOR_STATS is on and grouped from the books otherwise.
+    """
+    serializer_class = AuthorStatsSerializer
+    filter_backends = [DjangoFilterBackend, SearchFilter, AuthorOrderingFilter]
+    filterset_class = AuthorStatsFilter
+    search_fields = ['author_name']
+    ordering_fields = ['author_name', 'books_count', 'average_price', 'total_likes', 'average_rating']
+    ordering = ['author_name']
+    pagination_class = AuthorKeysetPagination
+
+    def dispatch(self, request, *args, **kwargs):
+        with db.read_from_replica(request.method in SAFE_METHODS):
+            return super().dispatch(request, *args, **kwargs)
 
-    def get_object(self):
-        obj, _ = UserBookRelation.objects.get_or_create(user=self.request.user, book_id=self.kwargs['book'])
-        return obj
+    def get_queryset(self):
+        return authors.stats()
 
 
 def auth(request):